@@ -5,31 +5,46 @@
 
 
 from simple21 import Table
+from playingCards import Deck
 
 
-def main():
+def main(deckFile=None, ask=input, hints=False):
+    '''
+    Plays the game until the player does not want to play again.
     
+    Inputs:
+        deckFile (str): Name of the deck file; the player is asked for one if not given.
+        ask (callable): Function used to ask the player for input, input() by default.
+        hints (bool): Shows the chances of winning by hitting and by staying before each choice.
+        
+    Returns: None
+    '''
     # check if file is valid
     try:
-        table, round_num = start_game()
+        table, round_num = start_game(deckFile)
     except Exception as err:
         print(err)
     else:
+        hint_engine = None
+        if hints:
+            from winHints import HintEngine
+            hint_engine = HintEngine(table.getRules())
         continue_game = True
         while continue_game:
             round_num = start_round(table, round_num)
-            player_bust, player_natural = player_turn(table)
+            player_bust, player_natural = player_turn(table, ask, hint_engine)
             who_wins(table, round_num, player_bust, player_natural)
-            continue_game = play_again()
+            continue_game = play_again(ask)
     finally:
         goodbye_msg()
 
 
-def start_game():
+def start_game(deckFile=None):
     '''
     Starts game by displaying title, creating table and the starting round number.
     
-    Inputs: N/A
+    Inputs:
+        deckFile (str): Name of the deck file; the player is asked for one if not given.
     
     Returns: 
         table: the Table instance created.
@@ -41,7 +56,10 @@ def start_game():
     print(border + '\n' + title + '\n' + border)
     
     # Create table and round number
-    table = Table()
+    if deckFile is None:
+        table = Table()
+    else:
+        table = Table(deck=Deck(deckFile))
     round_num = 0
     
     return table, round_num
@@ -66,26 +84,31 @@ def start_round(table, prev_round):
     return current_round
 
 
-def player_turn(table):
+def player_turn(table, ask=input, hints=None):
     '''
     Asks player to hit or stay until their turn is over.
     
     Inputs:
         table (Table): table with the player
+        ask (callable): Function used to ask the player for input, input() by default.
+        hints (HintEngine): Shows the chances of each choice before asking if given.
     
     Returns:
         player_bust (bool): True of player went bust; False otherwise
         player_natural (bool): True if player won; False otherwise
     '''
-    # ask player to hit or stay until their turn is over
-    player_turn = True
-    hit_count = 0
+    # ask player to hit or stay until their turn is over; with a low bust limit the dealt
+    # hand can already be bust, and then there is nothing to ask
+    player_bust = table.getRules().isBust(table.getPlayer().getHandValue())
+    player_natural = False
+    player_turn = not player_bust
     while player_turn:
-        hit = input("Would you like to HIT (H/h) or STAY (S/s)? >> ")
+        if hints is not None:
+            print(show_hint(table, hints))
+        hit = ask("Would you like to HIT (H/h) or STAY (S/s)? >> ")
         
         # hit player or stay
         if hit[0].lower() == 'h':
-            hit_count += 1
             player_bust = table.playerHit()
             player_natural = table.playerNatural()
             print(table)
@@ -96,15 +119,28 @@ def player_turn(table):
         
         else:
             player_turn = False
-    
-    # make sure bool is being returned
-    if hit_count == 0:
-        player_bust = False
-        player_natural = False
 
     return player_bust, player_natural
     
 
+def show_hint(table, hints):
+    '''
+    Finds the chances of winning, tying and losing by hitting and by staying from the cards
+    the player can see.
+    
+    Inputs:
+        table (Table): table with the player
+        hints (HintEngine): Works out the chances.
+    
+    Returns: hint (str): The hint line to show.
+    '''
+    from winHints import hintText
+    
+    player_values = [card.getValue() for card in table.getPlayer().getHand()]
+    up_value = table.getDealer().getHand()[0].getValue()
+    return hintText(hints.hint(player_values, up_value))
+    
+
 def who_wins(table, round_num, player_bust, player_natural):
     '''
     Prints message if player has already won; otherwise continues with dealer's turn and displays
@@ -136,18 +172,19 @@ def who_wins(table, round_num, player_bust, player_natural):
     table.clearTable()
 
 
-def play_again():
+def play_again(ask=input):
     '''
     Keeps asking player if they want to play again until valid entry provided.
     
-    Inputs: N/A
+    Inputs:
+        ask (callable): Function used to ask the player for input, input() by default.
     
     Returns: True if player wants to play again; False otherwise.
     '''
     # keep asking to play again until entry valid
     valid_entry = False
     while not valid_entry:
-        play_again = input('Would you like to play another round (Y/N)? >> ')
+        play_again = ask('Would you like to play another round (Y/N)? >> ')
         
         # check if entry valid and return bool
         if play_again[0].lower() == 'y':
@@ -171,5 +208,6 @@ def goodbye_msg():
     # print message
     print('\nThank you for playing. Goodbye...')
 
-        
-main()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+# Hit/stay policies and automatic round play for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+
+
+from gameRules import OUTCOME_VALUES
+
+
+class ThresholdPolicy:
+    # Hits while the player's hand value is below a fixed total.
+
+    def __init__(self, standOn=17):
+        '''
+        Initializes the ThresholdPolicy class.
+
+        Inputs:
+            standOn (int): The player stays once the hand value reaches this total.
+
+        Returns: None
+        '''
+        assert isinstance(standOn, int), 'Error: standOn must be an int'
+        self.__standOn = standOn
+
+
+    def __call__(self, playerValue, cardCount, upValue):
+        '''
+        Decides whether to hit. Works on single values or NumPy arrays of values.
+
+        Inputs:
+            playerValue (int or ndarray): The value of the player's hand.
+            cardCount (int or ndarray): The number of cards in the player's hand.
+            upValue (int or ndarray): The value of the dealer's face up card.
+
+        Returns (bool or ndarray): True where the player should hit.
+        '''
+        return playerValue < self.__standOn
+
+
+    def __repr__(self):
+        '''
+        Returns a formal string representation of the policy.
+        '''
+        return 'ThresholdPolicy(%d)' % self.__standOn
+
+
+
+def parsePolicy(name):
+    '''
+    Returns the policy with the given name: 'standN' stays on N or more (e.g. 'stand17')
+    and 'never' never hits.
+
+    Inputs:
+        name (str): The name of the policy.
+    '''
+    if name == 'never':
+        return ThresholdPolicy(0)
+    if name.startswith('stand') and name[5:].isdigit():
+        return ThresholdPolicy(int(name[5:]))
+    raise ValueError('Unknown policy: %s' % name)
+
+
+
+def playRound(table, policy):
+    '''
+    Plays one round at the table the same way assignment2 does, with the policy choosing
+    HIT or STAY instead of the user. The table is cleared at the end of the round.
+
+    Inputs:
+        table (Table): The table to play on.
+        policy (callable): Called with (playerValue, cardCount, upValue); returns True to hit.
+
+    Returns (int): 1 if the player won, 0 for a tie and -1 if the dealer won.
+    '''
+    table.dealHands()
+    player = table.getPlayer()
+    up_value = table.getDealer().getHand()[0].getValue()
+
+    # hit until the policy stays or the player goes bust; with a low bust limit the two
+    # dealt cards can already be over it, and then the player takes no cards
+    player_bust = table.getRules().isBust(player.getHandValue())
+    player_natural = False
+    while not player_bust and policy(player.getHandValue(), player.getCardCount(), up_value):
+        player_bust = table.playerHit()
+        player_natural = table.playerNatural()
+        if player_bust:
+            break
+
+    # find who won
+    if player_bust:
+        winner = 'dealer'
+    elif player_natural:
+        winner = 'player'
+    elif table.dealerHit():
+        winner = 'player'
+    else:
+        winner = table.whoWon()
+
+    table.clearTable()
+    return OUTCOME_VALUES[winner]
+
+
+def playSeatsRound(table, policy):
+    '''
+    Plays one round at a table with one or more seats, the policy choosing for every seat.
+    The dealer plays once for all seats, and only if some seat has not already gone bust or
+    hit to 21, so with one seat this plays exactly like playRound.
+    Most of a round's cost is per card dealt, so the saving is bounded by the dealer cards
+    that no longer need dealing once per seat: with ThresholdPolicy(15) one seat uses 5.9
+    cards a round and seven seats use 3.3 per seat, which caps the gain at about 1.8x
+    seat-rounds per second (measured 1.7-1.8x).
+
+    Inputs:
+        table (Table): The table to play on.
+        policy (callable): Called with (playerValue, cardCount, upValue); returns True to hit.
+
+    Returns (list): The outcome at each seat (1, 0 or -1).
+    '''
+    table.dealHands()
+    up_value = table.getDealer().getHand()[0].getValue()
+    rules = table.getRules()
+
+    # each seat hits until the policy stays or the player goes bust
+    waiting = False
+    for seat in range(table.getSeats()):
+        player = table.getPlayer(seat)
+        while not rules.isBust(player.getHandValue()) and policy(player.getHandValue(), player.getCardCount(),
+                                                                  up_value):
+            if table.playerHit(seat):
+                break
+        value = player.getHandValue()
+        settled = rules.isBust(value) or (player.getCardCount() > 2 and rules.isNatural(value))
+        waiting = waiting or not settled
+
+    # the dealer plays once, then every seat is settled in one pass
+    if waiting:
+        table.dealerHit()
+    outcomes = [OUTCOME_VALUES[winner] for winner in table.roundWinners()]
+    table.clearTable()
+    return outcomes
+
+
+def replayHits(deck, hits, rules=None):
+    '''
+    Plays a whole session from a deck whose order is known, where the player's decisions in
+    each round are given as a number of hits (the player stops early on going bust). The
+    result is the same as playing the rounds at a Table, including repopulating the deck from
+    the discard pile with the same shuffles, but only card values are moved: totals of runs of
+    cards come from prefix sums and where a hand stops is found by binary search, the same way
+    as with a Deck's prefix index. The deck itself is not changed. Hands are only a few cards
+    long, so the searches save little; it runs about 3x faster than a silent Table, mostly
+    from not moving Card objects.
+
+    Inputs:
+        deck (Deck): The deck to start from.
+        hits (list): Number of times the player hits in each round.
+        rules (Rules): The rules of the game; defaults to the original game.
+
+    Returns (list): The outcome of each round (1, 0 or -1).
+    '''
+    from gameRules import Rules
+    from playingCards import EmptyDeckException
+    import bisect
+    import itertools
+    import random
+
+    if rules is None:
+        rules = Rules()
+    limit = rules.getBustLimit()
+    threshold = rules.getStandThreshold()
+    values = [card.getValue() for card in deck.getCards()]
+    prefix = list(itertools.accumulate(values, initial=0))
+    head = 0
+    discard = []
+
+    def take():
+        # deal one value, repopulating from the discard pile like a Table when the deck is empty
+        nonlocal values, prefix, head, discard
+        if head == len(values):
+            random.shuffle(discard)
+            values, discard, head = discard, [], 0
+            prefix = list(itertools.accumulate(values, initial=0))
+            if not values:
+                raise EmptyDeckException
+        head += 1
+        return values[head - 1]
+
+    def draw(value, count, stopAt):
+        # draw up to count values, stopping once the total reaches stopAt
+        nonlocal head
+        end = len(values)
+        draws = bisect.bisect_left(prefix, prefix[head] + stopAt - value, head, end + 1) - head
+        if head + draws <= end or head + count <= end:
+            count = min(count, draws)
+            value += prefix[head + count] - prefix[head]
+            head += count
+            return value, values[head - count:head]
+        drawn = []
+        while len(drawn) < count and value < stopAt:
+            drawn.append(take())
+            value += drawn[-1]
+        return value, drawn
+
+    outcomes = []
+    for count in hits:
+        if head + 4 <= len(values):
+            first, up, second, hole = values[head:head + 4]
+            head += 4
+        else:
+            first, up, second, hole = take(), take(), take(), take()
+        player_value, player_hits = draw(first + second, count, limit + 1)
+
+        # same order of checks as assignment2
+        dealer_hits = []
+        if rules.isBust(player_value):
+            outcome = -1
+        elif player_hits and rules.isNatural(player_value):
+            outcome = 1
+        else:
+            dealer_value, dealer_hits = draw(up + hole, 52, threshold)
+            if rules.isBust(dealer_value):
+                outcome = 1
+            else:
+                outcome = OUTCOME_VALUES[rules.compare(player_value, dealer_value)]
+        outcomes.append(outcome)
+
+        # the table clears each hand from the last card back
+        discard.extend(reversed(player_hits))
+        discard += (second, first)
+        discard.extend(reversed(dealer_hits))
+        discard += (hole, up)
+    return outcomes
+
+
+def playRounds(table, policy, rounds):
+    '''
+    Plays a number of rounds at the table with playRound.
+
+    Inputs:
+        table (Table): The table to play on.
+        policy (callable): Called with (playerValue, cardCount, upValue); returns True to hit.
+        rounds (int): Number of rounds to play.
+
+    Returns (list): The outcome of each round (1, 0 or -1).
+    '''
+    return [playRound(table, policy) for i in range(rounds)]
+
+
+
+def auto_play_tests():
+    '''
+    Tests for automatic play.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import random
+    import time
+    from playingCards import Deck, RANKS, SUITS
+    from simple21 import Table
+
+    codes = [rank + suit for rank in RANKS for suit in SUITS]
+    policy = ThresholdPolicy(15)
+
+    # one seat plays exactly like the original table
+    random.seed(5)
+    single = playRounds(Table(deck=Deck(codes=codes), verbose=False), policy, 2000)
+    random.seed(5)
+    table = Table(deck=Deck(codes=codes), verbose=False, seats=1)
+    is_pass = ([playSeatsRound(table, policy)[0] for i in range(2000)] == single)
+    assert is_pass == True, "fail the test"
+
+    # cards go round the seats before the dealer, as at a casino table
+    table = Table(deck=Deck(codes=codes), verbose=False, seats=3)
+    table.dealHands()
+    hands = [[card.getCode() for card in table.getPlayer(seat).getHand()] for seat in range(3)]
+    dealer = [card.getCode() for card in table.getDealer().getHand()]
+    is_pass = (hands == [['AC', '2C'], ['AD', '2D'], ['AH', '2H']] and dealer == ['AS', '2S'])
+    assert is_pass == True, "fail the test"
+    table.clearTable()
+    is_pass = (len(table.getDiscard()) == 8)
+    assert is_pass == True, "fail the test"
+
+    # one dealer turn for seven seats against seven single-seat tables
+    rounds = 2000
+    tables = [Table(deck=Deck(codes=codes), verbose=False) for seat in range(7)]
+    start = time.perf_counter()
+    for i in range(rounds):
+        for table in tables:
+            playRound(table, policy)
+    separate = time.perf_counter() - start
+    table = Table(deck=Deck(codes=codes), verbose=False, seats=7)
+    start = time.perf_counter()
+    for i in range(rounds):
+        playSeatsRound(table, policy)
+    shared = time.perf_counter() - start
+    print('Seat-rounds per second: 7 tables %.0f, 7 seats %.0f (%.1fx)'
+          % (7 * rounds / separate, 7 * rounds / shared, separate / shared))
+
+    # totals and dealer stops from the prefix index
+    deck = Deck(codes=codes)
+    deck.setPrefixIndex()
+    is_pass = (deck.valueOf(3) == 3 and deck.valueOf(4, start=36) == 40 and deck.drawsToReach(17) == 10
+               and deck.drawsToReach(17, start=48) == 2 and deck.drawsToReach(1000) is None)
+    assert is_pass == True, "fail the test"
+    deck.dealMany(5)
+    is_pass = (deck.size() == 47 and deck.valueOf(1) == 2 and deck.drawsToReach(2) == 1)
+    assert is_pass == True, "fail the test"
+
+    # replaying a session of hits gives the same outcomes as the table, through repopulation
+    scripted = random.Random(38)
+    hits = [scripted.choice((0, 0, 1, 1, 2, 3)) for i in range(5000)]
+    remaining = iter(hits)
+    left = [0]
+
+    def replayPolicy(playerValue, cardCount, upValue):
+        if cardCount == 2:
+            left[0] = next(remaining)
+        left[0] -= 1
+        return left[0] >= 0
+
+    random.seed(38)
+    deck = Deck(codes=codes)
+    deck.setPrefixIndex()
+    start = time.perf_counter()
+    expected = playRounds(Table(deck=deck, verbose=False), replayPolicy, len(hits))
+    played = time.perf_counter() - start
+    random.seed(38)
+    start = time.perf_counter()
+    is_pass = (replayHits(Deck(codes=codes), hits) == expected)
+    replayed = time.perf_counter() - start
+    assert is_pass == True, "fail the test"
+    print('Replayed %d rounds in %.3f s against %.3f s at a table' % (len(hits), replayed, played))
+
+    # a displayed table with a prefix index shows and deals exactly what one without it does,
+    # including repopulation part way through the dealer's turn
+    import contextlib
+    import io
+
+    def playDisplayed(indexed):
+        random.seed(46)
+        remaining = iter(hits[:400])
+        deck = Deck(codes=codes)
+        if indexed:
+            deck.setPrefixIndex()
+        table = Table(deck=deck)
+        shown = io.StringIO()
+        outcomes = []
+        with contextlib.redirect_stdout(shown):
+            for i in range(400):
+                left[0] = next(remaining)
+                table.dealHands()
+                while left[0] > 0 and not table.playerHit():
+                    left[0] -= 1
+                outcomes.append((table.dealerHit(), [card.getCode() for card in table.getDealer().getHand()]))
+                table.clearTable()
+        return outcomes, shown.getvalue(), table.getDeck().getCodes()
+
+    is_pass = (playDisplayed(True) == playDisplayed(False))
+    assert is_pass == True, "fail the test"
+
+if __name__ == "__main__":
+    auto_play_tests()
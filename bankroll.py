@@ -0,0 +1,469 @@
+# Betting and bankroll simulation for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+#
+# Wagering is a layer on top of round outcomes: a win pays the bet, a tie returns it and a loss
+# takes it. A betting strategy is called with the bankroll and the running count of every
+# session before a round and returns the bets, so a whole batch of sessions moves forward one
+# round per NumPy step instead of one Python loop per session.
+
+
+from collections import namedtuple
+from gameRules import Rules
+from tableBatch import TableBatch, randomOrders
+import numpy as np
+
+
+# single level tags from the full deck effects of removal (removalEffects.countTags) in the
+# original game; other rules get their own from countTagsFor
+COUNT_TAGS = {'A': 0, '2': 0, '3': 1, '4': 1, '5': 1, '6': 1, '7': 0, '8': 0, '9': 0,
+              'T': -1, 'J': -1, 'Q': -1, 'K': -1}
+
+# tags worked out for other rules, by Rules
+_derivedTags = {}
+
+BankrollResult = namedtuple('BankrollResult', 'final ruinRound maxDrawdown checkpoints curve')
+
+
+class FlatBet:
+    # Bets the same amount every round.
+
+    def __init__(self, units=1.0):
+        '''
+        Initializes the FlatBet class.
+
+        Inputs:
+            units (float): The bet.
+
+        Returns: None
+        '''
+        assert units > 0, 'Error: units must be positive'
+        self.__units = units
+
+
+    def __call__(self, bankroll, counts):
+        '''
+        Returns the bet of every session.
+
+        Inputs:
+            bankroll (ndarray): Bankroll of each session.
+            counts (ndarray): Running count of each session before the round.
+
+        Returns (ndarray): The bets.
+        '''
+        return np.full(len(bankroll), float(self.__units))
+
+
+    def __repr__(self):
+        '''
+        Returns a formal string representation of the betting strategy.
+        '''
+        return 'FlatBet(%g)' % self.__units
+
+
+
+class CountSpread:
+    # Bets more when the running count is higher, one bet for each count bucket.
+
+    def __init__(self, edges, units):
+        '''
+        Initializes the CountSpread class.
+
+        Inputs:
+            edges (sequence): Running counts where each count bucket after the first starts.
+            units (sequence): Bet in each count bucket, one more than the edges.
+
+        Returns: None
+        '''
+        assert len(units) == len(edges) + 1, 'Error: need one bet for each count bucket'
+        assert min(units) >= 0, 'Error: bets cannot be negative'
+        self.__edges = np.array(edges)
+        self.__units = np.array(units, dtype=float)
+
+
+    def __call__(self, bankroll, counts):
+        '''
+        Returns the bet of every session.
+
+        Inputs:
+            bankroll (ndarray): Bankroll of each session.
+            counts (ndarray): Running count of each session before the round.
+
+        Returns (ndarray): The bets.
+        '''
+        return self.__units[np.searchsorted(self.__edges, counts, side='right')]
+
+
+    def __repr__(self):
+        '''
+        Returns a formal string representation of the betting strategy.
+        '''
+        return 'CountSpread(%s, %s)' % (list(self.__edges), list(self.__units))
+
+
+
+class KellyBet:
+    # Bets a fraction of the Kelly bet for the player's advantage at the running count.
+
+    def __init__(self, fraction, edges, advantages, variance=1.0, minimum=0.0):
+        '''
+        Initializes the KellyBet class.
+
+        Inputs:
+            fraction (float): Share of the full Kelly bet, e.g. 0.5 for half Kelly.
+            edges (sequence): Running counts where each count bucket after the first starts.
+            advantages (sequence): Player's expected outcome per unit bet in each count bucket.
+            variance (float): Variance of the outcome per unit bet.
+            minimum (float): Bet placed where the player has no advantage.
+
+        Returns: None
+        '''
+        assert len(advantages) == len(edges) + 1, 'Error: need one advantage for each count bucket'
+        assert fraction > 0 and variance > 0, 'Error: fraction and variance must be positive'
+        self.__fraction = fraction
+        self.__edges = np.array(edges)
+        self.__advantages = np.array(advantages, dtype=float)
+        self.__variance = variance
+        self.__minimum = minimum
+
+
+    def __call__(self, bankroll, counts):
+        '''
+        Returns the bet of every session.
+
+        Inputs:
+            bankroll (ndarray): Bankroll of each session.
+            counts (ndarray): Running count of each session before the round.
+
+        Returns (ndarray): The bets.
+        '''
+        advantage = self.__advantages[np.searchsorted(self.__edges, counts, side='right')]
+        bets = self.__fraction * bankroll * advantage / self.__variance
+        return np.where(advantage > 0, bets, self.__minimum)
+
+
+    def __repr__(self):
+        '''
+        Returns a formal string representation of the betting strategy.
+        '''
+        return 'KellyBet(%g, %d count buckets)' % (self.__fraction, len(self.__advantages))
+
+
+
+def countTagsFor(rules=None):
+    '''
+    Returns single level count tags for the rules: COUNT_TAGS for the original game, and for
+    other rules tags from their own full deck effects of removal. Working those out takes a
+    few seconds, so they are kept for the next call.
+
+    Inputs:
+        rules (Rules): The rules of the game; defaults to the original game.
+
+    Returns (dict): Integer tag for each rank 'A' to 'K'.
+    '''
+    if rules is None or rules == Rules():
+        return COUNT_TAGS
+    if rules not in _derivedTags:
+        from removalEffects import CompositionEV, countTags
+        _derivedTags[rules] = countTags(CompositionEV(rules).removalEffects())
+    return _derivedTags[rules]
+
+
+def playOutcomes(sessions, rounds, policy, rules=None, tags='rules', seed=None):
+    '''
+    Plays sessions at the tables of a TableBatch, one persistent deck per session.
+
+    Inputs:
+        sessions (int): Number of sessions.
+        rounds (int): Rounds in each session.
+        policy (callable): Vectorized hit/stay policy.
+        rules (Rules): The rules of the game; defaults to the original game.
+        tags (dict): Count tags for the running counts; 'rules' for countTagsFor(rules), None
+            for no count.
+        seed (int or sequence): Seed for the decks and shuffles.
+
+    Returns (tuple): (outcomes, counts) arrays of shape (rounds, sessions): the outcome of each
+        round and the running count before it.
+    '''
+    if tags == 'rules':
+        tags = countTagsFor(rules)
+    rng = np.random.default_rng(seed)
+    batch = TableBatch(randomOrders(sessions, rng), rules, int(rng.integers(2 ** 63)))
+    if tags is not None:
+        batch.setCountTags(tags)
+    outcomes = np.empty((rounds, sessions), dtype=np.int8)
+    counts = np.empty((rounds, sessions), dtype=np.int16)
+    for i in range(rounds):
+        counts[i] = batch.getRunningCounts()
+        outcomes[i] = batch.playRound(policy)
+    return outcomes, counts
+
+
+def resampleSessions(outcomes, counts, sessions, block, rng):
+    '''
+    Builds new sessions from played ones with a block bootstrap: each new session is made of
+    runs of block consecutive rounds, each run taken from a random played session at a random
+    round. Every outcome keeps the running count it was played at, and counts stay lined up
+    within a run the way one deck moves through its cards.
+
+    Inputs:
+        outcomes (ndarray): A (rounds, played sessions) array of outcomes.
+        counts (ndarray): A (rounds, played sessions) array of running counts before each round.
+        sessions (int): Number of sessions to build.
+        block (int): Rounds in each run; no more than the rounds played.
+        rng (Generator): NumPy random generator.
+
+    Returns (tuple): (outcomes, counts) arrays of shape (rounds, sessions).
+    '''
+    rounds, played = outcomes.shape
+    assert 0 < block <= rounds, 'Error: block must be between 1 and the number of rounds'
+    runs = -(-rounds // block)
+    sources = rng.integers(played, size=(runs, 1, sessions), dtype=np.int32)
+    starts = rng.integers(rounds - block + 1, size=(runs, 1, sessions), dtype=np.int32)
+    rows = (starts + np.arange(block, dtype=np.int32)[None, :, None]).reshape(runs * block, sessions)[:rounds]
+    columns = np.broadcast_to(sources, (runs, block, sessions)).reshape(runs * block, sessions)[:rounds]
+    return outcomes[rows, columns], counts[rows, columns]
+
+
+def countAdvantages(outcomes, counts, edges):
+    '''
+    Returns the mean outcome per unit bet in each count bucket, for KellyBet.
+
+    Inputs:
+        outcomes (ndarray): Outcomes of rounds.
+        counts (ndarray): Running count before each round.
+        edges (sequence): Running counts where each count bucket after the first starts.
+
+    Returns (tuple): (mean outcome of each bucket, variance of the outcome over all rounds).
+    '''
+    buckets = np.searchsorted(np.array(edges), counts.ravel(), side='right')
+    values = outcomes.ravel().astype(float)
+    rounds = np.bincount(buckets, minlength=len(edges) + 1)
+    totals = np.bincount(buckets, weights=values, minlength=len(edges) + 1)
+    return totals / np.maximum(rounds, 1), float(values.var())
+
+
+def evolve(outcomes, counts, betting, bankroll=100.0, minBet=1.0, every=1):
+    '''
+    Moves bankrolls forward through rounds of outcomes, all sessions at once. A session is
+    ruined once its bankroll is below minBet and stops betting; bets are raised to minBet
+    and cut to the bankroll.
+
+    Inputs:
+        outcomes (ndarray): A (rounds, sessions) array of outcomes (1, 0 or -1).
+        counts (ndarray): A (rounds, sessions) array of running counts before each round.
+        betting (callable): Called with (bankroll, counts) arrays; returns the bets.
+        bankroll (float): Starting bankroll of every session.
+        minBet (float): Smallest bet allowed.
+        every (int): Rounds between the points of the bankroll curve.
+
+    Returns (BankrollResult): Final bankrolls, the round each session was ruined in (-1 if
+        never), the largest drop from a peak, and the bankrolls at every checkpoint.
+    '''
+    rounds, sessions = outcomes.shape
+    money = np.full(sessions, float(bankroll))
+    peak = money.copy()
+    drawdown = np.zeros(sessions)
+    ruin_round = np.full(sessions, -1, dtype=np.int64)
+    checkpoints = list(range(0, rounds + 1, every))
+    if checkpoints[-1] != rounds:
+        checkpoints.append(rounds)
+    curve = np.empty((len(checkpoints), sessions), dtype=np.float32)
+    curve[0] = money
+    point = 1
+
+    for i in range(rounds):
+        alive = ruin_round < 0
+        bets = np.asarray(betting(money, counts[i]), dtype=float)
+        bets = np.where(bets > 0, np.maximum(bets, minBet), 0.0)
+        bets = np.where(alive, np.minimum(bets, money), 0.0)
+        money += bets * outcomes[i]
+        np.maximum(peak, money, out=peak)
+        np.maximum(drawdown, peak - money, out=drawdown)
+        ruin_round[alive & (money < minBet)] = i + 1
+        if checkpoints[point] == i + 1:
+            curve[point] = money
+            point += 1
+    return BankrollResult(money, ruin_round, drawdown, np.array(checkpoints), curve)
+
+
+def mergeResults(results):
+    '''
+    Joins the results of several groups of sessions played over the same rounds.
+
+    Inputs:
+        results (list): BankrollResult of each group.
+
+    Returns (BankrollResult): The sessions of every group.
+    '''
+    return BankrollResult(np.concatenate([result.final for result in results]),
+                          np.concatenate([result.ruinRound for result in results]),
+                          np.concatenate([result.maxDrawdown for result in results]),
+                          results[0].checkpoints,
+                          np.concatenate([result.curve for result in results], axis=1))
+
+
+def simulateBankrolls(sessions, rounds, betting, bankroll=100.0, policy=None, rules=None, tags='rules',
+                      minBet=1.0, points=20, seed=0, chunk=200000, pool=None, block=10):
+    '''
+    Plays sessions with a TableBatch and moves their bankrolls forward, a chunk of sessions
+    at a time so memory stays bounded. With a pool, only that many sessions are played and
+    the rest are built from them with resampleSessions, which is much faster when playing
+    the rounds is what takes the time.
+
+    Inputs:
+        sessions (int): Number of sessions.
+        rounds (int): Rounds in each session.
+        betting (callable): Betting strategy.
+        bankroll (float): Starting bankroll of every session.
+        policy (callable): Vectorized hit/stay policy; stands on 17 if not given.
+        rules (Rules): The rules of the game; defaults to the original game.
+        tags (dict): Count tags for the running counts; 'rules' for countTagsFor(rules), None
+            for no count.
+        minBet (float): Smallest bet allowed.
+        points (int): Number of points on the bankroll curve after the start.
+        seed (int): Seed; chunk i plays with seed (seed, i).
+        chunk (int): Most sessions played at once.
+        pool (int): Number of sessions to play and resample from; every session is played
+            if not given.
+        block (int): Rounds in each resampled run.
+
+    Returns (BankrollResult): The merged result.
+    '''
+    if policy is None:
+        from autoPlay import ThresholdPolicy
+        policy = ThresholdPolicy(17)
+    if rules is None:
+        rules = Rules()
+    every = max(1, rounds // points)
+    if pool is not None:
+        played = playOutcomes(pool, rounds, policy, rules, tags, [seed, 0, 1])
+        rng = np.random.default_rng([seed, 0, 2])
+    results = []
+    for index, first in enumerate(range(0, sessions, chunk)):
+        size = min(chunk, sessions - first)
+        if pool is None:
+            outcomes, counts = playOutcomes(size, rounds, policy, rules, tags, [seed, index])
+        else:
+            outcomes, counts = resampleSessions(*played, size, min(block, rounds), rng)
+        results.append(evolve(outcomes, counts, betting, bankroll, minBet, every))
+    return mergeResults(results)
+
+
+def bankrollReport(result, bankroll, percentiles=(5, 25, 50, 75, 95)):
+    '''
+    Returns a report of a bankroll simulation: ruin rate, final bankrolls, drawdowns and the
+    percentile curves of the bankroll over the rounds.
+
+    Inputs:
+        result (BankrollResult): The simulation.
+        bankroll (float): Starting bankroll.
+        percentiles (tuple): Percentiles to show.
+
+    Returns (str): The report.
+    '''
+    sessions = len(result.final)
+    ruined = result.ruinRound >= 0
+    lines = ['Sessions: %d, ruined: %d (%.2f%%)' % (sessions, ruined.sum(), 100 * ruined.mean())]
+    if ruined.any():
+        lines.append('Rounds to ruin: median %.0f' % np.median(result.ruinRound[ruined]))
+    lines.append('Final bankroll: mean %.2f, median %.2f (start %.2f)'
+                 % (result.final.mean(), np.median(result.final), bankroll))
+    lines.append('Largest drawdown: median %.2f, 95th percentile %.2f'
+                 % (np.median(result.maxDrawdown), np.percentile(result.maxDrawdown, 95)))
+    lines.append('%8s' % 'round' + ''.join('%10s' % ('p%d' % percentile) for percentile in percentiles))
+    curves = np.percentile(result.curve, percentiles, axis=1).T
+    for point, values in zip(result.checkpoints, curves):
+        lines.append('%8d' % point + ''.join('%10.2f' % value for value in values))
+    return '\n'.join(lines)
+
+
+
+def bankroll_tests():
+    '''
+    Tests for the bankroll simulation.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import time
+    from autoPlay import ThresholdPolicy
+
+    policy = ThresholdPolicy(17)
+    outcomes, counts = playOutcomes(2000, 50, policy, seed=42)
+
+    # the running count before a round is the count the deck had after the last one
+    is_pass = ((counts[0] == 0).all() and (counts[1:] != 0).any() and set(np.unique(outcomes)) <= {-1, 0, 1})
+    assert is_pass == True, "fail the test"
+
+    # other rules count with tags from their own effects of removal, worked out once
+    from removalEffects import CompositionEV, countTags
+
+    rules = Rules(16, 'push', 21)
+    tags = countTagsFor(rules)
+    is_pass = (countTagsFor() is COUNT_TAGS and tags != COUNT_TAGS and countTagsFor(Rules(16, 'push', 21)) is tags
+               and tags == countTags(CompositionEV(rules).removalEffects()))
+    assert is_pass == True, "fail the test"
+    is_pass = (np.array_equal(playOutcomes(200, 20, policy, rules, seed=1)[1],
+                              playOutcomes(200, 20, policy, rules, tags, seed=1)[1]))
+    assert is_pass == True, "fail the test"
+
+    # vectorized sessions match a loop over each session
+    advantages, variance = countAdvantages(outcomes, counts, [0, 3])
+    strategies = [FlatBet(5), CountSpread([0, 3], [1, 4, 10]), KellyBet(0.5, [0, 3], advantages + 0.05, variance, 1)]
+    for betting in strategies:
+        result = evolve(outcomes, counts, betting, bankroll=40, minBet=1, every=10)
+        for session in range(0, 2000, 97):
+            money = 40.0
+            peak = 40.0
+            drawdown = 0.0
+            ruin = -1
+            for i in range(50):
+                bet = float(betting(np.array([money]), counts[i, session:session + 1])[0])
+                bet = max(bet, 1) if bet > 0 else 0.0
+                bet = min(bet, money) if ruin < 0 else 0.0
+                money += bet * outcomes[i, session]
+                peak = max(peak, money)
+                drawdown = max(drawdown, peak - money)
+                if ruin < 0 and money < 1:
+                    ruin = i + 1
+            is_pass = (abs(result.final[session] - money) < 1e-9 and result.ruinRound[session] == ruin
+                       and abs(result.maxDrawdown[session] - drawdown) < 1e-9)
+            assert is_pass == True, "fail the test"
+    is_pass = (result.curve.shape == (6, 2000) and list(result.checkpoints) == [0, 10, 20, 30, 40, 50])
+    assert is_pass == True, "fail the test"
+
+    # flat bets follow the sum of the outcomes until ruin
+    result = evolve(outcomes, counts, FlatBet(1), bankroll=1000)
+    is_pass = np.allclose(result.final, 1000 + outcomes.sum(axis=0))
+    assert is_pass == True, "fail the test"
+
+    # resampled runs come from the played sessions, counts and outcomes together
+    rng = np.random.default_rng(42)
+    resampled = resampleSessions(outcomes, counts, 500, 7, rng)
+    pairs = set(zip(outcomes.ravel().tolist(), counts.ravel().tolist()))
+    is_pass = (resampled[0].shape == (50, 500)
+               and set(zip(resampled[0].ravel().tolist(), resampled[1].ravel().tolist())) <= pairs)
+    assert is_pass == True, "fail the test"
+
+    # every session played against a million built from a pool of played sessions
+    spread = CountSpread([1, 3], [1, 2, 5])
+    start = time.perf_counter()
+    played = simulateBankrolls(200000, 100, spread, bankroll=50, seed=42)
+    played_time = time.perf_counter() - start
+    start = time.perf_counter()
+    result = simulateBankrolls(1000000, 100, spread, bankroll=50, seed=43, pool=50000)
+    elapsed = time.perf_counter() - start
+    played_ruin = (played.ruinRound >= 0).mean()
+    ruin = (result.ruinRound >= 0).mean()
+    is_pass = (abs(played_ruin - ruin) < 0.01 and abs(np.median(played.final) - np.median(result.final)) <= 2)
+    assert is_pass == True, "fail the test"
+    print(bankrollReport(result, 50))
+    print('%d played sessions x 100 rounds in %.1f s (ruin %.2f%%); %d resampled sessions in %.1f s (ruin %.2f%%)'
+          % (len(played.final), played_time, played_ruin * 100, len(result.final), elapsed, ruin * 100))
+
+
+if __name__ == "__main__":
+    bankroll_tests()
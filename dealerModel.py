@@ -0,0 +1,224 @@
+# Infinite-deck dealer model for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+
+
+from gameRules import Rules
+import numpy as np
+
+
+# probability of drawing each card value 1-10 from an infinite deck (Ace is always 1)
+CARD_VALUES = np.arange(1, 11)
+CARD_PROBS = np.array([1, 1, 1, 1, 1, 1, 1, 1, 1, 4]) / 13
+
+
+def stateCount(rules):
+    '''
+    Returns the number of hand total states used for the given rules.
+    States 0 to bustLimit are hand totals and the last state is bust.
+
+    Inputs:
+        rules (Rules): The rules of the game.
+    '''
+    return rules.getBustLimit() + 2
+
+
+def transitionStack(limits, thresholds, size):
+    '''
+    Builds the draw and hit transition matrices for many rule variants at once.
+
+    Inputs:
+        limits (ndarray): Bust limit of each variant.
+        thresholds (ndarray): Stand threshold of each variant; use 0 for the hole card draw,
+            which is taken no matter what the total is.
+        size (int): Number of states; the last state is bust.
+
+    Returns (ndarray): A (len(limits), size, size) array of transition matrices.
+    '''
+    limits = np.asarray(limits)[:, None, None]
+    thresholds = np.asarray(thresholds)[:, None, None]
+    totals = np.arange(size)[None, :, None]
+    bust = size - 1
+
+    # where each (variant, total, card) goes after drawing
+    destination = totals + CARD_VALUES[None, None, :]
+    destination = np.where(destination > limits, bust, destination)
+    drawing = (totals <= limits) & ((thresholds == 0) | (totals < thresholds))
+    destination = np.where(drawing, destination, totals)
+    destination = np.broadcast_to(destination, (len(limits), size, 10))
+
+    # add up the card probabilities going to each destination
+    matrix = np.zeros((len(limits), size, size))
+    variant, total, card = np.indices(destination.shape)
+    np.add.at(matrix, (variant, total, destination), CARD_PROBS[card])
+
+    return matrix
+
+
+def drawMatrix(rules, size=None):
+    '''
+    Returns the transition matrix for drawing one card no matter what the hand total is.
+
+    Inputs:
+        rules (Rules): The rules of the game.
+        size (int): Number of states; defaults to stateCount(rules). A bigger size pads the
+            matrix so that rules with different bust limits can be stacked together.
+
+    Returns (ndarray): A (size, size) matrix where row i is the distribution after drawing from total i.
+    '''
+    if size is None:
+        size = stateCount(rules)
+    assert size >= stateCount(rules), 'Error: size is too small for the bust limit'
+    return transitionStack([rules.getBustLimit()], [0], size)[0]
+
+
+def hitMatrix(rules, size=None):
+    '''
+    Returns the transition matrix for one step of dealer play: the dealer draws while the rules
+    say they must hit, otherwise the hand total stays where it is.
+
+    Inputs:
+        rules (Rules): The rules of the game.
+        size (int): Number of states; defaults to stateCount(rules).
+
+    Returns (ndarray): A (size, size) transition matrix.
+    '''
+    if size is None:
+        size = stateCount(rules)
+    assert size >= stateCount(rules), 'Error: size is too small for the bust limit'
+    return transitionStack([rules.getBustLimit()], [rules.getStandThreshold()], size)[0]
+
+
+def dealerFinalDistribution(rules=None):
+    '''
+    Finds the distribution of the dealer's final hand total for every upcard.
+    The hole card is always drawn, then the dealer hits until the rules say to stand.
+
+    Inputs:
+        rules (Rules): The rules of the game; defaults to the original game.
+
+    Returns (ndarray): A (10, stateCount(rules)) array. Row i is for upcard value i + 1,
+        column t is the chance of finishing on total t and the last column is the chance of going bust.
+    '''
+    if rules is None:
+        rules = Rules()
+    return sweepRules([rules])[0]
+
+
+def sweepRules(rulesList):
+    '''
+    Finds the dealer's final total distributions for many rule variants at once, using
+    stacked matrix products instead of simulating each one.
+
+    Inputs:
+        rulesList (list): List of Rules instances.
+
+    Returns (ndarray): A (len(rulesList), 10, size) array where size fits the largest bust limit.
+        The last column is always bust; columns past a variant's bust limit are 0.
+    '''
+    size = max(stateCount(rules) for rules in rulesList)
+
+    # each hit adds at least 1, so standThreshold hits always finish the dealer's turn
+    limits = np.array([rules.getBustLimit() for rules in rulesList])
+    thresholds = np.array([rules.getStandThreshold() for rules in rulesList])
+    draws = transitionStack(limits, np.zeros_like(thresholds), size)
+    hits = transitionStack(limits, thresholds, size)
+    play = np.linalg.matrix_power(hits, int(thresholds.max()))
+
+    # only the upcard rows of the hole card draw are needed
+    return draws[:, CARD_VALUES, :] @ play
+
+
+def standOutcomes(rules, distribution=None):
+    '''
+    Finds the chance of winning, tying and losing when the player stands on each total.
+    A player total equal to the bust limit is a natural and always wins. Ties are
+    resolved using the tie policy of the rules.
+
+    Inputs:
+        rules (Rules): The rules of the game.
+        distribution (ndarray): Dealer final totals from dealerFinalDistribution or one entry of
+            sweepRules; computed from rules if not given.
+
+    Returns (tuple): (win, tie, lose) arrays of shape (10, bustLimit + 1), indexed by
+        [upcard value - 1, player total].
+    '''
+    if distribution is None:
+        distribution = dealerFinalDistribution(rules)
+    limit = rules.getBustLimit()
+    totals = distribution[:, :limit + 1]
+    bust = distribution[:, -1:]
+
+    # chance of the dealer finishing below, on or above each player total
+    below = np.cumsum(totals, axis=1) - totals
+    equal = totals
+    above = totals.sum(axis=1, keepdims=True) - below - equal
+
+    win = bust + below
+    lose = above.copy()
+    tie = equal.copy()
+    if rules.getTiePolicy() == 'player':
+        win = win + tie
+        tie = np.zeros_like(tie)
+    elif rules.getTiePolicy() == 'dealer':
+        lose = lose + tie
+        tie = np.zeros_like(tie)
+
+    # the round ends straight away when the player reaches the limit
+    win[:, limit] = 1.0
+    tie[:, limit] = 0.0
+    lose[:, limit] = 0.0
+
+    return win, tie, lose
+
+
+
+def dealer_model_tests():
+    '''
+    Tests for the dealer model.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import time
+
+    rules = Rules()
+    distribution = dealerFinalDistribution(rules)
+
+    # each row is a full distribution over the final totals
+    is_pass = np.allclose(distribution.sum(axis=1), 1.0)
+    assert is_pass == True, "fail the test"
+
+    # the dealer never stops below the stand threshold
+    is_pass = np.allclose(distribution[:, :17], 0.0)
+    assert is_pass == True, "fail the test"
+    print('Dealer bust chance by upcard:', np.round(distribution[:, -1], 4))
+
+    # outcomes add up to 1 for each player total
+    win, tie, lose = standOutcomes(rules, distribution)
+    is_pass = np.allclose(win + tie + lose, 1.0)
+    assert is_pass == True, "fail the test"
+
+    # standing on a low total only wins when the dealer goes bust
+    is_pass = np.allclose(win[:, 5], distribution[:, -1])
+    assert is_pass == True, "fail the test"
+
+    # padded sweep gives the same answer as a single variant
+    variants = [Rules(threshold, policy, limit)
+                for threshold in range(12, 21)
+                for policy in ('push', 'dealer', 'player')
+                for limit in range(21, 32)]
+    start = time.perf_counter()
+    sweep = sweepRules(variants)
+    elapsed = time.perf_counter() - start
+    index = variants.index(Rules(17, 'push', 21))
+    single = sweep[index]
+    is_pass = np.allclose(single[:, :22], distribution[:, :22]) and np.allclose(single[:, -1], distribution[:, -1])
+    assert is_pass == True, "fail the test"
+    print('Swept %d rule variants in %.1f ms' % (len(variants), elapsed * 1000))
+
+
+if __name__ == "__main__":
+    dealer_model_tests()
@@ -0,0 +1,420 @@
+# Binary corpus of pre-shuffled decks for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+#
+# File layout: a 24 byte header (magic, format, deck count) followed by one fixed size record
+# per deck. RAW records are the 52 card indexes (rank * 4 + suit) front of the deck first.
+# PACKED records are the deck's Lehmer code, a number below 52!, stored in 29 little-endian bytes.
+
+
+from playingCards import Deck, cardCode
+import numpy as np
+import struct
+
+
+MAGIC = b'D21CORP\x00'
+HEADER = struct.Struct('<8sB7xQ')
+RAW = 0
+PACKED = 1
+RECORD_SIZES = {RAW: 52, PACKED: 29}
+
+# the packed number is worked on as 32 bit limbs held in uint64, least significant limb first,
+# four Lehmer digits at a time so every step multiplies or divides by less than 2 ** 23
+LIMBS = 8
+GROUPS = [(start, (52 - start) * (51 - start) * (50 - start) * (49 - start)) for start in range(0, 52, 4)]
+CHUNK = 16384
+
+
+def lehmerDigits(orders):
+    '''
+    Returns the Lehmer code of each deck order: digit i is how many of the cards after
+    position i have a smaller index than the card at position i.
+
+    Inputs:
+        orders (ndarray): A (count, 52) array of card indexes.
+
+    Returns (ndarray): A (count, 52) array of digits, digit i below 52 - i.
+    '''
+    orders = np.asarray(orders)
+    later = np.triu(np.ones((52, 52), dtype=bool), 1)
+    return ((orders[:, None, :] < orders[:, :, None]) & later).sum(axis=2).astype(np.int64)
+
+
+def ordersFromDigits(digits):
+    '''
+    Returns the deck orders with the given Lehmer codes.
+
+    Inputs:
+        digits (ndarray): A (count, 52) array of Lehmer digits.
+
+    Returns (ndarray): A (count, 52) array of card indexes.
+    '''
+    digits = np.asarray(digits, dtype=np.int8)
+    orders = np.empty(digits.shape, dtype=np.int8)
+
+    # work back from the end: each card is its digit among the cards after it, and the cards
+    # after it that are not smaller move up by one
+    for i in range(51, -1, -1):
+        digit = digits[:, i:i + 1]
+        later = orders[:, i + 1:]
+        later += (later >= digit)
+        orders[:, i] = digit[:, 0]
+    return orders
+
+
+def packOrders(orders):
+    '''
+    Packs deck orders into 29 byte records.
+
+    Inputs:
+        orders (ndarray): A (count, 52) array of card indexes.
+
+    Returns (ndarray): A (count, 29) uint8 array.
+    '''
+    digits = lehmerDigits(orders).astype(np.uint64)
+    limbs = np.zeros((len(digits), LIMBS), dtype=np.uint64)
+
+    # Horner's rule in the mixed radix 52, 51, ..., 1, one group of four digits per step
+    for start, product in GROUPS:
+        carry = digits[:, start]
+        for i in range(start + 1, start + 4):
+            carry = carry * np.uint64(52 - i) + digits[:, i]
+        for k in range(LIMBS):
+            current = limbs[:, k] * np.uint64(product) + carry
+            limbs[:, k] = current & np.uint64(0xFFFFFFFF)
+            carry = current >> np.uint64(32)
+
+    # keep the 29 low bytes, which is all 52! needs
+    return limbs.astype('<u4').view(np.uint8).reshape(len(digits), LIMBS * 4)[:, :RECORD_SIZES[PACKED]]
+
+
+def unpackOrders(packed):
+    '''
+    Unpacks 29 byte records into deck orders.
+
+    Inputs:
+        packed (ndarray): A (count, 29) uint8 array.
+
+    Returns (ndarray): A (count, 52) array of card indexes.
+    '''
+    count = len(packed)
+    padded = np.zeros((count, LIMBS * 4), dtype=np.uint8)
+    padded[:, :RECORD_SIZES[PACKED]] = packed
+    limbs = padded.view('<u4').astype(np.uint64)
+    digits = np.empty((count, 52), dtype=np.int64)
+
+    # divide off one group of four digits at a time, starting from the last group
+    for start, product in reversed(GROUPS):
+        remainder = np.zeros(count, dtype=np.uint64)
+        for k in range(LIMBS - 1, -1, -1):
+            current = (remainder << np.uint64(32)) | limbs[:, k]
+            limbs[:, k] = current // np.uint64(product)
+            remainder = current % np.uint64(product)
+        for i in range(start + 3, start - 1, -1):
+            digits[:, i] = remainder % np.uint64(52 - i)
+            remainder = remainder // np.uint64(52 - i)
+    return ordersFromDigits(digits)
+
+
+def writeCorpus(filename, chunks, packed=False):
+    '''
+    Writes deck orders to a corpus file.
+
+    Inputs:
+        filename (str): Name of the corpus file.
+        chunks (iterable): Arrays of shape (count, 52) of card indexes, written one after another.
+        packed (bool): True to store 29 byte Lehmer codes instead of 52 byte orders.
+
+    Returns (int): Number of decks written.
+    '''
+    kind = PACKED if packed else RAW
+    count = 0
+    with open(filename, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, kind, 0))
+        for orders in chunks:
+            orders = np.asarray(orders, dtype=np.int8)
+            for start in range(0, len(orders), CHUNK):
+                part = orders[start:start + CHUNK]
+                file.write((packOrders(part) if packed else part).tobytes())
+            count += len(orders)
+
+        # fill in the number of decks now that it is known
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, kind, count))
+    return count
+
+
+def generateCorpus(filename, count, seed=None, packed=False):
+    '''
+    Writes a corpus of uniformly random deck orders.
+
+    Inputs:
+        filename (str): Name of the corpus file.
+        count (int): Number of decks.
+        seed (int): Seed for the random orders.
+        packed (bool): True to store 29 byte Lehmer codes.
+
+    Returns (int): Number of decks written.
+    '''
+    rng = np.random.default_rng(seed)
+
+    def chunks():
+        for start in range(0, count, CHUNK):
+            size = min(CHUNK, count - start)
+            yield np.argsort(rng.random((size, 52)), axis=1).astype(np.int8)
+
+    return writeCorpus(filename, chunks(), packed)
+
+
+def textToCorpus(filenames, corpusFile, packed=False):
+    '''
+    Converts deck text files (one card code per line) into a corpus. Each file is checked
+    the same way the game checks it.
+
+    Inputs:
+        filenames (list): Names of the deck text files.
+        corpusFile (str): Name of the corpus file to write.
+        packed (bool): True to store 29 byte Lehmer codes.
+
+    Returns (int): Number of decks written.
+    '''
+    from tableBatch import ordersFromDecks
+
+    return writeCorpus(corpusFile, [ordersFromDecks([Deck(filename)]) for filename in filenames], packed)
+
+
+def corpusToText(corpusFile, index, filename):
+    '''
+    Writes one deck of a corpus as a deck text file that the game can read.
+
+    Inputs:
+        corpusFile (str): Name of the corpus file.
+        index (int): Which deck to write.
+        filename (str): Name of the text file to write.
+
+    Returns: None
+    '''
+    corpus = DeckCorpus(corpusFile)
+    codes = [cardCode(card) for card in corpus.getOrders(index, index + 1)[0]]
+    corpus.close()
+    with open(filename, 'w') as file:
+        file.write('\n'.join(codes))
+
+
+
+class DeckCorpus:
+    # Read-only view of a corpus file through a memory map; many processes can share one file.
+
+    def __init__(self, filename):
+        '''
+        Initializes the DeckCorpus class by mapping the file into memory. A file whose size
+        does not match the number of decks in its header, such as one cut short while being
+        written, is rejected.
+
+        Inputs:
+            filename (str): Name of the corpus file.
+
+        Returns: None
+        '''
+        with open(filename, 'rb') as file:
+            header = file.read(HEADER.size)
+            file.seek(0, 2)
+            size = file.tell()
+        if len(header) < HEADER.size:
+            raise Exception('Cannot read deck corpus: %s is too short for a header (%d bytes)' % (filename, size))
+        magic, kind, count = HEADER.unpack(header)
+        if magic != MAGIC or kind not in RECORD_SIZES:
+            raise Exception('Cannot read deck corpus: invalid header in %s' % filename)
+        expected = HEADER.size + count * RECORD_SIZES[kind]
+        if size != expected:
+            raise Exception('Cannot read deck corpus: %s is %d bytes but %d decks of %d bytes need %d'
+                            % (filename, size, count, RECORD_SIZES[kind], expected))
+
+        self.__packed = (kind == PACKED)
+        self.__count = count
+        dtype = np.uint8 if self.__packed else np.int8
+        if count == 0:
+            # an empty file cannot be memory mapped
+            self.__records = np.empty((0, RECORD_SIZES[kind]), dtype=dtype)
+        else:
+            self.__records = np.memmap(filename, dtype=dtype, mode='r', offset=HEADER.size,
+                                       shape=(count, RECORD_SIZES[kind]))
+
+
+    def size(self):
+        '''
+        Returns the number of decks in the corpus.
+
+        Inputs:
+            self is the DeckCorpus.
+        '''
+        return self.__count
+
+
+    def isPacked(self):
+        '''
+        Returns True if the corpus stores 29 byte Lehmer codes.
+
+        Inputs:
+            self is the DeckCorpus.
+        '''
+        return self.__packed
+
+
+    def getOrders(self, start=0, stop=None):
+        '''
+        Returns the deck orders from start up to but not including stop. For a RAW corpus this
+        is a slice of the memory map and nothing is copied; a PACKED corpus is decoded.
+
+        Inputs:
+            self is the DeckCorpus.
+            start (int): Index of the first deck.
+            stop (int): Index after the last deck; the end of the corpus if not given.
+
+        Returns (ndarray): A (stop - start, 52) array of card indexes.
+        '''
+        records = self.__records[start:stop]
+        if not self.__packed:
+            return records
+
+        # decode in chunks to keep the working arrays small
+        orders = np.empty((len(records), 52), dtype=np.int8)
+        for first in range(0, len(records), CHUNK):
+            orders[first:first + CHUNK] = unpackOrders(records[first:first + CHUNK])
+        return orders
+
+
+    def getCodes(self, index):
+        '''
+        Returns the card codes of one deck, front of the deck first.
+
+        Inputs:
+            self is the DeckCorpus.
+            index (int): Which deck.
+        '''
+        return [cardCode(card) for card in self.getOrders(index, index + 1)[0]]
+
+
+    def getDeck(self, index):
+        '''
+        Returns a new Deck holding one deck of the corpus.
+
+        Inputs:
+            self is the DeckCorpus.
+            index (int): Which deck.
+        '''
+        return Deck(codes=self.getCodes(index))
+
+
+    def close(self):
+        '''
+        Releases the corpus's reference to the memory map. Orders returned by getOrders for a
+        RAW corpus are views of the map, so NumPy unmaps the file once the last of them is gone
+        and views still held stay readable.
+
+        Inputs:
+            self is the DeckCorpus.
+
+        Returns: None
+        '''
+        self.__records = None
+
+
+
+def corpus_tests():
+    '''
+    Tests for the deck corpus.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import os
+    import tempfile
+    import time
+    from tableBatch import randomOrders
+
+    rng = np.random.default_rng(30)
+    orders = randomOrders(1000, rng)
+
+    # Lehmer codes round trip, including the first and last permutations
+    extremes = np.array([np.arange(52), np.arange(52)[::-1]], dtype=np.int8)
+    for sample in (orders, extremes):
+        is_pass = (unpackOrders(packOrders(sample)) == sample).all()
+        assert is_pass == True, "fail the test"
+    is_pass = (packOrders(extremes[:1]) == 0).all()
+    assert is_pass == True, "fail the test"
+
+    with tempfile.TemporaryDirectory() as folder:
+        raw_file = os.path.join(folder, 'raw.d21')
+        packed_file = os.path.join(folder, 'packed.d21')
+
+        # both formats store the same decks
+        writeCorpus(raw_file, [orders[:400], orders[400:]])
+        writeCorpus(packed_file, [orders], packed=True)
+        is_pass = (os.path.getsize(packed_file) == HEADER.size + 29 * 1000)
+        assert is_pass == True, "fail the test"
+        for filename in (raw_file, packed_file):
+            corpus = DeckCorpus(filename)
+            is_pass = (corpus.size() == 1000 and (corpus.getOrders(10, 20) == orders[10:20]).all())
+            assert is_pass == True, "fail the test"
+            is_pass = (corpus.getDeck(7).getCodes() == [cardCode(card) for card in orders[7]])
+            assert is_pass == True, "fail the test"
+            corpus.close()
+
+        # views of a RAW corpus stay readable after it is closed
+        corpus = DeckCorpus(raw_file)
+        view = corpus.getOrders(0, 3)
+        corpus.close()
+        is_pass = (view == orders[:3]).all()
+        assert is_pass == True, "fail the test"
+        del view
+
+        # text files convert both ways
+        text_file = os.path.join(folder, 'deck.txt')
+        corpusToText(raw_file, 3, text_file)
+        textToCorpus([text_file, text_file], packed_file, packed=True)
+        corpus = DeckCorpus(packed_file)
+        is_pass = (corpus.size() == 2 and (corpus.getOrders() == orders[3]).all())
+        assert is_pass == True, "fail the test"
+        corpus.close()
+
+        # files cut short, or with extra bytes, are rejected with the sizes found
+        with open(packed_file, 'rb') as file:
+            contents = file.read()
+        for broken in (b'', contents[:10], contents[:-1], contents + b'\x00'):
+            with open(packed_file, 'wb') as file:
+                file.write(broken)
+            try:
+                DeckCorpus(packed_file)
+                is_pass = False
+            except Exception as err:
+                is_pass = str(err).startswith('Cannot read deck corpus')
+            assert is_pass == True, "fail the test"
+
+        # a corpus of no decks opens empty
+        writeCorpus(packed_file, [], packed=True)
+        corpus = DeckCorpus(packed_file)
+        is_pass = (corpus.size() == 0 and corpus.getOrders().shape == (0, 52))
+        assert is_pass == True, "fail the test"
+        corpus.close()
+
+        # synthetic corpora
+        for packed in (False, True):
+            start = time.perf_counter()
+            generateCorpus(raw_file, 200000, seed=1, packed=packed)
+            elapsed = time.perf_counter() - start
+            corpus = DeckCorpus(raw_file)
+            start = time.perf_counter()
+            decoded = corpus.getOrders()
+            read = time.perf_counter() - start
+            is_pass = (np.sort(decoded[:1000], axis=1) == np.arange(52)).all()
+            assert is_pass == True, "fail the test"
+            print('%s: wrote 200000 decks in %.2f s, read in %.3f s' % ('packed' if packed else 'raw', elapsed, read))
+            del decoded
+            corpus.close()
+
+
+if __name__ == "__main__":
+    corpus_tests()
@@ -0,0 +1,479 @@
+# Deck orders that force chosen scenarios for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+#
+# Until the deck first runs out, a Table plays a fixed deck order the same way every time, so
+# a scenario such as the deck running out while the dealer is drawing can be built into the
+# order. The search places one card value at a time while following the game (deal, player
+# decisions from the policy, dealer draws), drops any partial order that can no longer reach
+# the scenario (a round that ends the wrong way, or too few small cards left for a long hand)
+# and tries the most promising values first, backtracking when a branch fails. Suits are
+# given out at the end, and every order found is checked by playing it at a real Table.
+
+
+from collections import namedtuple
+from gameRules import Rules
+from playingCards import RANKS, SUITS
+import random
+
+
+SCENARIOS = ('dealer-repopulate', 'player-repopulate', 'deal-repopulate', 'long-player-hand', 'long-dealer-hand',
+             'natural-streak')
+DEFAULT_SIZES = {'long-player-hand': 10, 'long-dealer-hand': 10, 'natural-streak': 5}
+FULL_COUNTS = (4, 4, 4, 4, 4, 4, 4, 4, 4, 16)
+
+# state of the game before the first card: (phase, slot, player value, player cards, upcard value,
+# dealer value, dealer cards, finished rounds)
+START = ('deal', 0, 0, 0, 0, 0, 0, ())
+
+# what happened in a round played at a Table; repopulated is 'deal', 'player', 'dealer' or None
+RoundTrace = namedtuple('RoundTrace', 'playerCards dealerCards natural winner repopulated')
+
+
+def valueOf(code):
+    '''
+    Returns the value of a card code, with an Ace as 1 and a face card as 10.
+
+    Inputs:
+        code (str): The card code, e.g. 'KS'.
+    '''
+    return min(RANKS.index(code[0].upper()) + 1, 10)
+
+
+def traceDeck(codes, policy, rules=None, rounds=None):
+    '''
+    Plays a deck order at a Table the same way playRound does and records every round,
+    including which part of the round the deck ran out in.
+
+    Inputs:
+        codes (list): The 52 card codes, front of the deck first.
+        policy (callable): Called with (playerValue, cardCount, upValue); returns True to hit.
+        rules (Rules): The rules of the game; defaults to the original game.
+        rounds (int): Number of rounds to play; defaults to playing until the deck first runs out.
+
+    Returns (list): A RoundTrace for each round.
+    '''
+    from playingCards import Deck
+    from simple21 import Table
+
+    table = Table(rules, Deck(codes=codes), verbose=False)
+    deck = table.getDeck()
+    rules = table.getRules()
+    player = table.getPlayer()
+    dealer = table.getDealer()
+    traces = []
+    while (rounds is None and not any(trace.repopulated for trace in traces)) or (rounds is not None
+                                                                                 and len(traces) < rounds):
+        repopulated = 'deal' if deck.size() < 4 else None
+        table.dealHands()
+        up_value = dealer.getHand()[0].getValue()
+        player_bust = rules.isBust(player.getHandValue())
+        while not player_bust and policy(player.getHandValue(), player.getCardCount(), up_value):
+            if deck.size() == 0:
+                repopulated = 'player'
+            player_bust = table.playerHit()
+            if player_bust:
+                break
+        natural = not player_bust and player.getCardCount() > 2 and table.playerNatural()
+        if player_bust:
+            winner = 'dealer'
+        elif natural:
+            winner = 'player'
+        else:
+            left = deck.size()
+            dealer_bust = table.dealerHit()
+            if dealer.getCardCount() - 2 > left:
+                repopulated = 'dealer'
+            winner = 'player' if dealer_bust else table.whoWon()
+        traces.append(RoundTrace(player.getCardCount(), dealer.getCardCount(), natural, winner, repopulated))
+        table.clearTable()
+    return traces
+
+
+def writeDeck(codes, filename):
+    '''
+    Writes a deck order as a deck text file that the game can read.
+
+    Inputs:
+        codes (list): The 52 card codes, front of the deck first.
+        filename (str): Name of the file to write.
+
+    Returns: None
+    '''
+    with open(filename, 'w') as file:
+        file.write('\n'.join(codes))
+
+
+
+class DeckSearch:
+    # Builds deck orders that force a scenario, by depth-first search over card values.
+
+    def __init__(self, policy=None, rules=None, seed=None, maxNodes=100000):
+        '''
+        Initializes the DeckSearch class.
+
+        Inputs:
+            policy (callable): The player's policy, called with (playerValue, cardCount, upValue);
+                defaults to standing on 17.
+            rules (Rules): The rules of the game; defaults to the original game.
+            seed (int): Seed for the order values are tried in and for the suits.
+            maxNodes (int): Most partial orders looked at in one attempt before starting again
+                with a different order.
+
+        Returns: None
+        '''
+        if policy is None:
+            from autoPlay import ThresholdPolicy
+            policy = ThresholdPolicy(17)
+        if rules is None:
+            rules = Rules()
+        assert isinstance(maxNodes, int) and maxNodes > 0, 'Error: maxNodes must be a positive int'
+        self.__policy = policy
+        self.__rules = rules
+        self.__rng = random.Random(seed)
+        self.__maxNodes = maxNodes
+        self.__nodes = 0
+
+
+    def getNodes(self):
+        '''
+        Returns the number of partial orders looked at by the last build.
+
+        Inputs:
+            self is the DeckSearch.
+        '''
+        return self.__nodes
+
+
+    def step(self, state, value):
+        '''
+        Follows the game through one more card. In a state (see START), phase is the part of
+        the round the next card goes to, slot is which of the four dealt cards it is, and
+        finished rounds is a tuple of (player cards, dealer cards, natural) for every round
+        played so far.
+
+        Inputs:
+            self is the DeckSearch.
+            state (tuple): The state before the card.
+            value (int): The value of the card.
+
+        Returns (tuple): The state after the card and any decisions that need no card.
+        '''
+        phase, slot, player_value, player_cards, up_value, dealer_value, dealer_cards, finished = state
+        rules = self.__rules
+        if phase == 'deal':
+            # player, dealer upcard, player, dealer hole card
+            if slot == 0:
+                player_value, player_cards = value, 1
+            elif slot == 1:
+                up_value, dealer_value, dealer_cards = value, value, 1
+            elif slot == 2:
+                player_value, player_cards = player_value + value, 2
+            else:
+                dealer_value, dealer_cards = dealer_value + value, 2
+            if slot < 3:
+                return ('deal', slot + 1, player_value, player_cards, up_value, dealer_value, dealer_cards, finished)
+            phase = 'player'
+        elif phase == 'player':
+            player_value, player_cards = player_value + value, player_cards + 1
+        else:
+            dealer_value, dealer_cards = dealer_value + value, dealer_cards + 1
+
+        # decide what the next card is for
+        if phase == 'player':
+            if not rules.isBust(player_value) and self.__policy(player_value, player_cards, up_value):
+                return ('player', 0, player_value, player_cards, up_value, dealer_value, dealer_cards, finished)
+            natural = player_cards > 2 and rules.isNatural(player_value)
+            if rules.isBust(player_value) or natural:
+                return ('deal', 0, 0, 0, 0, 0, 0, finished + ((player_cards, dealer_cards, natural), ))
+            phase = 'dealer'
+        if rules.dealerMustHit(dealer_value):
+            return ('dealer', 0, player_value, player_cards, up_value, dealer_value, dealer_cards, finished)
+        return ('deal', 0, 0, 0, 0, 0, 0, finished + ((player_cards, dealer_cards, False), ))
+
+
+    def __smallest(self, counts, number):
+        '''
+        Returns the total of the number smallest values left, or None if fewer are left.
+
+        Inputs:
+            self is the DeckSearch.
+            counts (list): Cards left of each value 1 to 10.
+            number (int): How many values to add up.
+        '''
+        total = 0
+        for value, count in enumerate(counts, 1):
+            taken = min(count, number)
+            total += taken * value
+            number -= taken
+            if number == 0:
+                return total
+        return None if number else total
+
+
+    def __status(self, scenario, size, state, counts, placed):
+        '''
+        Decides whether a partial order has reached the scenario (True), can no longer reach it
+        (False) or might still reach it (None).
+
+        Inputs:
+            self is the DeckSearch.
+            scenario (str): One of SCENARIOS.
+            size (int): Hand length or number of naturals the scenario needs.
+            state (tuple): The state after the placed cards.
+            counts (list): Cards left of each value 1 to 10.
+            placed (int): Number of cards placed.
+        '''
+        phase, slot, player_value, player_cards, up_value, dealer_value, dealer_cards, finished = state
+        rules = self.__rules
+        if scenario.endswith('repopulate'):
+            if placed < 52:
+                return None
+            wanted = scenario[:-len('-repopulate')]
+            return phase == wanted and (phase != 'deal' or slot > 0)
+
+        if scenario == 'natural-streak':
+            if not all(natural for cards, dealer, natural in finished):
+                return False
+            if len(finished) >= size:
+                return True
+            # each natural needs two dealer cards and at least three player cards
+            current = placed - sum(cards + dealer for cards, dealer, natural in finished)
+            return None if 52 - placed >= 5 * (size - len(finished)) - current else False
+
+        # a long hand has to come in the first round
+        if scenario == 'long-player-hand':
+            if player_cards >= size and phase == 'player' or finished and finished[0][0] >= size:
+                return True
+            if finished:
+                return False
+            if phase == 'player':
+                smallest = self.__smallest(counts, size - player_cards)
+                return None if smallest is not None and not rules.isBust(player_value + smallest) else False
+            return None
+        if dealer_cards >= size and phase in ('dealer', 'deal') or finished and finished[0][1] >= size:
+            return True
+        if finished:
+            return False
+        if phase == 'dealer':
+            # the dealer keeps drawing only below the stand threshold
+            smallest = self.__smallest(counts, size - dealer_cards - 1)
+            return None if smallest is not None and rules.dealerMustHit(dealer_value + smallest) else False
+        return None
+
+
+    def __order(self, scenario, state, counts):
+        '''
+        Returns the values left in the order to try them for the next card.
+
+        Inputs:
+            self is the DeckSearch.
+            scenario (str): One of SCENARIOS.
+            state (tuple): The state before the card.
+            counts (list): Cards left of each value 1 to 10.
+        '''
+        phase, slot, player_value, player_cards, up_value, dealer_value, dealer_cards, finished = state
+        values = [value for value in range(1, 11) if counts[value - 1]]
+        self.__rng.shuffle(values)
+        player_card = phase == 'player' or phase == 'deal' and slot in (0, 2)
+        if scenario == 'long-player-hand' and not finished:
+            values.sort(key=lambda value: value if player_card else -value)
+        elif scenario == 'long-dealer-hand' and not finished:
+            values.sort(key=lambda value: -value if player_card else value)
+        elif scenario == 'natural-streak' and phase == 'player':
+            # hit straight to the limit when that card is left
+            needed = self.__rules.getBustLimit() - player_value
+            values.sort(key=lambda value: value != needed)
+        return values
+
+
+    def build(self, scenario, size=None, attempts=20):
+        '''
+        Searches for a deck order that forces the scenario when played with the policy.
+        The repopulate scenarios have the deck run out in that part of a round ('deal' means
+        part way through dealing the hands); long hands come in the first round and naturals
+        in a row start from the first round.
+
+        Inputs:
+            self is the DeckSearch.
+            scenario (str): One of SCENARIOS.
+            size (int): Hand length or number of naturals in a row; defaults to DEFAULT_SIZES.
+            attempts (int): Number of times to start again with a different order of values.
+
+        Returns (list): The 52 card codes, front of the deck first, or None if none was found.
+        '''
+        assert scenario in SCENARIOS, 'Error: scenario must be one of %s' % (SCENARIOS, )
+        if size is None:
+            size = DEFAULT_SIZES.get(scenario, 0)
+        self.__nodes = 0
+        for attempt in range(attempts):
+            values = self.__search(scenario, size)
+            if values is not None:
+                return self.__codes(values)
+        return None
+
+
+    def __search(self, scenario, size):
+        '''
+        Runs one depth-first search, stopping after maxNodes partial orders.
+
+        Inputs:
+            self is the DeckSearch.
+            scenario (str): One of SCENARIOS.
+            size (int): Hand length or number of naturals in a row.
+
+        Returns (list): The 52 card values, or None if none was found.
+        '''
+        counts = list(FULL_COUNTS)
+        values = []
+        state = START
+        # each level holds the state before its card and the values still to try there
+        stack = [(state, self.__order(scenario, state, counts))]
+        nodes = 0
+        while stack and nodes < self.__maxNodes:
+            state, untried = stack[-1]
+            if not untried:
+                stack.pop()
+                if values:
+                    counts[values.pop() - 1] += 1
+                continue
+            value = untried.pop(0)
+            nodes += 1
+            counts[value - 1] -= 1
+            values.append(value)
+            after = self.step(state, value)
+            status = self.__status(scenario, size, after, counts, len(values))
+            if status:
+                self.__nodes += nodes
+                # the rest of the deck can be in any order
+                rest = [value for value in range(1, 11) for i in range(counts[value - 1])]
+                self.__rng.shuffle(rest)
+                return values + rest
+            if status is None and len(values) < 52:
+                stack.append((after, self.__order(scenario, after, counts)))
+            else:
+                counts[values.pop() - 1] += 1
+        self.__nodes += nodes
+        return None
+
+
+    def __codes(self, values):
+        '''
+        Gives each value a card of that value, with suits and face cards chosen at random.
+
+        Inputs:
+            self is the DeckSearch.
+            values (list): The 52 card values.
+
+        Returns (list): The 52 card codes.
+        '''
+        cards = {value: [] for value in range(1, 11)}
+        for rank in RANKS:
+            for suit in SUITS:
+                cards[valueOf(rank)].append(rank + suit)
+        for value in cards:
+            self.__rng.shuffle(cards[value])
+        return [cards[value].pop() for value in values]
+
+
+
+def checkScenario(codes, scenario, size=None, policy=None, rules=None):
+    '''
+    Plays a deck order at a Table and checks that the scenario happens.
+
+    Inputs:
+        codes (list): The 52 card codes, front of the deck first.
+        scenario (str): One of SCENARIOS.
+        size (int): Hand length or number of naturals in a row; defaults to DEFAULT_SIZES.
+        policy (callable): The player's policy; defaults to standing on 17.
+        rules (Rules): The rules of the game; defaults to the original game.
+
+    Returns (bool): True if the scenario happens.
+    '''
+    if policy is None:
+        from autoPlay import ThresholdPolicy
+        policy = ThresholdPolicy(17)
+    if size is None:
+        size = DEFAULT_SIZES.get(scenario, 0)
+    traces = traceDeck(codes, policy, rules)
+    if scenario.endswith('repopulate'):
+        return traces[-1].repopulated == scenario[:-len('-repopulate')]
+    if scenario == 'natural-streak':
+        return len(traces) >= size and all(trace.natural for trace in traces[:size])
+    if scenario == 'long-player-hand':
+        return traces[0].playerCards >= size
+    return traces[0].dealerCards >= size
+
+
+
+def deck_search_tests():
+    '''
+    Tests for deck order search.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import time
+    from autoPlay import ThresholdPolicy
+    from playingCards import Deck
+
+    # the search follows the game the same way a Table plays it
+    rng = random.Random(44)
+    policy = ThresholdPolicy(15)
+    search = DeckSearch(policy)
+    for i in range(50):
+        codes = [rank + suit for rank in RANKS for suit in SUITS]
+        rng.shuffle(codes)
+        state = START
+        for code in codes:
+            state = search.step(state, valueOf(code))
+        traces = traceDeck(codes, policy)
+        played = [(trace.playerCards, trace.dealerCards, trace.natural) for trace in traces if not trace.repopulated]
+        is_pass = (list(state[7]) == played)
+        assert is_pass == True, "fail the test"
+
+    # every scenario is found, and playing the deck at a Table shows it happening
+    for scenario in SCENARIOS:
+        search = DeckSearch(seed=44)
+        start = time.perf_counter()
+        codes = search.build(scenario)
+        elapsed = time.perf_counter() - start
+        is_pass = (codes is not None and sorted(codes) == sorted(Deck(codes=codes).getCodes())
+                   and len(set(codes)) == 52 and checkScenario(codes, scenario))
+        assert is_pass == True, "fail the test"
+        print('%-18s found after %6d partial orders in %.3f s' % (scenario, search.getNodes(), elapsed))
+
+    # the longest hands standing on 17 allows: AAAA2222 then 3 and one more card
+    is_pass = (DeckSearch(seed=1).build('long-player-hand', 10) is not None
+               and DeckSearch(seed=1, maxNodes=20000).build('long-player-hand', 11, attempts=2) is None)
+    assert is_pass == True, "fail the test"
+
+    # a longer streak of naturals, and a deck file that the game reads back
+    search = DeckSearch(seed=2)
+    codes = search.build('natural-streak', 8)
+    is_pass = (codes is not None and checkScenario(codes, 'natural-streak', 8))
+    assert is_pass == True, "fail the test"
+    writeDeck(codes, 'deck_search_test.txt')
+    is_pass = (Deck('deck_search_test.txt').getCodes() == codes)
+    assert is_pass == True, "fail the test"
+    import os
+    os.remove('deck_search_test.txt')
+
+    # random shuffles seldom reach the longer scenarios
+    rng = random.Random(44)
+    codes = [rank + suit for rank in RANKS for suit in SUITS]
+    reached = dict.fromkeys(SCENARIOS, 0)
+    for i in range(2000):
+        rng.shuffle(codes)
+        for scenario in SCENARIOS:
+            reached[scenario] += checkScenario(codes, scenario)
+    print('Random shuffles reaching each scenario: ' + ', '.join('%s %.2f%%' % (scenario, count / 20)
+                                                                 for scenario, count in reached.items()))
+    is_pass = (reached['long-player-hand'] + reached['long-dealer-hand'] + reached['natural-streak'] < 10)
+    assert is_pass == True, "fail the test"
+
+
+if __name__ == "__main__":
+    deck_search_tests()
@@ -0,0 +1,447 @@
+# Distributed simulation coordinator and workers for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+#
+# A Job is split into work units, each a range of seeds. The result of a unit depends only on
+# the job and the unit's index, never on which worker played it or when, so the merged result
+# is the same as playing every unit on one machine (runLocal). Messages are JSON objects sent
+# over TCP, each after a 4 byte big-endian length.
+
+
+from collections import namedtuple
+import json
+import random
+import socket
+import struct
+import threading
+import time
+
+
+Job = namedtuple('Job', 'masterSeed seeds unitSize rounds policy rules engine')
+LENGTH = struct.Struct('!I')
+ENGINES = ('table', 'batch')
+
+
+def makeJob(masterSeed, seeds, unitSize=100, rounds=100, policy='stand17', rules=None, engine='table'):
+    '''
+    Returns a Job.
+
+    Inputs:
+        masterSeed (int): Seed that fixes every deck and shuffle of the job.
+        seeds (int): Number of seeds; each seed is one table.
+        unitSize (int): Number of seeds in each work unit.
+        rounds (int): Rounds played at each table.
+        policy (str): Name of the hit/stay policy, e.g. 'stand17'.
+        rules (Rules): The rules of the game; defaults to the original game.
+        engine (str): 'table' to play each seed at a Table, 'batch' to play each unit as a TableBatch.
+
+    Returns (Job): The job.
+    '''
+    from gameRules import Rules
+
+    assert engine in ENGINES, 'Error: engine must be one of %s' % (ENGINES, )
+    if rules is None:
+        rules = Rules()
+    return Job(masterSeed, seeds, unitSize, rounds, policy, list(rules.key()), engine)
+
+
+def unitCount(job):
+    '''
+    Returns the number of work units in a job.
+
+    Inputs:
+        job (Job): The job.
+    '''
+    return (job.seeds + job.unitSize - 1) // job.unitSize
+
+
+def playUnit(job, unit):
+    '''
+    Plays one work unit.
+
+    Inputs:
+        job (Job): The job.
+        unit (int): Index of the work unit.
+
+    Returns (list): Number of rounds won by the player, tied and won by the dealer.
+    '''
+    from autoPlay import parsePolicy
+    from gameRules import Rules
+
+    policy = parsePolicy(job.policy)
+    rules = Rules(*job.rules)
+    first = unit * job.unitSize
+    last = min(first + job.unitSize, job.seeds)
+
+    if job.engine == 'batch':
+        import numpy as np
+        from tableBatch import TableBatch, randomOrders
+
+        rng = np.random.default_rng([job.masterSeed, unit])
+        batch = TableBatch(randomOrders(last - first, rng), rules, int(rng.integers(2 ** 63)))
+        outcomes = np.concatenate([batch.playRound(policy) for i in range(job.rounds)])
+        return [int(np.count_nonzero(outcomes == outcome)) for outcome in (1, 0, -1)]
+
+    from autoPlay import playRounds
+    from playingCards import Deck, RANKS, SUITS
+    from simple21 import Table
+
+    # the Deck shuffles with the random module, so it is seeded for every table
+    counts = [0, 0, 0]
+    state = random.getstate()
+    for seed in range(first, last):
+        random.seed('%d/%d' % (job.masterSeed, seed))
+        codes = [rank + suit for rank in RANKS for suit in SUITS]
+        random.shuffle(codes)
+        outcomes = playRounds(Table(rules, Deck(codes=codes), verbose=False), policy, job.rounds)
+        for i, outcome in enumerate((1, 0, -1)):
+            counts[i] += outcomes.count(outcome)
+    random.setstate(state)
+    return counts
+
+
+def mergeCounts(results):
+    '''
+    Returns the sum of the counts of several work units.
+
+    Inputs:
+        results (list): Counts returned by playUnit.
+    '''
+    return [sum(counts[i] for counts in results) for i in range(3)]
+
+
+def runLocal(job):
+    '''
+    Plays every unit of a job in this process.
+
+    Inputs:
+        job (Job): The job.
+
+    Returns (list): Number of rounds won by the player, tied and won by the dealer.
+    '''
+    return mergeCounts([playUnit(job, unit) for unit in range(unitCount(job))])
+
+
+def sendMessage(sock, message):
+    '''
+    Sends a JSON message.
+
+    Inputs:
+        sock (socket): The connected socket.
+        message (dict): The message.
+
+    Returns: None
+    '''
+    data = json.dumps(message).encode()
+    sock.sendall(LENGTH.pack(len(data)) + data)
+
+
+def receiveMessage(sock):
+    '''
+    Receives a JSON message.
+
+    Inputs:
+        sock (socket): The connected socket.
+
+    Returns (dict): The message, or None if the connection was closed.
+    '''
+    header = receiveBytes(sock, LENGTH.size)
+    if header is None:
+        return None
+    data = receiveBytes(sock, LENGTH.unpack(header)[0])
+    if data is None:
+        return None
+    return json.loads(data)
+
+
+def receiveBytes(sock, count):
+    '''
+    Receives exactly count bytes.
+
+    Inputs:
+        sock (socket): The connected socket.
+        count (int): Number of bytes.
+
+    Returns (bytes): The bytes, or None if the connection was closed first.
+    '''
+    data = b''
+    while len(data) < count:
+        part = sock.recv(count - len(data))
+        if not part:
+            return None
+        data += part
+    return data
+
+
+
+class Coordinator:
+    # Hands out the work units of a job to workers and merges their results.
+
+    def __init__(self, job, host='127.0.0.1', port=0, lease=60.0):
+        '''
+        Initializes the Coordinator class and starts listening for workers.
+
+        Inputs:
+            job (Job): The job.
+            host (str): Address to listen on.
+            port (int): Port to listen on; any free port if 0.
+            lease (float): Seconds a worker has to return a unit before it is given to another.
+
+        Returns: None
+        '''
+        self.__job = job
+        self.__lease = lease
+        self.__pending = list(range(unitCount(job) - 1, -1, -1))
+        self.__leases = {}
+        self.__results = {}
+        self.__reissued = 0
+        self.__lock = threading.Lock()
+        self.__done = threading.Event()
+        self.__server = socket.create_server((host, port))
+        self.__server.settimeout(0.1)
+        if not self.__pending:
+            self.__done.set()
+
+
+    def getAddress(self):
+        '''
+        Returns the (host, port) the coordinator listens on.
+
+        Inputs:
+            self is the Coordinator.
+        '''
+        return self.__server.getsockname()[:2]
+
+
+    def getReissued(self):
+        '''
+        Returns the number of units given out again after a worker died or ran out of time.
+
+        Inputs:
+            self is the Coordinator.
+        '''
+        return self.__reissued
+
+
+    def __nextUnit(self, worker):
+        '''
+        Leases the next unit to a worker, first taking back any lease that has run out.
+
+        Inputs:
+            self is the Coordinator.
+            worker (int): Id of the worker's connection.
+
+        Returns (int): The unit, or None if every unit is leased or finished.
+        '''
+        with self.__lock:
+            now = time.monotonic()
+            for unit, (expiry, holder) in list(self.__leases.items()):
+                if expiry < now:
+                    del self.__leases[unit]
+                    self.__pending.append(unit)
+                    self.__reissued += 1
+            if not self.__pending:
+                return None
+            unit = self.__pending.pop()
+            self.__leases[unit] = (now + self.__lease, worker)
+            return unit
+
+
+    def __finish(self, unit, counts):
+        '''
+        Records the result of a unit. A unit that was played twice keeps its first result,
+        which is the same as the second anyway.
+
+        Inputs:
+            self is the Coordinator.
+            unit (int): The unit.
+            counts (list): Its result.
+
+        Returns: None
+        '''
+        with self.__lock:
+            self.__leases.pop(unit, None)
+            if unit in self.__pending:
+                self.__pending.remove(unit)
+            self.__results.setdefault(unit, counts)
+            if len(self.__results) == unitCount(self.__job):
+                self.__done.set()
+
+
+    def __release(self, worker):
+        '''
+        Puts the units leased to a worker whose connection closed back in the queue.
+
+        Inputs:
+            self is the Coordinator.
+            worker (int): Id of the worker's connection.
+
+        Returns: None
+        '''
+        with self.__lock:
+            for unit, (expiry, holder) in list(self.__leases.items()):
+                if holder == worker:
+                    del self.__leases[unit]
+                    self.__pending.append(unit)
+                    self.__reissued += 1
+
+
+    def __serve(self, sock, worker):
+        '''
+        Talks to one worker until it disconnects or the job is done.
+
+        Inputs:
+            self is the Coordinator.
+            sock (socket): The worker's connection.
+            worker (int): Id of the connection.
+
+        Returns: None
+        '''
+        job = self.__job._asdict()
+        try:
+            while True:
+                message = receiveMessage(sock)
+                if message is None:
+                    break
+                if message['type'] == 'result':
+                    self.__finish(message['unit'], message['counts'])
+
+                if self.__done.is_set():
+                    sendMessage(sock, {'type': 'done'})
+                    break
+                unit = self.__nextUnit(worker)
+                if unit is None:
+                    sendMessage(sock, {'type': 'wait', 'seconds': 0.05})
+                else:
+                    sendMessage(sock, {'type': 'work', 'unit': unit, 'job': job})
+        except OSError:
+            pass
+        finally:
+            sock.close()
+            self.__release(worker)
+
+
+    def run(self, timeout=None):
+        '''
+        Accepts workers and hands out units until every unit has a result.
+
+        Inputs:
+            self is the Coordinator.
+            timeout (float): Longest time in seconds to wait; no limit if not given.
+
+        Returns (list): Number of rounds won by the player, tied and won by the dealer.
+        '''
+        start = time.monotonic()
+        worker = 0
+        while not self.__done.is_set():
+            if timeout is not None and time.monotonic() - start > timeout:
+                raise TimeoutError('Job not finished after %.1f s' % timeout)
+            try:
+                sock, address = self.__server.accept()
+            except socket.timeout:
+                continue
+            sock.settimeout(None)
+            worker += 1
+            threading.Thread(target=self.__serve, args=(sock, worker), daemon=True).start()
+
+        self.__server.close()
+        return mergeCounts([self.__results[unit] for unit in range(unitCount(self.__job))])
+
+
+
+def runWorker(host, port):
+    '''
+    Plays work units for a coordinator until it says the job is done.
+
+    Inputs:
+        host (str): Address of the coordinator.
+        port (int): Port of the coordinator.
+
+    Returns (int): Number of units played.
+    '''
+    played = 0
+    with socket.create_connection((host, port)) as sock:
+        sendMessage(sock, {'type': 'ready'})
+        while True:
+            message = receiveMessage(sock)
+            if message is None or message['type'] == 'done':
+                return played
+            if message['type'] == 'wait':
+                time.sleep(message['seconds'])
+                sendMessage(sock, {'type': 'ready'})
+            else:
+                counts = playUnit(Job(**message['job']), message['unit'])
+                played += 1
+                sendMessage(sock, {'type': 'result', 'unit': message['unit'], 'counts': counts})
+
+
+def startLocalWorkers(host, port, count):
+    '''
+    Starts worker processes on this machine, standing in for worker nodes.
+
+    Inputs:
+        host (str): Address of the coordinator.
+        port (int): Port of the coordinator.
+        count (int): Number of workers.
+
+    Returns (list): The started Process objects.
+    '''
+    import multiprocessing
+
+    workers = [multiprocessing.Process(target=runWorker, args=(host, port), daemon=True) for i in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+
+def distributed_tests():
+    '''
+    Tests for the coordinator and workers.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    for engine in ENGINES:
+        job = makeJob(masterSeed=35, seeds=40, unitSize=4, rounds=30, engine=engine)
+        expected = runLocal(job)
+        is_pass = (sum(expected) == 40 * 30 and runLocal(job) == expected)
+        assert is_pass == True, "fail the test"
+
+        # several local workers give the same result as one process
+        coordinator = Coordinator(job)
+        host, port = coordinator.getAddress()
+        workers = startLocalWorkers(host, port, 3)
+        is_pass = (coordinator.run(timeout=60) == expected)
+        assert is_pass == True, "fail the test"
+        for worker in workers:
+            worker.join(10)
+
+    # a worker that disconnects and one that never answers have their units played by others
+    job = makeJob(masterSeed=7, seeds=30, unitSize=3, rounds=20)
+    coordinator = Coordinator(job, lease=0.5)
+    host, port = coordinator.getAddress()
+    dead = socket.create_connection((host, port))
+    stuck = socket.create_connection((host, port))
+    result = []
+    thread = threading.Thread(target=lambda: result.append(coordinator.run(timeout=60)))
+    thread.start()
+    for sock in (dead, stuck):
+        sendMessage(sock, {'type': 'ready'})
+        is_pass = (receiveMessage(sock)['type'] == 'work')
+        assert is_pass == True, "fail the test"
+    dead.close()
+    workers = startLocalWorkers(host, port, 2)
+    thread.join(60)
+    stuck.close()
+    is_pass = (result == [runLocal(job)] and coordinator.getReissued() >= 2)
+    assert is_pass == True, "fail the test"
+    for worker in workers:
+        worker.join(10)
+    print('Results match a single process; %d units reissued' % coordinator.getReissued())
+
+
+if __name__ == "__main__":
+    distributed_tests()
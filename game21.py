@@ -0,0 +1,942 @@
+# Command-line entry point for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+#
+# Usage:
+#     python game21.py play [--deck FILE] [--seed N] [--hints]
+#     python game21.py replay --deck FILE --answers FILE [--seed N] [--hints]
+#     python game21.py simulate [--deck FILE] [--rounds N] [--seed N] [--policy NAME] [--engine table|batch] [--seats N] [--check] [--history DB]
+#     python game21.py tournament POLICY [POLICY ...] [--tables N] [--rounds N] [--seed N] [--antithetic] [--workers N]
+#     python game21.py corpus OUT (--generate N | --from-text FILE [FILE ...]) [--packed] [--seed N]
+#     python game21.py validate FILE [FILE ...]
+#     python game21.py sweep [--thresholds N,N] [--policies NAME,NAME] [--penetrations X,X] [--precision X] [--boundary X] [--workers N]
+#     python game21.py stress SCENARIO OUT [--size N] [--decks N] [--policy NAME] [--seed N]
+#     python game21.py coordinate [--seeds N] [--unit-size N] [--rounds N] [--seed N] [--port N] [--local-workers N]
+#     python game21.py worker HOST:PORT
+#     python game21.py report FILE [FILE ...] [--workers N]
+#     python game21.py fuzz [--rounds N] [--seed N] [--workers N]
+#     python game21.py optimize [--generations N] [--checkpoint FILE] [--count-edges N,N] [--rounds N] [--seed N]
+#     python game21.py memory [--tables N] [--rounds N] [--samples N] [--seats N] [--cache N] [--seed N]
+#     python game21.py bankroll [--sessions N] [--rounds N] [--bankroll X] [--bet flat|spread|kelly] [--pool N]
+#     python game21.py ruin [--rounds N] [--bankrolls N,N] [--policy NAME]
+#     python game21.py rare EVENT [--rounds N] [--seed N] [--policy NAME] [--player-tilt X] [--dealer-tilt X]
+#
+# Modules that are only needed by one subcommand (NumPy, the batch engine, the interactive
+# game) are imported inside that subcommand so starting a worker stays cheap.
+
+
+import argparse
+import random
+import sys
+import time
+
+
+# rounds played from each deck order by optimize with count buckets; a fresh deck lasts about
+# nine rounds, so these see most of the counts one deck goes through
+COUNT_ROUNDS = 8
+
+
+def play(args):
+    '''
+    Plays the interactive game.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): Exit status.
+    '''
+    import assignment2
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    assignment2.main(args.deck, hints=args.hints)
+    return 0
+
+
+def replay(args):
+    '''
+    Replays a game from a deck file and a file of recorded answers, one answer per line,
+    echoing every prompt and answer the way they appear in a terminal.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): Exit status.
+    '''
+    import assignment2
+
+    with open(args.answers, 'r') as file:
+        answers = [line.rstrip('\r\n') for line in file]
+    answers.reverse()
+
+    def ask(prompt):
+        # give the next recorded answer
+        if not answers:
+            raise EOFError('Ran out of answers in %s' % args.answers)
+        answer = answers.pop()
+        print(prompt + answer)
+        return answer
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    try:
+        assignment2.main(args.deck, ask, args.hints)
+    except EOFError as err:
+        print(err, file=sys.stderr)
+        return 1
+    return 0
+
+
+def simulate(args):
+    '''
+    Plays rounds automatically with a policy and displays how often each side won.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): Exit status.
+    '''
+    from autoPlay import parsePolicy
+    from gameRules import Rules
+
+    policy = parsePolicy(args.policy)
+    rules = Rules(args.stand_threshold, args.tie_policy, args.bust_limit)
+    start = time.perf_counter()
+    if args.engine == 'batch':
+        counts = simulateBatch(args, policy, rules)
+    else:
+        counts = simulateTable(args, policy, rules)
+    elapsed = time.perf_counter() - start
+
+    # display results
+    rounds = sum(counts.values())
+    for label, outcome in (('Player wins', 1), ('Ties', 0), ('Dealer wins', -1)):
+        print('%-12s %10d  (%.4f)' % (label + ':', counts[outcome], counts[outcome] / rounds))
+    print('%-12s %10d  in %.3f s (%.0f rounds/s)' % ('Rounds:', rounds, elapsed, rounds / elapsed))
+    return 0
+
+
+def simulateTable(args, policy, rules):
+    '''
+    Plays args.rounds rounds at one silent Table with args.seats seats.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+        policy (callable): The hit/stay policy.
+        rules (Rules): The rules of the game.
+
+    Returns (dict): Number of seat-rounds for each outcome (1, 0, -1).
+    '''
+    from autoPlay import playRounds, playSeatsRound
+    from invariants import makeTable
+    from playingCards import Deck, RANKS, SUITS
+
+    # the seed fixes both the starting deck and the repopulation shuffles
+    random.seed(args.seed)
+    if args.deck is not None:
+        deck = Deck(args.deck)
+    else:
+        codes = [rank + suit for rank in RANKS for suit in SUITS]
+        random.shuffle(codes)
+        deck = Deck(codes=codes)
+    # rounds become rows on the event bus's thread and are written by the history's writer
+    # process; events are queued in large batches to keep the game loop cheap
+    bus = history = None
+    if args.history is not None:
+        from handHistory import HandHistory
+        from roundEvents import EventBus
+        bus = EventBus(overflow='block', batchSize=2000)
+        history = HandHistory(args.history, args.seed, rules=rules)
+        bus.subscribe(history)
+    table = makeTable(rules, deck, verbose=False, events=bus, check=args.check or None, seats=args.seats)
+
+    if args.seats == 1:
+        outcomes = playRounds(table, policy, args.rounds)
+    else:
+        outcomes = [outcome for i in range(args.rounds) for outcome in playSeatsRound(table, policy)]
+    if bus is not None:
+        bus.close()
+        history.close()
+    return {outcome: outcomes.count(outcome) for outcome in (1, 0, -1)}
+
+
+def simulateBatch(args, policy, rules):
+    '''
+    Plays args.rounds rounds split over args.tables tables of a TableBatch.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+        policy (callable): The hit/stay policy.
+        rules (Rules): The rules of the game.
+
+    Returns (dict): Number of rounds for each outcome (1, 0, -1).
+    '''
+    import numpy as np
+    from tableBatch import TableBatch, ordersFromDecks, randomOrders
+    from playingCards import Deck
+
+    rng = np.random.default_rng(args.seed)
+    tables = max(1, min(args.tables, args.rounds))
+    if args.corpus is not None:
+        from deckCorpus import DeckCorpus
+        corpus = DeckCorpus(args.corpus)
+        orders = np.array(corpus.getOrders(0, tables))
+        tables = len(orders)
+        corpus.close()
+    elif args.deck is not None:
+        orders = np.repeat(ordersFromDecks([Deck(args.deck)]), tables, axis=0)
+    else:
+        orders = randomOrders(tables, rng)
+    batch = TableBatch(orders, rules, rng.integers(2 ** 32))
+
+    # play whole steps, then only count as many tables as needed from the last one
+    counts = {1: 0, 0: 0, -1: 0}
+    remaining = args.rounds
+    while remaining > 0:
+        outcomes = batch.playRound(policy)[:remaining]
+        for outcome in counts:
+            counts[outcome] += int(np.count_nonzero(outcomes == outcome))
+        remaining -= len(outcomes)
+    return counts
+
+
+def tournament(args):
+    '''
+    Plays several policies against the same deck orders and displays their paired differences.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): Exit status.
+    '''
+    from autoPlay import parsePolicy
+    from tournament import runTournament, pairedReport
+
+    policies = [parsePolicy(name) for name in args.policies]
+    start = time.perf_counter()
+    results = runTournament(policies, args.tables, args.rounds, args.seed, antithetic=args.antithetic,
+                            persistent=args.persistent, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    print(pairedReport(args.policies, results))
+    print('%d policies x %d rounds in %.2f s' % (len(policies), args.tables * args.rounds, elapsed))
+    return 0
+
+
+def corpus(args):
+    '''
+    Writes a binary deck corpus from random decks or from deck text files.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): Exit status.
+    '''
+    from deckCorpus import generateCorpus, textToCorpus
+
+    start = time.perf_counter()
+    if args.generate is not None:
+        count = generateCorpus(args.output, args.generate, args.seed, args.packed)
+    else:
+        count = textToCorpus(args.from_text, args.output, args.packed)
+    print('Wrote %d decks to %s in %.2f s' % (count, args.output, time.perf_counter() - start))
+    return 0
+
+
+def validate(args):
+    '''
+    Checks that each deck file holds 52 different valid cards.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): 0 if every file is valid, 1 otherwise.
+    '''
+    from playingCards import Deck
+
+    status = 0
+    for filename in args.files:
+        try:
+            Deck(filename)
+        except Exception as err:
+            print('%s: %s' % (filename, err))
+            status = 1
+        else:
+            print('%s: OK' % filename)
+    return status
+
+
+def sweep(args):
+    '''
+    Sweeps rule variants, policies and penetrations with adaptive round budgets, showing each
+    configuration as it finishes and a table of every result at the end.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): Exit status.
+    '''
+    from gameRules import Rules
+    from scheduler import AdaptiveScheduler, sweepConfigs, sweepReport
+
+    rules_list = [Rules(threshold, tie_policy, limit)
+                  for threshold in args.thresholds
+                  for tie_policy in args.tie_policies
+                  for limit in args.bust_limits]
+    configs = sweepConfigs(rules_list, args.policies, args.penetrations)
+    scheduler = AdaptiveScheduler(configs, args.precision, args.boundary, args.slice_rounds,
+                                  maxRounds=args.max_rounds, seed=args.seed, workers=args.workers)
+
+    start = time.perf_counter()
+    finished = set()
+    for progress in scheduler.run():
+        # slices still being played can come back after a configuration has finished
+        if progress.status != 'running' and progress.index not in finished:
+            finished.add(progress.index)
+            config = configs[progress.index]
+            print('[%6.1f s] %d/%d %d/%s/%d %s pen %.2f: %+.4f +- %.4f after %d rounds (%s)'
+                  % (time.perf_counter() - start, len(finished), len(configs), *config.rules, config.policy,
+                     config.penetration, progress.mean, progress.halfWidth, progress.rounds, progress.status))
+    print(sweepReport(scheduler.getResults(), args.boundary))
+    fixed = max(result.rounds for result in scheduler.getResults()) * len(configs)
+    print('%d rounds in %.1f s; the same precision for every configuration takes %d rounds (%.0f%%)'
+          % (scheduler.getRoundsPlayed(), time.perf_counter() - start, fixed,
+             100 * scheduler.getRoundsPlayed() / fixed))
+    return 0
+
+
+def stress(args):
+    '''
+    Builds deck files that force a scenario when played with the policy, checking each one at a table.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): 0 if every deck was found, 1 otherwise.
+    '''
+    import os
+    from autoPlay import parsePolicy
+    from deckSearch import DeckSearch, checkScenario, writeDeck
+    from gameRules import Rules
+
+    policy = parsePolicy(args.policy)
+    rules = Rules(args.stand_threshold, args.tie_policy, args.bust_limit)
+    search = DeckSearch(policy, rules, args.seed)
+    stem, extension = os.path.splitext(args.out)
+    for i in range(args.decks):
+        codes = search.build(args.scenario, args.size)
+        if codes is None or not checkScenario(codes, args.scenario, args.size, policy, rules):
+            print('No deck found for %s after %d partial orders' % (args.scenario, search.getNodes()))
+            return 1
+        filename = args.out if args.decks == 1 else '%s_%d%s' % (stem, i + 1, extension)
+        writeDeck(codes, filename)
+        print('%s: %s after %d partial orders' % (filename, args.scenario, search.getNodes()))
+    return 0
+
+
+def coordinate(args):
+    '''
+    Hands out a simulation to workers over TCP and displays the merged result.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): Exit status.
+    '''
+    from distributed import Coordinator, makeJob, startLocalWorkers
+    from gameRules import Rules
+
+    rules = Rules(args.stand_threshold, args.tie_policy, args.bust_limit)
+    job = makeJob(args.seed, args.seeds, args.unit_size, args.rounds, args.policy, rules, args.engine)
+    coordinator = Coordinator(job, args.host, args.port, args.lease)
+    host, port = coordinator.getAddress()
+    print('Listening on %s:%d' % (host, port), flush=True)
+    startLocalWorkers(host, port, args.local_workers)
+
+    start = time.perf_counter()
+    counts = coordinator.run()
+    rounds = sum(counts)
+    for label, count in zip(('Player wins', 'Ties', 'Dealer wins'), counts):
+        print('%-12s %10d  (%.4f)' % (label + ':', count, count / rounds))
+    print('%-12s %10d  in %.2f s, %d units reissued' % ('Rounds:', rounds, time.perf_counter() - start,
+                                                       coordinator.getReissued()))
+    return 0
+
+
+def worker(args):
+    '''
+    Plays work units for a coordinator.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): Exit status.
+    '''
+    from distributed import runWorker
+
+    host, port = args.address
+    print('Played %d units' % runWorker(host, port))
+    return 0
+
+
+def report(args):
+    '''
+    Parses game transcripts and displays a summary of the rounds in them.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): Exit status.
+    '''
+    from transcripts import summarizeFiles
+
+    start = time.perf_counter()
+    summary = summarizeFiles(args.files, args.workers)
+    print(summary.report())
+    print('Parsed %d rounds in %.2f s' % (summary.getRounds(), time.perf_counter() - start))
+    return 0
+
+
+def fuzz(args):
+    '''
+    Plays random decisions on random decks and fuzzes deck files with invariant checks on.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): Exit status.
+    '''
+    from invariants import fuzzParallel
+
+    start = time.perf_counter()
+    rounds, files = fuzzParallel(args.rounds, args.seed, args.workers)
+    print('Checked %d rounds and %d deck files in %.2f s' % (rounds, files, time.perf_counter() - start))
+    return 0
+
+
+def rare(args):
+    '''
+    Estimates the chance of a rare kind of round with importance sampling.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): Exit status.
+    '''
+    import numpy as np
+    from autoPlay import parsePolicy
+    from gameRules import Rules
+    from rareEvents import EVENT_TILTS, ImportanceSampler, tiltWeights
+
+    player_tilt, dealer_tilt = EVENT_TILTS[args.event]
+    if args.player_tilt is not None:
+        player_tilt = args.player_tilt
+    if args.dealer_tilt is not None:
+        dealer_tilt = args.dealer_tilt
+    rules = Rules(args.stand_threshold, args.tie_policy, args.bust_limit)
+    sampler = ImportanceSampler(parsePolicy(args.policy), rules, tiltWeights(player_tilt), tiltWeights(dealer_tilt))
+
+    start = time.perf_counter()
+    estimate = sampler.estimate(args.event, args.rounds, np.random.default_rng(args.seed))
+    elapsed = time.perf_counter() - start
+    print('%-12s %.4e +- %.1e' % (args.event + ':', estimate.probability, estimate.standardError))
+    print('%-12s %10d of %d rounds, effective sample size %.0f' % ('Hits:', estimate.hits, estimate.rounds,
+                                                                    estimate.effectiveSamples))
+    print('%-12s %.3e fair rounds for the same error (%.1fx), in %.2f s'
+          % ('Worth:', estimate.plainRounds, estimate.plainRounds / estimate.rounds, elapsed))
+    return 0
+
+
+def optimize(args):
+    '''
+    Searches for the best hit/stay table, optionally split by running count, and displays it.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): Exit status.
+    '''
+    from gameRules import Rules
+    from policyOptimizer import CrossEntropySearch, strategyText
+
+    rules = Rules(args.stand_threshold, args.tie_policy, args.bust_limit)
+    edges = args.count_edges or []
+    tags = None
+    if edges:
+        # count the cards by their effects of removal
+        from bankroll import countTagsFor
+        tags = countTagsFor(rules)
+    rounds = args.rounds
+    if rounds is None:
+        rounds = COUNT_ROUNDS if edges else 1
+    search = CrossEntropySearch(rules, edges, tags, args.candidates, args.tables, rounds,
+                                seed=args.seed, checkpoint=args.checkpoint)
+    if search.getGeneration() > 0:
+        print('Resuming from generation %d' % search.getGeneration())
+
+    start = time.perf_counter()
+    while search.getGeneration() < args.generations:
+        score = search.step()
+        print('Generation %d: best %.5f (%.0f s)' % (search.getGeneration(), score, time.perf_counter() - start),
+              flush=True)
+    if args.polish:
+        print('Kept %d polishing moves' % search.polish())
+
+    hits = search.getPolicy().getHits()
+    if not edges:
+        print(strategyText(hits))
+    for bucket in range(len(edges) + 1 if edges else 0):
+        low = '' if bucket == 0 else '%d <= ' % edges[bucket - 1]
+        high = '' if bucket == len(edges) else ' < %d' % edges[bucket]
+        print('Count bucket %srunning count%s:' % (low, high))
+        print(strategyText(hits[bucket]))
+    return 0
+
+
+def memory(args):
+    '''
+    Plays many live tables while sampling memory and displays where the memory goes.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): Exit status.
+    '''
+    from memoryReport import sessionReport
+
+    print(sessionReport(args.tables, args.rounds, args.samples, args.seats, args.cache, args.seed))
+    return 0
+
+
+def bankroll(args):
+    '''
+    Simulates bankrolls over many sessions with a betting strategy and displays ruin rates,
+    drawdowns and percentile curves.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): Exit status.
+    '''
+    from autoPlay import parsePolicy
+    from bankroll import (CountSpread, FlatBet, KellyBet, bankrollReport, countAdvantages, playOutcomes,
+                          simulateBankrolls)
+    from gameRules import Rules
+
+    policy = parsePolicy(args.policy)
+    rules = Rules(args.stand_threshold, args.tie_policy, args.bust_limit)
+    edges = args.count_edges or []
+    units = args.units
+    if args.bet == 'flat':
+        betting = FlatBet(units[0])
+    elif args.bet == 'spread':
+        betting = CountSpread(edges, units)
+    else:
+        # the advantage at each count comes from a pilot run
+        advantages, variance = countAdvantages(*playOutcomes(20000, args.rounds, policy, rules, seed=args.seed),
+                                               edges)
+        print('Advantage by count bucket: %s' % ' '.join('%+.4f' % advantage for advantage in advantages))
+        betting = KellyBet(args.kelly_fraction, edges, advantages, variance, args.min_bet)
+
+    start = time.perf_counter()
+    result = simulateBankrolls(args.sessions, args.rounds, betting, args.bankroll, policy, rules,
+                               minBet=args.min_bet, seed=args.seed, pool=args.pool, block=args.block)
+    print(bankrollReport(result, args.bankroll))
+    print('%d sessions x %d rounds in %.1f s' % (args.sessions, args.rounds, time.perf_counter() - start))
+    return 0
+
+
+def ruin(args):
+    '''
+    Displays the exact distribution of a session's net result and its risk of ruin.
+
+    Inputs:
+        args (Namespace): Parsed command-line arguments.
+
+    Returns (int): Exit status.
+    '''
+    from autoPlay import parsePolicy
+    from gameRules import Rules
+    from riskOfRuin import roundChances, ruinReport
+
+    rules = Rules(args.stand_threshold, args.tie_policy, args.bust_limit)
+    start = time.perf_counter()
+    chances = roundChances(parsePolicy(args.policy), rules)
+    print(ruinReport(chances, args.rounds, args.bankrolls))
+    print('Found in %.1f ms' % ((time.perf_counter() - start) * 1000))
+    return 0
+
+
+def intRange(low, high=None):
+    '''
+    Returns an argparse type that reads an int from low to high.
+
+    Inputs:
+        low (int): Smallest value allowed; no smallest if None.
+        high (int): Largest value allowed; no largest if not given.
+
+    Returns (callable): Turns the option's text into an int or raises ArgumentTypeError.
+    '''
+    def parse(text):
+        # read the int and check its range
+        try:
+            value = int(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError('%r is not an int' % text)
+        if (low is not None and value < low) or (high is not None and value > high):
+            if high is None:
+                raise argparse.ArgumentTypeError('must be at least %d' % low)
+            raise argparse.ArgumentTypeError('must be from %d to %d' % (low, high))
+        return value
+
+    return parse
+
+
+def floatRange(low, high=None, lowAllowed=False):
+    '''
+    Returns an argparse type that reads a number above low (or equal to it if lowAllowed)
+    and at most high.
+
+    Inputs:
+        low (float): Lower bound.
+        high (float): Largest value allowed; no largest if not given.
+        lowAllowed (bool): True if low itself is allowed.
+
+    Returns (callable): Turns the option's text into a float or raises ArgumentTypeError.
+    '''
+    def parse(text):
+        # read the number and check its range; NaN fails every comparison
+        try:
+            value = float(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError('%r is not a number' % text)
+        above = value >= low if lowAllowed else value > low
+        if not (above and (high is None or value <= high)):
+            bound = ('at least %g' if lowAllowed else 'above %g') % low
+            if high is not None:
+                bound += ' and at most %g' % high
+            raise argparse.ArgumentTypeError('%r must be %s' % (text, bound))
+        return value
+
+    return parse
+
+
+def oneOf(choices):
+    '''
+    Returns an argparse type that accepts one of the choices, for use in lists.
+
+    Inputs:
+        choices (tuple): The strings allowed.
+
+    Returns (callable): Returns the option's text or raises ArgumentTypeError.
+    '''
+    def parse(text):
+        if text not in choices:
+            raise argparse.ArgumentTypeError('%r is not one of %s' % (text, ', '.join(choices)))
+        return text
+
+    return parse
+
+
+def listOf(parse, increasing=False):
+    '''
+    Returns an argparse type that reads a comma-separated list, each item read with parse.
+
+    Inputs:
+        parse (callable): Reads one item, raising ArgumentTypeError if it is not valid.
+        increasing (bool): True if each item must be above the one before.
+
+    Returns (callable): Turns the option's text into a list or raises ArgumentTypeError.
+    '''
+    def parseList(text):
+        values = []
+        for item in text.split(','):
+            try:
+                values.append(parse(item.strip()))
+            except argparse.ArgumentTypeError as err:
+                raise argparse.ArgumentTypeError('in %r: %s' % (text, err))
+        if increasing and any(first >= second for first, second in zip(values, values[1:])):
+            raise argparse.ArgumentTypeError('%r must be in increasing order' % text)
+        return values
+
+    return parseList
+
+
+def hostPort(text):
+    '''
+    Reads a HOST:PORT address for argparse.
+
+    Inputs:
+        text (str): The option's text.
+
+    Returns (tuple): (host, port), or raises ArgumentTypeError.
+    '''
+    host, colon, port = text.rpartition(':')
+    if not colon or not host:
+        raise argparse.ArgumentTypeError('%r is not HOST:PORT' % text)
+    return host, intRange(1, 65535)(port)
+
+
+def makeParser():
+    '''
+    Returns the argument parser for the command line.
+
+    Inputs: N/A
+    '''
+    from gameRules import MAX_BUST_LIMIT, TIE_POLICIES
+    from simple21 import MAX_SEATS
+
+    parser = argparse.ArgumentParser(prog='game21', description='Simplified 21 card game.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    positive = intRange(1)
+    # NumPy generators only take seeds of 0 or more
+    seed = intRange(0)
+    edges = listOf(intRange(None), increasing=True)
+
+    # rule variant options shared by every subcommand that plays or models rounds
+    rules_parser = argparse.ArgumentParser(add_help=False)
+    rules_parser.add_argument('--stand-threshold', type=intRange(1, MAX_BUST_LIMIT), default=17,
+                              help='dealer stands on this (default 17)')
+    rules_parser.add_argument('--tie-policy', choices=TIE_POLICIES, default='push')
+    rules_parser.add_argument('--bust-limit', type=intRange(1, MAX_BUST_LIMIT), default=21,
+                              help='highest total that is not bust, at most %d (default 21)' % MAX_BUST_LIMIT)
+
+    command = commands.add_parser('play', help='play the interactive game')
+    command.add_argument('--deck', help='deck file (asked for if not given)')
+    command.add_argument('--seed', type=int, help='seed for repopulation shuffles')
+    command.add_argument('--hints', action='store_true', help='show the chances of winning by hitting and by staying')
+    command.set_defaults(run=play)
+
+    command = commands.add_parser('replay', help='replay a game from recorded answers')
+    command.add_argument('--deck', required=True, help='deck file')
+    command.add_argument('--answers', required=True, help='file of answers, one per line')
+    command.add_argument('--seed', type=int, help='seed for repopulation shuffles')
+    command.add_argument('--hints', action='store_true', help='show the chances of winning by hitting and by staying')
+    command.set_defaults(run=replay)
+
+    command = commands.add_parser('simulate', parents=[rules_parser], help='play rounds automatically with a policy')
+    command.add_argument('--deck', help='deck file to start from (random deck if not given)')
+    command.add_argument('--rounds', type=positive, default=1000, help='number of rounds (default 1000)')
+    command.add_argument('--seed', type=seed, help='seed for decks and shuffles')
+    command.add_argument('--policy', default='stand17', help="hit/stay policy, e.g. 'stand17' or 'never'")
+    command.add_argument('--engine', choices=('table', 'batch'), default='table',
+                         help='play one Table or a NumPy TableBatch (default table)')
+    command.add_argument('--tables', type=positive, default=10000, help='tables in a batch (default 10000)')
+    command.add_argument('--history', help='SQLite file to store every round in (table engine)')
+    command.add_argument('--seats', type=intRange(1, MAX_SEATS), default=1,
+                         help='players at the table (table engine, default 1)')
+    command.add_argument('--corpus', help='deck corpus giving the starting deck of each batch table')
+    command.add_argument('--check', action='store_true',
+                         help='check card invariants every round (table engine; also GAME21_CHECK=1)')
+    command.set_defaults(run=simulate)
+
+    command = commands.add_parser('tournament', help='compare policies on common deck orders')
+    command.add_argument('policies', nargs='+', help="policies to compare, the first is the baseline")
+    command.add_argument('--tables', type=positive, default=10000, help='tables per policy (default 10000)')
+    command.add_argument('--rounds', type=positive, default=100, help='rounds per table (default 100)')
+    command.add_argument('--seed', type=seed, default=0, help='seed shared by every policy (default 0)')
+    command.add_argument('--antithetic', action='store_true', help='pair each deck with its rank complement')
+    command.add_argument('--persistent', action='store_true', help='keep each deck with repopulation between rounds')
+    command.add_argument('--workers', type=positive, default=1, help='processes to play policies in parallel')
+    command.set_defaults(run=tournament)
+
+    command = commands.add_parser('corpus', help='write a binary deck corpus')
+    command.add_argument('output', help='corpus file to write')
+    source = command.add_mutually_exclusive_group(required=True)
+    source.add_argument('--generate', type=positive, metavar='N', help='write N random decks')
+    source.add_argument('--from-text', nargs='+', metavar='FILE', help='convert deck text files')
+    command.add_argument('--packed', action='store_true', help='store 29 byte Lehmer codes')
+    command.add_argument('--seed', type=seed, help='seed for random decks')
+    command.set_defaults(run=corpus)
+
+    command = commands.add_parser('validate', help='check deck files')
+    command.add_argument('files', nargs='+', help='deck files')
+    command.set_defaults(run=validate)
+
+    command = commands.add_parser('sweep', help='sweep configurations with adaptive round budgets')
+    command.add_argument('--thresholds', type=listOf(intRange(1, MAX_BUST_LIMIT)), default=[15, 16, 17, 18],
+                         help='dealer stand thresholds (default 15,16,17,18)')
+    command.add_argument('--tie-policies', type=listOf(oneOf(TIE_POLICIES)), default=['push'],
+                         help='tie policies, e.g. push,dealer (default push)')
+    command.add_argument('--bust-limits', type=listOf(intRange(1, MAX_BUST_LIMIT)), default=[21],
+                         help='bust limits (default 21)')
+    command.add_argument('--policies', type=listOf(str), default=['stand13', 'stand15', 'stand17'],
+                         help='hit/stay policies (default stand13,stand15,stand17)')
+    command.add_argument('--penetrations', type=listOf(floatRange(0, 1)), default=[1.0],
+                         help='shares of the deck dealt before a new deck, above 0 and at most 1 (default 1.0)')
+    command.add_argument('--precision', type=floatRange(0), default=0.01,
+                         help='interval half width to reach (default 0.01)')
+    command.add_argument('--boundary', type=float, help='expected outcome that decides a configuration')
+    command.add_argument('--slice-rounds', type=positive, default=2000, help='rounds in each slice (default 2000)')
+    command.add_argument('--max-rounds', type=positive, default=1000000, help='most rounds per configuration')
+    command.add_argument('--workers', type=positive, default=1, help='number of processes (default 1)')
+    command.add_argument('--seed', type=seed, default=0, help='seed (default 0)')
+    command.set_defaults(run=sweep)
+
+    command = commands.add_parser('stress', parents=[rules_parser], help='build deck files that force an edge case')
+    command.add_argument('scenario', choices=('dealer-repopulate', 'player-repopulate', 'deal-repopulate',
+                                              'long-player-hand', 'long-dealer-hand', 'natural-streak'))
+    command.add_argument('out', help='deck file to write; with --decks, a number is added to each name')
+    command.add_argument('--size', type=positive, help='hand length or naturals in a row (default 10, 10 and 5)')
+    command.add_argument('--decks', type=positive, default=1, help='number of deck files (default 1)')
+    command.add_argument('--policy', default='stand17', help="hit/stay policy, e.g. 'stand17' or 'never'")
+    command.add_argument('--seed', type=seed, help='seed for the search')
+    command.set_defaults(run=stress)
+
+    command = commands.add_parser('coordinate', parents=[rules_parser],
+                                  help='hand out a simulation to workers over TCP')
+    command.add_argument('--seeds', type=positive, default=1000, help='number of tables, one per seed (default 1000)')
+    command.add_argument('--unit-size', type=positive, default=100, help='seeds in each work unit (default 100)')
+    command.add_argument('--rounds', type=positive, default=100, help='rounds per table (default 100)')
+    command.add_argument('--seed', type=seed, default=0, help='master seed (default 0)')
+    command.add_argument('--policy', default='stand17', help="hit/stay policy, e.g. 'stand17' or 'never'")
+    command.add_argument('--engine', choices=('table', 'batch'), default='table')
+    command.add_argument('--host', default='127.0.0.1', help='address to listen on (default 127.0.0.1)')
+    command.add_argument('--port', type=intRange(0, 65535), default=0, help='port to listen on (default any free port)')
+    command.add_argument('--lease', type=floatRange(0), default=60.0,
+                         help='seconds before a unit is reissued (default 60)')
+    command.add_argument('--local-workers', type=intRange(0), default=0,
+                         help='worker processes to start on this machine')
+    command.set_defaults(run=coordinate)
+
+    command = commands.add_parser('worker', help='play work units for a coordinator')
+    command.add_argument('address', type=hostPort, help='HOST:PORT of the coordinator')
+    command.set_defaults(run=worker)
+
+    command = commands.add_parser('report', help='summarize game transcripts')
+    command.add_argument('files', nargs='+', help='transcript files')
+    command.add_argument('--workers', type=positive, default=1, help='processes to parse chunks in parallel')
+    command.set_defaults(run=report)
+
+    command = commands.add_parser('fuzz', help='fuzz the game with invariant checks on')
+    command.add_argument('--rounds', type=positive, default=1000000, help='number of rounds (default 1000000)')
+    command.add_argument('--seed', type=seed, default=0, help='seed of the first worker (default 0)')
+    command.add_argument('--workers', type=positive, help='processes to fuzz in (default one per CPU)')
+    command.set_defaults(run=fuzz)
+
+    command = commands.add_parser('rare', parents=[rules_parser],
+                                  help='estimate the chance of a rare round with importance sampling')
+    command.add_argument('event', choices=('dealer5', 'player21six'),
+                         help='dealer ends with 5+ cards, or player reaches 21 (the bust limit) with 6+ cards')
+    command.add_argument('--rounds', type=positive, default=1000000, help='number of rounds (default 1000000)')
+    command.add_argument('--seed', type=seed, help='seed for the dealing')
+    command.add_argument('--policy', default='stand17', help="hit/stay policy, e.g. 'stand17' or 'never'")
+    command.add_argument('--player-tilt', type=float, help="how strongly the player's cards favour low values")
+    command.add_argument('--dealer-tilt', type=float, help="how strongly the dealer's cards favour low values")
+    command.set_defaults(run=rare)
+
+    command = commands.add_parser('optimize', parents=[rules_parser], help='search for the best hit/stay table')
+    command.add_argument('--generations', type=positive, default=60, help='generations to reach (default 60)')
+    command.add_argument('--checkpoint', help='file the search is saved to and resumed from')
+    command.add_argument('--count-edges', type=edges,
+                         help='increasing running counts where count buckets start, e.g. --count-edges=-2,2')
+    command.add_argument('--candidates', type=positive, default=50, help='tables tried per generation (default 50)')
+    command.add_argument('--tables', type=positive, default=10000, help='deck orders per candidate (default 10000)')
+    command.add_argument('--rounds', type=positive,
+                         help='rounds from each deck order (default 1, or %d with --count-edges, '
+                              'which needs at least 2)' % COUNT_ROUNDS)
+    command.add_argument('--polish', action='store_true', help='fine-tune the result on a million deck orders')
+    command.add_argument('--seed', type=seed, help='seed for the search')
+    command.set_defaults(run=optimize)
+
+    command = commands.add_parser('memory', help='report memory use by game component')
+    command.add_argument('--tables', type=positive, default=1000, help='live tables (default 1000)')
+    command.add_argument('--rounds', type=positive, default=1000, help='rounds at each table (default 1000)')
+    command.add_argument('--samples', type=positive, default=8, help='memory samples while playing (default 8)')
+    command.add_argument('--seats', type=intRange(1, MAX_SEATS), default=1, help='players at each table (default 1)')
+    command.add_argument('--cache', type=intRange(0), default=0,
+                         help='compositions to fill a removal-effects cache with (default 0)')
+    command.add_argument('--seed', type=seed, help='seed for decks and shuffles')
+    command.set_defaults(run=memory)
+
+    command = commands.add_parser('bankroll', parents=[rules_parser], help='simulate bankrolls with a betting strategy')
+    command.add_argument('--sessions', type=positive, default=100000, help='number of sessions (default 100000)')
+    command.add_argument('--rounds', type=positive, default=100, help='rounds in each session (default 100)')
+    command.add_argument('--bankroll', type=floatRange(0), default=100.0, help='starting bankroll (default 100)')
+    command.add_argument('--min-bet', type=floatRange(0), default=1.0,
+                         help='smallest bet; ruin is below it (default 1)')
+    command.add_argument('--bet', choices=('flat', 'spread', 'kelly'), default='flat')
+    command.add_argument('--units', type=listOf(floatRange(0, lowAllowed=True)), default=[1.0],
+                         help='flat bet, or the bet of each count bucket, e.g. 1,2,5')
+    command.add_argument('--count-edges', type=edges,
+                         help='increasing running counts where count buckets start, e.g. --count-edges=1,3')
+    command.add_argument('--kelly-fraction', type=floatRange(0), default=0.5,
+                         help='share of the Kelly bet (default 0.5)')
+    command.add_argument('--pool', type=positive, help='play this many sessions and build the rest from them')
+    command.add_argument('--block', type=positive, default=10, help='rounds in each resampled run (default 10)')
+    command.add_argument('--policy', default='stand17', help="hit/stay policy, e.g. 'stand17' or 'never'")
+    command.add_argument('--seed', type=seed, default=0, help='seed (default 0)')
+    command.set_defaults(run=bankroll)
+
+    command = commands.add_parser('ruin', parents=[rules_parser],
+                                  help='exact session outcomes and risk of ruin with unit bets')
+    command.add_argument('--rounds', type=positive, default=1000, help='rounds in the session (default 1000)')
+    command.add_argument('--bankrolls', type=listOf(intRange(0)), default=[10, 25, 50, 100, 200],
+                         help='starting bankrolls in units (default 10,25,50,100,200)')
+    command.add_argument('--policy', default='stand17', help="hit/stay policy, e.g. 'stand17' or 'never'")
+    command.set_defaults(run=ruin)
+
+    return parser
+
+
+def main(argv=None):
+    '''
+    Runs the command given on the command line.
+
+    Inputs:
+        argv (list): Command-line arguments; sys.argv[1:] if not given.
+
+    Returns (int): Exit status.
+    '''
+    parser = makeParser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'bust_limit', None) is not None and args.stand_threshold > args.bust_limit:
+        parser.error('--stand-threshold must not be above --bust-limit')
+    if getattr(args, 'seats', 1) > 1 and getattr(args, 'bust_limit', None) is not None:
+        from gameRules import Rules
+        max_seats = Rules(args.stand_threshold, args.tie_policy, args.bust_limit).getMaxSeats()
+        if args.seats > max_seats:
+            parser.error('--seats must be at most %d with --bust-limit %d, or one deck can run out '
+                         'part way through a round' % (max_seats, args.bust_limit))
+    if args.run is optimize and args.count_edges and args.rounds == 1:
+        # the first round from a fresh deck order always has a running count of 0
+        parser.error('--count-edges needs --rounds of at least 2')
+    if args.run is sweep and max(args.thresholds) > min(args.bust_limits):
+        parser.error('every --thresholds value must be at most every --bust-limits value')
+    if getattr(args, 'corpus', None) is not None:
+        from deckCorpus import DeckCorpus
+        try:
+            corpus = DeckCorpus(args.corpus)
+        except Exception as err:
+            parser.error(str(err))
+        if corpus.size() == 0:
+            parser.error('--corpus %s holds no decks' % args.corpus)
+        corpus.close()
+    if args.run is tournament and args.antithetic and args.tables % 2 == 1:
+        parser.error('--antithetic pairs the tables, so --tables must be even')
+    if args.run is bankroll:
+        if args.bet == 'spread' and len(args.units) != len(args.count_edges or []) + 1:
+            parser.error('--bet spread needs one --units value for each count bucket (%d)'
+                         % (len(args.count_edges or []) + 1))
+        if args.bet == 'flat' and args.units[0] <= 0:
+            parser.error('--units must be above 0 for a flat bet')
+        if args.pool is not None and args.block > args.rounds:
+            parser.error('--block must be at most --rounds')
+
+    # every policy name is checked before anything is played
+    names = list(getattr(args, 'policies', None) or [])
+    if isinstance(getattr(args, 'policy', None), str):
+        names.append(args.policy)
+    if names:
+        from autoPlay import parsePolicy
+        for name in names:
+            try:
+                parsePolicy(name)
+            except ValueError as err:
+                parser.error(str(err))
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
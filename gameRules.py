@@ -0,0 +1,301 @@
+# Rules class for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+
+
+TIE_POLICIES = ('push', 'dealer', 'player')
+
+# highest bust limit: one 52-card deck always has cards left for a one-seat round, and hand
+# totals fit in the 6 bits that composition cache keys give them; with more seats the deck
+# runs out at lower limits, see Rules.getMaxSeats
+MAX_BUST_LIMIT = 63
+
+# card values of a deck, smallest first
+DECK_VALUES = sorted([min(rank, 10) for rank in range(1, 14)] * 4)
+
+# integer codes for who won a round
+OUTCOME_VALUES = {'player': 1, 'tie': 0, 'dealer': -1}
+
+
+class Rules:
+    # Dealer rule and tie handling used by a Table.
+
+    def __init__(self, standThreshold=17, tiePolicy='push', bustLimit=21):
+        '''
+        Initializes the Rules class.
+
+        Inputs:
+            standThreshold (int): The dealer keeps taking cards while the hand value is below this.
+            tiePolicy (str): Who wins when both hands are equally close to the bust limit;
+                one of 'push', 'dealer' or 'player'.
+            bustLimit (int): The highest hand value that is not bust.
+
+        Returns: None
+        '''
+        # check input
+        assert isinstance(standThreshold, int), 'Error: standThreshold must be an int'
+        assert isinstance(bustLimit, int) and 0 < bustLimit <= MAX_BUST_LIMIT, \
+            'Error: bustLimit must be an int between 1 and %d' % MAX_BUST_LIMIT
+        assert 0 < standThreshold <= bustLimit, 'Error: standThreshold must be between 1 and bustLimit'
+        assert tiePolicy in TIE_POLICIES, 'Error: tiePolicy must be one of %s' % (TIE_POLICIES, )
+
+        # create attributes
+        self.__standThreshold = standThreshold
+        self.__tiePolicy = tiePolicy
+        self.__bustLimit = bustLimit
+
+
+    def getStandThreshold(self):
+        '''
+        Returns the hand value at which the dealer stops taking cards.
+
+        Inputs:
+            self is the Rules.
+        '''
+        return self.__standThreshold
+
+
+    def getTiePolicy(self):
+        '''
+        Returns the tie policy ('push', 'dealer' or 'player').
+
+        Inputs:
+            self is the Rules.
+        '''
+        return self.__tiePolicy
+
+
+    def getBustLimit(self):
+        '''
+        Returns the highest hand value that is not bust.
+
+        Inputs:
+            self is the Rules.
+        '''
+        return self.__bustLimit
+
+
+    def dealerMustHit(self, value):
+        '''
+        Returns True if the dealer has to take another card with a hand of the given value.
+
+        Inputs:
+            self is the Rules.
+            value (int): The value of the dealer's hand.
+        '''
+        return value < self.__standThreshold
+
+
+    def isBust(self, value):
+        '''
+        Returns True if a hand of the given value has gone bust.
+
+        Inputs:
+            self is the Rules.
+            value (int): The value of the hand.
+        '''
+        return value > self.__bustLimit
+
+
+    def isNatural(self, value):
+        '''
+        Returns True if a hand of the given value is exactly the bust limit.
+
+        Inputs:
+            self is the Rules.
+            value (int): The value of the hand.
+        '''
+        return value == self.__bustLimit
+
+
+    def compare(self, playerValue, dealerValue):
+        '''
+        Compares two hands that have not gone bust and finds who wins.
+
+        Inputs:
+            self is the Rules.
+            playerValue (int): The value of the player's hand.
+            dealerValue (int): The value of the dealer's hand.
+
+        Returns (str): 'player', 'dealer' or 'tie'.
+        '''
+        # find how close to the limit both are
+        player_difference = self.__bustLimit - playerValue
+        dealer_difference = self.__bustLimit - dealerValue
+
+        # check who is closer
+        if player_difference > dealer_difference:
+            return 'dealer'
+        elif player_difference < dealer_difference:
+            return 'player'
+        elif self.__tiePolicy == 'push':
+            return 'tie'
+        else:
+            return self.__tiePolicy
+
+
+    def getMaxSeats(self):
+        '''
+        Returns the most seats a Table with these rules can have without its deck running
+        out part way through a round. Before its last card, every hand is at most the bust
+        limit, so the hands on the table hold at most the smallest cards that add up to
+        (seats + 1) x bustLimit, plus one last card each; that has to fit in 52 cards.
+
+        Inputs:
+            self is the Rules.
+        '''
+        seats = 0
+        while seats < 52:
+            hands = seats + 2
+            budget = hands * self.__bustLimit
+            cards = hands
+            for value in DECK_VALUES:
+                if value > budget:
+                    break
+                budget -= value
+                cards += 1
+            if cards > 52:
+                break
+            seats += 1
+        return seats
+
+
+    def __eq__(self, other):
+        '''
+        Returns True if both Rules instances describe the same game.
+
+        Inputs:
+            self is the Rules.
+            other (Rules): The Rules to compare with.
+        '''
+        if not isinstance(other, Rules):
+            return NotImplemented
+        return self.key() == other.key()
+
+
+    def __hash__(self):
+        '''
+        Returns a hash so Rules can be used as dictionary keys.
+
+        Inputs:
+            self is the Rules.
+        '''
+        return hash(self.key())
+
+
+    def key(self):
+        '''
+        Returns a tuple (standThreshold, tiePolicy, bustLimit) identifying the Rules.
+
+        Inputs:
+            self is the Rules.
+        '''
+        return (self.__standThreshold, self.__tiePolicy, self.__bustLimit)
+
+
+    def __repr__(self):
+        '''
+        Returns a formal string representation of the Rules.
+
+        Inputs:
+            self is the Rules.
+        '''
+        return 'Rules(standThreshold=%d, tiePolicy=%r, bustLimit=%d)' % self.key()
+
+
+
+def rules_tests():
+    '''
+    Tests for the Rules class.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    rules = Rules()
+
+    # default rules match the original game
+    assert rules.dealerMustHit(16) == True, "fail the test"
+    assert rules.dealerMustHit(17) == False, "fail the test"
+    assert rules.isBust(22) == True, "fail the test"
+    assert rules.isBust(21) == False, "fail the test"
+    assert rules.isNatural(21) == True, "fail the test"
+    assert rules.compare(20, 19) == 'player', "fail the test"
+    assert rules.compare(18, 19) == 'dealer', "fail the test"
+    assert rules.compare(18, 18) == 'tie', "fail the test"
+
+    # changed tie policy and limits
+    rules = Rules(standThreshold=18, tiePolicy='dealer', bustLimit=24)
+    assert rules.dealerMustHit(17) == True, "fail the test"
+    assert rules.isBust(24) == False, "fail the test"
+    assert rules.compare(18, 18) == 'dealer', "fail the test"
+    assert rules == Rules(18, 'dealer', 24), "fail the test"
+    print(repr(rules))
+
+    # a bust limit past what one deck can deal is refused
+    try:
+        Rules(bustLimit=MAX_BUST_LIMIT + 1)
+        is_pass = False
+    except AssertionError:
+        is_pass = True
+    assert is_pass == True, "fail the test"
+
+    # at the highest limit, a player hitting to the limit never runs the deck out
+    import gameRules
+    import random
+    from playingCards import Deck, RANKS, SUITS
+    from simple21 import Table
+
+    random.seed(26)
+    codes = [rank + suit for rank in RANKS for suit in SUITS]
+    random.shuffle(codes)
+    # Table checks for the Rules class of the gameRules module, not of this script
+    rules = gameRules.Rules(standThreshold=MAX_BUST_LIMIT - 3, bustLimit=MAX_BUST_LIMIT)
+    table = Table(rules=rules, deck=Deck(codes=codes), verbose=False)
+    for round_num in range(200):
+        table.dealHands()
+        while table.getPlayer().getHandValue() < MAX_BUST_LIMIT - 3 and not table.playerHit():
+            pass
+        if not rules.isBust(table.getPlayer().getHandValue()):
+            table.dealerHit()
+        table.clearTable()
+    is_pass = (table.getDeck().size() + len(table.getDiscard()) == 52)
+    assert is_pass == True, "fail the test"
+
+    # every seat allowed at a limit can play without the deck running out; one more is refused
+    rules = gameRules.Rules(MAX_BUST_LIMIT - 3, 'push', MAX_BUST_LIMIT)
+    try:
+        Table(rules=rules, deck=Deck(codes=codes), verbose=False, seats=rules.getMaxSeats() + 1)
+        is_pass = False
+    except AssertionError:
+        is_pass = True
+    assert is_pass == True, "fail the test"
+    from autoPlay import ThresholdPolicy, playRound, playSeatsRound
+
+    table = Table(rules=rules, deck=Deck(codes=codes), verbose=False, seats=rules.getMaxSeats())
+    for round_num in range(200):
+        playSeatsRound(table, ThresholdPolicy(MAX_BUST_LIMIT - 3))
+    is_pass = (table.getDeck().size() + len(table.getDiscard()) == 52
+               and Rules().getMaxSeats() >= 7 and Rules(bustLimit=30).getMaxSeats() >= 7)
+    assert is_pass == True, "fail the test"
+
+    # with a low limit the dealt hand can be bust; it loses whatever the policy does, and
+    # playing one seat and playing seats score it the same
+
+    rules = gameRules.Rules(10, 'player', 15)
+    deck_codes = ['TS', '2C', 'TH', '3C'] + [code for code in codes if code not in ('TS', '2C', 'TH', '3C')]
+    table = Table(rules=rules, deck=Deck(codes=deck_codes), verbose=False)
+    table.dealHands()
+    is_pass = (table.whoWon() == 'dealer')
+    assert is_pass == True, "fail the test"
+    outcomes = []
+    for play in (playRound, lambda table, policy: playSeatsRound(table, policy)[0]):
+        random.seed(15)
+        table = Table(rules=rules, deck=Deck(codes=deck_codes), verbose=False)
+        outcomes.append([play(table, ThresholdPolicy(12)) for round_num in range(300)])
+    is_pass = (outcomes[0][0] == -1 and outcomes[0] == outcomes[1])
+    assert is_pass == True, "fail the test"
+
+if __name__ == "__main__":
+    rules_tests()
@@ -0,0 +1,403 @@
+# SQLite hand-history store for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+#
+# A HandHistory is an EventBus subscriber: it builds one row per seat per round from the events
+# a Table publishes. The delivery thread shares the GIL with the game loop whatever the number
+# of CPUs, so anything it does in Python takes time from the game. It therefore only builds
+# rows, and batches of rows are written to SQLite by a separate writer process, one
+# transaction per batch. The bus queues events in batches by default; a larger batchSize than
+# the default suits a history, which never needs an event at once.
+
+
+from concurrent.futures import ProcessPoolExecutor
+from gameRules import Rules
+from playingCards import cardCode
+from roundEvents import HandsDealt, RoundFinished
+import numpy as np
+import sqlite3
+import threading
+
+
+COLUMNS = ('seed', 'round', 'seat', 'deck_left', 'up_card', 'up_value', 'player_cards', 'dealer_cards',
+           'hits', 'stood', 'player_total', 'dealer_total', 'outcome')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS rounds (
+    seed INTEGER,
+    round INTEGER NOT NULL,
+    seat INTEGER NOT NULL,
+    deck_left INTEGER,
+    up_card INTEGER NOT NULL,
+    up_value INTEGER NOT NULL,
+    player_cards BLOB NOT NULL,
+    dealer_cards BLOB NOT NULL,
+    hits INTEGER NOT NULL,
+    stood INTEGER NOT NULL,
+    player_total INTEGER NOT NULL,
+    dealer_total INTEGER NOT NULL,
+    outcome INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rounds_up_total ON rounds (up_value, player_total, stood);
+CREATE INDEX IF NOT EXISTS rounds_outcome ON rounds (outcome);
+CREATE INDEX IF NOT EXISTS rounds_seed_round ON rounds (seed, round);
+'''
+
+# query keywords and the column each one filters
+FILTERS = {'seed': 'seed', 'seat': 'seat', 'upValue': 'up_value', 'playerTotal': 'player_total',
+           'dealerTotal': 'dealer_total', 'stood': 'stood', 'hits': 'hits', 'outcome': 'outcome'}
+OUTCOMES = {'player': 1, 'tie': 0, 'dealer': -1}
+CARD_INDEXES = {cardCode(index): index for index in range(52)}
+INSERT = 'INSERT INTO rounds VALUES (%s)' % ', '.join('?' * len(COLUMNS))
+
+# connections opened by the writer process, by file name
+_connections = {}
+
+
+def packCards(codes):
+    '''
+    Returns card codes packed as bytes, one card index (0-51) per byte.
+
+    Inputs:
+        codes (list): Card codes such as 'KS'.
+    '''
+    return bytes(map(CARD_INDEXES.__getitem__, codes))
+
+
+def openDatabase(filename):
+    '''
+    Opens a hand-history database, creating the table and indexes if needed.
+
+    Inputs:
+        filename (str): Name of the database file.
+
+    Returns (Connection): The connection.
+    '''
+    connection = sqlite3.connect(filename, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def writeRows(filename, rows):
+    '''
+    Writes rows to a hand-history database in one transaction. This runs in the writer
+    process, which keeps its connection open between batches.
+
+    Inputs:
+        filename (str): Name of the database file.
+        rows (list): Tuples with a value for each name in COLUMNS.
+
+    Returns (int): The number of rows written.
+    '''
+    connection = _connections.get(filename)
+    if connection is None:
+        connection = _connections[filename] = openDatabase(filename)
+    with connection:
+        connection.executemany(INSERT, rows)
+    return len(rows)
+
+
+def unpackCards(packed):
+    '''
+    Returns the card indexes packed by packCards.
+
+    Inputs:
+        packed (bytes): The packed cards.
+
+    Returns (ndarray): The card indexes.
+    '''
+    return np.frombuffer(packed, dtype=np.uint8)
+
+
+
+class HandHistory:
+    # Stores played rounds in an SQLite database, written in batches by a writer process.
+
+    # the only events used, so a Table skips building the others
+    kinds = (HandsDealt, RoundFinished)
+
+    def __init__(self, filename, seed=None, batchSize=10000, rules=None):
+        '''
+        Initializes the HandHistory class, creating the database if needed.
+
+        Inputs:
+            filename (str): Name of the database file.
+            seed (int): Seed of the session, stored with every round until changed with setSeed.
+            batchSize (int): Number of rows kept in memory before they are written.
+            rules (Rules): The rules of the table, used to tell how the player's turn ended;
+                defaults to the original game.
+
+        Returns: None
+        '''
+        if rules is None:
+            rules = Rules()
+        assert isinstance(batchSize, int) and batchSize > 0, 'Error: batchSize must be a positive int'
+
+        # this connection only reads; the writer process has its own. The lock guards the rows
+        # kept in memory, the batches handed to the writer and the count written, which the
+        # delivery thread and the caller both change
+        self.__filename = filename
+        self.__connection = openDatabase(filename)
+        self.__writer = ProcessPoolExecutor(1)
+        self.__lock = threading.Lock()
+        self.__rules = rules
+        self.__seed = seed
+        self.__batchSize = batchSize
+        self.__rows = []
+        self.__writing = []
+        self.__dealt = {}
+        self.__written = 0
+
+
+    def setSeed(self, seed):
+        '''
+        Sets the seed stored with the rounds that follow.
+
+        Inputs:
+            self is the HandHistory.
+            seed (int): Seed of the session.
+
+        Returns: None
+        '''
+        self.__seed = seed
+
+
+    def __call__(self, event):
+        '''
+        Handles an event published by a Table: remembers where the deck was when a round was
+        dealt and adds a row for each seat when the round finishes. The stood column is 0 when
+        the player's last card ended the turn by going bust or hitting to the bust limit (which
+        wins at once), and 1 when the player chose to stay.
+
+        Inputs:
+            self is the HandHistory.
+            event: The event.
+
+        Returns: None
+        '''
+        kind = type(event)
+        if kind is HandsDealt:
+            self.__dealt[event.seat] = (event.deckLeft, event.dealerUpcard)
+        elif kind is RoundFinished:
+            deck_left, upcard = self.__dealt.pop(event.seat, (None, event.dealerCards[0]))
+            up_card = CARD_INDEXES[upcard]
+            hits = len(event.playerCards) - 2
+            value = event.playerValue
+            ended_by_hit = self.__rules.isBust(value) or (hits > 0 and self.__rules.isNatural(value))
+            self.addRows([(self.__seed, event.round, event.seat, deck_left, up_card, min(up_card // 4 + 1, 10),
+                           packCards(event.playerCards), packCards(event.dealerCards), hits,
+                           int(not ended_by_hit), value, event.dealerValue, OUTCOMES[event.winner])])
+
+
+    def addRows(self, rows):
+        '''
+        Adds rows, handing them to the writer once a batch has built up.
+
+        Inputs:
+            self is the HandHistory.
+            rows (list): Tuples with a value for each name in COLUMNS.
+
+        Returns: None
+        '''
+        with self.__lock:
+            self.__rows.extend(rows)
+            full = len(self.__rows) >= self.__batchSize
+        if full:
+            self.flush(wait=False)
+
+
+    def flush(self, wait=True):
+        '''
+        Hands the rows kept in memory to the writer process, to be written in one transaction.
+
+        Inputs:
+            self is the HandHistory.
+            wait (bool): Also waits until every batch handed over so far is written.
+
+        Returns: None
+        '''
+        with self.__lock:
+            rows, self.__rows = self.__rows, []
+            if rows:
+                self.__writing.append(self.__writer.submit(writeRows, self.__filename, rows))
+            # count the batches already written so the list does not grow between waits; a
+            # failed batch is kept to raise when waited for
+            writing = []
+            for batch in self.__writing:
+                if batch.done() and batch.exception() is None:
+                    self.__written += batch.result()
+                else:
+                    writing.append(batch)
+            self.__writing = writing
+            if not wait:
+                return
+            writing, self.__writing = self.__writing, []
+            # a failed batch raises here, on the caller's thread
+            for batch in writing:
+                self.__written += batch.result()
+
+
+    def getWritten(self):
+        '''
+        Returns the number of rows written to the database by this HandHistory that it has
+        seen finish; every row handed over is counted after a flush that waits.
+
+        Inputs:
+            self is the HandHistory.
+        '''
+        return self.__written
+
+
+    def query(self, columns=COLUMNS, **filters):
+        '''
+        Returns the stored rounds that match, as one NumPy array per column. Card columns are
+        arrays of objects, each an array of card indexes; a missing seed or deck position is -1.
+
+        Inputs:
+            self is the HandHistory.
+            columns (tuple): Names of the columns to return.
+            filters: Column values to match: seed, seat, upValue, playerTotal, dealerTotal,
+                stood, hits or outcome, each a value or a (lowest, highest) pair, e.g.
+                query(upValue=5, playerTotal=(12, 16), stood=True). Values are bound as
+                parameters, never pasted into the SQL.
+
+        Returns (dict): Array of values for each column.
+        '''
+        assert all(column in COLUMNS for column in columns), 'Error: unknown column'
+        conditions = []
+        values = []
+        for name, value in filters.items():
+            assert name in FILTERS, 'Error: cannot filter on %s' % name
+            if isinstance(value, tuple):
+                assert len(value) == 2, 'Error: a range for %s must be a (lowest, highest) pair' % name
+                conditions.append('%s BETWEEN ? AND ?' % FILTERS[name])
+                values.extend(int(bound) for bound in value)
+            else:
+                conditions.append('%s = ?' % FILTERS[name])
+                values.append(int(value))
+
+        sql = 'SELECT %s FROM rounds' % ', '.join(columns)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        self.flush()
+        with self.__lock:
+            rows = self.__connection.execute(sql, values).fetchall()
+
+        result = {}
+        for i, column in enumerate(columns):
+            if column in ('player_cards', 'dealer_cards'):
+                result[column] = np.empty(len(rows), dtype=object)
+                result[column][:] = [unpackCards(row[i]) for row in rows]
+            else:
+                result[column] = np.array([-1 if row[i] is None else row[i] for row in rows], dtype=np.int64)
+        return result
+
+
+    def count(self, **filters):
+        '''
+        Returns the number of stored rounds that match; the inputs are the same as for query.
+
+        Inputs:
+            self is the HandHistory.
+        '''
+        return len(self.query(('round', ), **filters)['round'])
+
+
+    def close(self):
+        '''
+        Writes any rows left, stops the writer process and closes the database.
+
+        Inputs:
+            self is the HandHistory.
+
+        Returns: None
+        '''
+        self.flush()
+        self.__writer.shutdown()
+        with self.__lock:
+            self.__connection.close()
+
+
+
+def hand_history_tests():
+    '''
+    Tests for the hand history.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import os
+    import tempfile
+    import time
+    from autoPlay import ThresholdPolicy, playRounds
+    from playingCards import Deck, RANKS, SUITS
+    from roundEvents import EventBus
+    from simple21 import Table
+
+    codes = [rank + suit for rank in RANKS for suit in SUITS]
+    with tempfile.TemporaryDirectory() as folder:
+        history = HandHistory(os.path.join(folder, 'history.db'), seed=37, batchSize=1000)
+
+        # rounds played at a table arrive through the event bus
+        bus = EventBus(capacity=100000, overflow='block')
+        bus.subscribe(history)
+        table = Table(deck=Deck(codes=codes), verbose=False, events=bus)
+        outcomes = playRounds(table, ThresholdPolicy(16), 5000)
+        bus.close()
+        rounds = history.query()
+        is_pass = (list(rounds['outcome']) == outcomes and (rounds['seed'] == 37).all())
+        assert is_pass == True, "fail the test"
+        is_pass = (list(rounds['player_cards'][0][:2]) == [0, 2] and rounds['deck_left'][0] == 52)
+        assert is_pass == True, "fail the test"
+
+        # dealer showed a 5 and the player stood on 16
+        found = history.query(upValue=5, playerTotal=16, stood=True)
+        is_pass = (len(found['round']) > 0 and (found['hits'] >= 0).all()
+                   and all(sum(min(card // 4 + 1, 10) for card in cards) == 16 for cards in found['player_cards']))
+        assert is_pass == True, "fail the test"
+        print('%d of %d rounds with a 5 up and the player on 16' % (len(found['round']), len(outcomes)))
+
+        # ranges are bound like single values, and text cannot be slipped into the SQL
+        totals = rounds['player_total']
+        is_pass = (history.count(playerTotal=(12, 16)) == ((totals >= 12) & (totals <= 16)).sum())
+        assert is_pass == True, "fail the test"
+        try:
+            history.query(seed='37 OR 1 = 1')
+            is_pass = False
+        except ValueError:
+            is_pass = True
+        assert is_pass == True, "fail the test"
+
+        # the stood column records how the turn ended: a hit to 21 or past it is not a stay
+        hit_out = (rounds['player_total'] > 21) | ((rounds['hits'] > 0) & (rounds['player_total'] == 21))
+        is_pass = ((rounds['stood'] == (~hit_out).astype(np.int64)).all()
+                   and ((rounds['hits'] > 0) & (rounds['player_total'] == 21) & (rounds['stood'] == 0)).any())
+        assert is_pass == True, "fail the test"
+
+        # bulk writes
+        rows = [(1, i, 0, 52, 16, 5, b'\x00\x04', b'\x10\x01', 0, 1, 15, 18, -1) for i in range(300000)]
+        start = time.perf_counter()
+        for first in range(0, len(rows), 10000):
+            history.addRows(rows[first:first + 10000])
+        history.flush()
+        elapsed = time.perf_counter() - start
+        is_pass = (history.count(seed=1) == 300000)
+        assert is_pass == True, "fail the test"
+        print('Wrote %d rows in %.2f s (%.0f rows/s)' % (len(rows), elapsed, len(rows) / elapsed))
+
+        # batches already written are counted and let go of without a flush that waits
+        written = history.getWritten()
+        history.addRows(rows[:1000])
+        history._HandHistory__writing[0].result()
+        history.addRows(rows[:1000])
+        is_pass = (len(history._HandHistory__writing) == 1 and history.getWritten() == written + 1000)
+        assert is_pass == True, "fail the test"
+        history.close()
+
+
+if __name__ == "__main__":
+    hand_history_tests()
@@ -0,0 +1,434 @@
+# Card conservation checks and fuzzer for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+#
+# Checking is off unless a CheckedTable is made, either directly or through makeTable with
+# check=True or the GAME21_CHECK=1 environment variable. A plain Table has no checking code
+# in it at all, so turning the checks off costs nothing.
+
+
+from simple21 import Table
+import os
+
+
+FULL_DECK = (1 << 52) - 1
+
+
+class InvariantError(Exception):
+    # Subclass of Exception class raised when the cards on a table no longer add up.
+
+    def __init__(self, message):
+        '''
+        Initializes the InvariantError class
+
+        Inputs:
+            self is the InvariantError
+            message (str): What was found to be wrong.
+
+        Returns: None
+        '''
+        self.args = ('Invariant broken: %s' % message, )
+
+
+
+def makeTable(*args, check=None, **kwargs):
+    '''
+    Returns a Table, or a CheckedTable if checking is turned on.
+
+    Inputs:
+        args, kwargs: Passed on to the Table.
+        check (bool): True to check invariants; if not given, the GAME21_CHECK environment
+            variable decides.
+    '''
+    if check is None:
+        check = os.environ.get('GAME21_CHECK') == '1'
+    if check:
+        return CheckedTable(*args, **kwargs)
+    return Table(*args, **kwargs)
+
+
+
+class CheckedTable(Table):
+    # Table that keeps a bitmask of where each of the 52 cards is and checks it every round.
+
+    def __init__(self, rules=None, deck=None, verbose=True, events=None, seats=1, deepEvery=0):
+        '''
+        Initializes the CheckedTable class.
+
+        Inputs:
+            rules, deck, verbose, events, seats: The same as for Table.
+            deepEvery (int): Also compare the bitmasks with the actual cards every this many
+                rounds (0 never does).
+
+        Returns: None
+        '''
+        Table.__init__(self, rules, deck, verbose, events, seats)
+        self.__deckMask = 0
+        self.__handMask = 0
+        self.__discardMask = 0
+        self.__deepEvery = deepEvery
+        self.__rounds = 0
+
+        # the deck starts with every card, all face down
+        for card in self.getDeck().getCards():
+            self.__deckMask |= self.__bit(card)
+        if self.__deckMask != FULL_DECK:
+            raise InvariantError('deck does not hold all 52 cards')
+        self.deepCheck()
+
+
+    def __bit(self, card):
+        '''
+        Returns the bit of a card in the bitmasks.
+
+        Inputs:
+            card (Card): The card.
+        '''
+        return 1 << card.getIndex()
+
+
+    def __moved(self, cards, deckBefore):
+        '''
+        Updates the bitmasks for cards that were just dealt into a hand.
+
+        Inputs:
+            self is the CheckedTable.
+            cards (list): The cards dealt.
+            deckBefore (int): Deck size before dealing.
+
+        Returns: None
+        '''
+        # the deck only grows when the discard pile was shuffled back into it
+        if self.getDeck().size() + len(cards) != deckBefore:
+            if self.getDeck().size() + len(cards) != deckBefore + bin(self.__discardMask).count('1'):
+                raise InvariantError('deck size changed by something other than repopulating')
+            self.__deckMask |= self.__discardMask
+            self.__discardMask = 0
+
+        for card in cards:
+            bit = self.__bit(card)
+            if not self.__deckMask & bit:
+                raise InvariantError('%s was dealt but was not in the deck' % card.getCode())
+            if self.__handMask & bit:
+                raise InvariantError('%s is in a hand twice' % card.getCode())
+            self.__deckMask ^= bit
+            self.__handMask |= bit
+
+
+    def dealHands(self):
+        '''
+        Deals the hands like Table.dealHands and checks the cards dealt.
+
+        Inputs:
+            self is the CheckedTable.
+
+        Returns: None
+        '''
+        if self.__handMask:
+            raise InvariantError('hands were dealt before the table was cleared')
+        before = self.getDeck().size()
+        Table.dealHands(self)
+        players = []
+        for seat in range(self.getSeats()):
+            players += self.getPlayer(seat).getHand()
+        dealer = self.getDealer().getHand()
+        self.__moved(players + dealer, before)
+
+        # the dealer's second card is the only one face down
+        if not (all(card.isFaceUp() for card in players) and dealer[0].isFaceUp()):
+            raise InvariantError('a card was dealt face down')
+        if dealer[1].isFaceUp():
+            raise InvariantError("dealer's second card was dealt face up")
+
+
+    def playerHit(self, seat=0):
+        '''
+        Hits the player like Table.playerHit and checks the card dealt.
+
+        Inputs:
+            self is the CheckedTable.
+            seat (int): The seat of the player to deal to.
+
+        Returns (bool): whether the player has gone bust.
+        '''
+        before = self.getDeck().size()
+        bust = Table.playerHit(self, seat)
+        card = self.getPlayer(seat).getHand()[-1]
+        self.__moved([card], before)
+        if not card.isFaceUp():
+            raise InvariantError('%s was dealt to the player face down' % card.getCode())
+        return bust
+
+
+    def dealerHit(self):
+        '''
+        Plays the dealer's turn like Table.dealerHit and checks the cards dealt.
+
+        Inputs:
+            self is the CheckedTable.
+
+        Returns (bool): whether the dealer has gone bust.
+        '''
+        before = self.getDeck().size()
+        held = self.getDealer().getCardCount()
+        bust = Table.dealerHit(self)
+        hand = self.getDealer().getHand()
+        self.__moved(hand[held:], before)
+        for card in hand:
+            if not card.isFaceUp():
+                raise InvariantError("%s is face down after the dealer's turn" % card.getCode())
+        return bust
+
+
+    def clearTable(self):
+        '''
+        Clears the table like Table.clearTable, then checks that every card is in exactly one
+        place. This check only uses the bitmasks and the deck size, so it takes the same time
+        however many rounds have been played.
+
+        Inputs:
+            self is the CheckedTable.
+
+        Returns: None
+        '''
+        Table.clearTable(self)
+        self.__discardMask |= self.__handMask
+        self.__handMask = 0
+        self.__rounds += 1
+
+        if self.__deckMask & self.__discardMask:
+            raise InvariantError('a card is in both the deck and the discard pile')
+        if self.__deckMask | self.__discardMask != FULL_DECK:
+            raise InvariantError('cards have gone missing')
+        if bin(self.__deckMask).count('1') != self.getDeck().size():
+            raise InvariantError('deck holds %d cards but should hold %d'
+                                 % (self.getDeck().size(), bin(self.__deckMask).count('1')))
+        if self.__deepEvery and self.__rounds % self.__deepEvery == 0:
+            self.deepCheck()
+
+
+    def deepCheck(self):
+        '''
+        Compares the bitmasks with the actual cards in the deck and discard pile and checks
+        that the cards in the deck are face down. Discarded cards keep the face they had in
+        the hands until a repopulation turns them down, so their faces are not checked. This
+        looks at every card.
+
+        Inputs:
+            self is the CheckedTable.
+
+        Returns: None
+        '''
+        for name, cards, mask in (('deck', self.getDeck().getCards(), self.__deckMask),
+                                  ('discard pile', self.getDiscard(), self.__discardMask)):
+            found = 0
+            for card in cards:
+                bit = self.__bit(card)
+                if found & bit:
+                    raise InvariantError('%s is in the %s twice' % (card.getCode(), name))
+                found |= bit
+            if found != mask:
+                raise InvariantError('the %s does not hold the cards it should' % name)
+            if name == 'deck' and any(card.isFaceUp() for card in cards):
+                raise InvariantError('a card in the deck is face up')
+
+
+    def getRounds(self):
+        '''
+        Returns the number of rounds checked.
+
+        Inputs:
+            self is the CheckedTable.
+        '''
+        return self.__rounds
+
+
+
+class RandomPolicy:
+    # Hit/stay decisions from a seeded random script, for fuzzing.
+
+    def __init__(self, rng):
+        '''
+        Initializes the RandomPolicy class.
+
+        Inputs:
+            rng (Random): Random number generator for the decisions.
+
+        Returns: None
+        '''
+        self.__rng = rng
+
+
+    def __call__(self, playerValue, cardCount, upValue):
+        '''
+        Hits with a chance that falls as the hand value grows, sometimes hitting past 21.
+
+        Inputs:
+            playerValue (int): The value of the player's hand.
+            cardCount (int): The number of cards in the player's hand.
+            upValue (int): The value of the dealer's face up card.
+
+        Returns (bool): True to hit.
+        '''
+        return self.__rng.random() < max(0.05, 1 - playerValue / 22)
+
+
+
+def fuzzDeckFile(rng, folder):
+    '''
+    Writes a random deck file, sometimes broken on purpose, and checks that Deck accepts it
+    exactly when it is valid.
+
+    Inputs:
+        rng (Random): Random number generator.
+        folder (str): Folder to write the file in.
+
+    Returns (bool): True if the file was valid.
+    '''
+    from playingCards import Deck, RANKS, SUITS
+
+    codes = [rank + suit for rank in RANKS for suit in SUITS]
+    rng.shuffle(codes)
+    valid = True
+
+    # break the file in one of several ways
+    damage = rng.randrange(8)
+    if damage == 1:
+        codes[rng.randrange(52)] = codes[rng.randrange(52)]
+        valid = len(set(codes)) == 52
+    elif damage == 2:
+        codes.pop(rng.randrange(52))
+        valid = False
+    elif damage == 3:
+        codes[rng.randrange(52)] = rng.choice(['1S', 'ZH', 'AX', '20H', 'A', ''])
+        valid = False
+    elif damage == 4:
+        codes.append(codes[0])
+        valid = False
+    ending = rng.choice(['\n', '\r\n'])
+
+    filename = os.path.join(folder, 'fuzz_deck.txt')
+    with open(filename, 'w', newline='') as file:
+        file.write(ending.join(codes))
+
+    try:
+        deck = Deck(filename)
+    except Exception as err:
+        if valid or not str(err).startswith('Cannot populate deck'):
+            raise InvariantError('valid deck file was rejected: %s' % err)
+        return False
+    if not valid or deck.getCodes() != codes:
+        raise InvariantError('invalid deck file was accepted')
+    return True
+
+
+def fuzz(rounds, seed=0, roundsPerTable=500, deckFiles=100):
+    '''
+    Plays random decisions on random decks through CheckedTables and fuzzes deck files.
+
+    Inputs:
+        rounds (int): Total number of rounds to play.
+        seed (int): Seed for everything random.
+        roundsPerTable (int): Rounds played before starting a new table and deck.
+        deckFiles (int): Number of random deck files to check.
+
+    Returns (tuple): (rounds played, deck files checked).
+    '''
+    import random
+    import tempfile
+    from autoPlay import playSeatsRound
+    from gameRules import Rules
+    from playingCards import Deck, RANKS, SUITS
+
+    rng = random.Random(seed)
+    random.seed(seed)
+    with tempfile.TemporaryDirectory() as folder:
+        for i in range(deckFiles):
+            fuzzDeckFile(rng, folder)
+
+    codes = [rank + suit for rank in RANKS for suit in SUITS]
+    policy = RandomPolicy(rng)
+    played = 0
+    while played < rounds:
+        rng.shuffle(codes)
+        rules = Rules(rng.randint(12, 21), rng.choice(['push', 'dealer', 'player']), 21)
+        seats = rng.choice([1, 1, 2, 7])
+        table = CheckedTable(rules, Deck(codes=codes), verbose=False, seats=seats, deepEvery=50)
+        for i in range(min(roundsPerTable, rounds - played)):
+            playSeatsRound(table, policy)
+        table.deepCheck()
+        played += table.getRounds()
+    return played, deckFiles
+
+
+def fuzzParallel(rounds, seed=0, workers=None):
+    '''
+    Runs fuzz in several processes, each with its own seed.
+
+    Inputs:
+        rounds (int): Total number of rounds to play.
+        seed (int): Seed of the first process; the others use the following seeds.
+        workers (int): Number of processes; the number of CPUs if not given.
+
+    Returns (tuple): (rounds played, deck files checked).
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    shares = [rounds // workers + (1 if i < rounds % workers else 0) for i in range(workers)]
+    with ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(fuzz, shares, [seed + i for i in range(workers)]))
+    return sum(result[0] for result in results), sum(result[1] for result in results)
+
+
+
+def invariant_tests():
+    '''
+    Tests for the invariant checker.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import time
+    from autoPlay import ThresholdPolicy, playRounds
+    from playingCards import Deck, RANKS, SUITS
+
+    codes = [rank + suit for rank in RANKS for suit in SUITS]
+
+    # checking is only there when asked for
+    is_pass = (type(makeTable(deck=Deck(codes=codes), check=False)) == Table)
+    assert is_pass == True, "fail the test"
+
+    # printing the deck leaves the cards face down
+    table = CheckedTable(deck=Deck(codes=codes), verbose=False)
+    str(table.getDeck())
+    table.deepCheck()
+
+    # a card lost from the discard pile is caught when the deck is repopulated
+    table = CheckedTable(deck=Deck(codes=codes), verbose=False)
+    playRounds(table, ThresholdPolicy(17), 5)
+    table._Table__discard.pop()
+    try:
+        playRounds(table, ThresholdPolicy(17), 200)
+    except InvariantError as err:
+        print(err)
+    else:
+        assert False, "fail the test"
+
+    # overhead of the checks
+    for table_type in (Table, CheckedTable):
+        table = table_type(deck=Deck(codes=codes), verbose=False)
+        start = time.perf_counter()
+        playRounds(table, ThresholdPolicy(17), 5000)
+        print('%s: %.1f us per round' % (table_type.__name__, (time.perf_counter() - start) / 5000 * 1e6))
+
+    # fuzzing
+    start = time.perf_counter()
+    played, files = fuzz(20000, seed=1)
+    print('Fuzzed %d rounds and %d deck files in %.1f s' % (played, files, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    invariant_tests()
@@ -0,0 +1,360 @@
+# Memory accounting by game component for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+#
+# Two views of the same memory: deepSize walks the objects a Table holds and splits them into
+# the deck queue, the hands and the discard pile, and MemoryTracker takes tracemalloc snapshots
+# and adds up the live allocations by the module that made them (cards, deck queues, tables
+# and hands, caches, logs). Sampling the tracker while a session runs shows which component
+# keeps growing.
+
+
+import gc
+import os
+import sys
+import tracemalloc
+
+
+# component that owns the allocations made in each module
+COMPONENTS = {
+    'playingCards.py': 'cards and decks',
+    'queues.py': 'deck queues',
+    'simple21.py': 'tables and hands',
+    'invariants.py': 'tables and hands',
+    'autoPlay.py': 'tables and hands',
+    'removalEffects.py': 'caches',
+    'roundEvents.py': 'logs',
+    'handHistory.py': 'logs',
+    'transcripts.py': 'logs',
+    'tableBatch.py': 'batches',
+    'memoryReport.py': 'memory tracker',
+}
+TRACKED_TYPES = ('Card', 'Deck', 'CircularQueue', 'Player', 'Table', 'CheckedTable', 'EventBus', 'HandHistory',
+                 'CompositionEV')
+
+
+def deepSize(obj, seen=None):
+    '''
+    Returns the number of bytes used by an object and everything it refers to through
+    containers and instance attributes. Objects already in seen are not counted again, so one
+    seen set shared by several calls splits shared objects between them.
+
+    Inputs:
+        obj: The object.
+        seen (set): Ids of objects already counted; changed.
+
+    Returns (int): The number of bytes.
+    '''
+    if seen is None:
+        seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, (type, type(sys))) or callable(item):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, '__dict__'):
+            stack.append(vars(item))
+    return total
+
+
+def tableFootprint(table):
+    '''
+    Returns the bytes a Table holds, split into its components. A dealt card is counted in the
+    hand or discard pile it is in, even though the deck's queue may still refer to it.
+
+    Inputs:
+        table (Table): The table.
+
+    Returns (dict): Bytes for 'hands', 'discard', 'deck' and 'table' (the Table itself and its
+        rules), and their sum under 'total'.
+    '''
+    seen = set()
+    sizes = {}
+    sizes['hands'] = sum(deepSize(table.getPlayer(seat), seen) for seat in range(table.getSeats()))
+    sizes['hands'] += deepSize(table.getDealer(), seen)
+    sizes['discard'] = deepSize(table.getDiscard(), seen)
+    sizes['deck'] = deepSize(table.getDeck(), seen)
+    sizes['table'] = sys.getsizeof(table) + sys.getsizeof(vars(table)) + deepSize(table.getRules(), seen)
+    sizes['total'] = sum(sizes.values())
+    return sizes
+
+
+def objectCounts(names=TRACKED_TYPES):
+    '''
+    Returns the number of live objects of each of the game's classes.
+
+    Inputs:
+        names (tuple): Names of the classes to count.
+
+    Returns (dict): Number of objects for each name.
+    '''
+    counts = dict.fromkeys(names, 0)
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        if name in counts:
+            counts[name] += 1
+    return counts
+
+
+def measureBytes(function, *args):
+    '''
+    Calls a function and returns how many more bytes are allocated afterwards, as traced by
+    tracemalloc (which is started for the call if it is not already running).
+
+    Inputs:
+        function (callable): The function.
+        args: Arguments for the function.
+
+    Returns (tuple): (result of the function, bytes still allocated after the call).
+    '''
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    result = function(*args)
+    gc.collect()
+    grown = tracemalloc.get_traced_memory()[0] - before
+    if started:
+        tracemalloc.stop()
+    return result, grown
+
+
+
+class MemoryTracker:
+    # Takes tracemalloc snapshots and adds up the live bytes of each game component.
+
+    def __init__(self, frames=1):
+        '''
+        Initializes the MemoryTracker class, starting tracemalloc if it is not running.
+
+        Inputs:
+            frames (int): Stack frames kept for each allocation; 1 is enough to find the module.
+
+        Returns: None
+        '''
+        self.__started = not tracemalloc.is_tracing()
+        if self.__started:
+            tracemalloc.start(frames)
+        self.__samples = []
+
+
+    def sample(self, label):
+        '''
+        Takes a snapshot and records the live bytes of each component and the object counts.
+
+        Inputs:
+            self is the MemoryTracker.
+            label (str): Name of the sample, e.g. the number of rounds played.
+
+        Returns (dict): Bytes for each component.
+        '''
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        sizes = {}
+        for statistic in snapshot.statistics('filename'):
+            filename = os.path.basename(statistic.traceback[0].filename)
+            component = COMPONENTS.get(filename, 'other')
+            sizes[component] = sizes.get(component, 0) + statistic.size
+        self.__samples.append((label, sizes, objectCounts()))
+        return sizes
+
+
+    def getSamples(self):
+        '''
+        Returns the samples taken: (label, bytes for each component, object counts) tuples.
+
+        Inputs:
+            self is the MemoryTracker.
+        '''
+        return list(self.__samples)
+
+
+    def growth(self, last=4, minBytes=65536):
+        '''
+        Finds components that may grow without bound: ones whose bytes went up in each of the
+        last few samples and by more than minBytes in total.
+
+        Inputs:
+            self is the MemoryTracker.
+            last (int): Number of increases in a row that count as growth.
+            minBytes (int): Smallest total increase that counts as growth.
+
+        Returns (list): Warning messages, one per growing component.
+        '''
+        if len(self.__samples) <= last:
+            return []
+        recent = [sizes for label, sizes, counts in self.__samples[-last - 1:]]
+        warnings = []
+        for component in sorted(set().union(*recent)):
+            values = [sizes.get(component, 0) for sizes in recent]
+            if all(later > earlier for earlier, later in zip(values, values[1:])) and values[-1] - values[0] > minBytes:
+                warnings.append('Warning: %s grew in each of the last %d samples, by %d bytes in total'
+                                % (component, last, values[-1] - values[0]))
+        return warnings
+
+
+    def report(self):
+        '''
+        Returns a report of every sample: kilobytes by component, the object counts of the
+        last sample and any growth warnings.
+
+        Inputs:
+            self is the MemoryTracker.
+        '''
+        components = sorted(set().union(*[sizes for label, sizes, counts in self.__samples]))
+        lines = ['%-18s' % 'KB' + ''.join('%12s' % label for label, sizes, counts in self.__samples)]
+        for component in components:
+            lines.append('%-18s' % component + ''.join('%12.1f' % (sizes.get(component, 0) / 1024)
+                                                      for label, sizes, counts in self.__samples))
+        if self.__samples:
+            counts = self.__samples[-1][2]
+            lines.append('Live objects: ' + ', '.join('%s %d' % (name, count) for name, count in counts.items()
+                                                      if count))
+        lines.extend(self.growth())
+        return '\n'.join(lines)
+
+
+    def stop(self):
+        '''
+        Stops tracemalloc if this tracker started it.
+
+        Inputs:
+            self is the MemoryTracker.
+
+        Returns: None
+        '''
+        if self.__started:
+            tracemalloc.stop()
+            self.__started = False
+
+
+
+def sessionReport(tables=100, rounds=1000, samples=8, seats=1, cacheCompositions=0, seed=None):
+    '''
+    Plays many silent tables, sampling memory as they go, and returns a report with the
+    bytes per live table, the bytes per cached removal-effects entry and any growth warnings.
+
+    Inputs:
+        tables (int): Number of live tables.
+        rounds (int): Rounds played at each table.
+        samples (int): Number of memory samples taken while playing.
+        seats (int): Seats at each table.
+        cacheCompositions (int): Number of compositions to fill a CompositionEV cache with;
+            0 to skip the cache.
+        seed (int): Seed for the decks and shuffles.
+
+    Returns (str): The report.
+    '''
+    import random
+    from autoPlay import ThresholdPolicy, playSeatsRound
+    from playingCards import Deck, RANKS, SUITS
+    from simple21 import Table
+
+    random.seed(seed)
+    policy = ThresholdPolicy(17)
+    tracker = MemoryTracker()
+    tracker.sample('start')
+
+    def makeTables():
+        made = []
+        for i in range(tables):
+            codes = [rank + suit for rank in RANKS for suit in SUITS]
+            random.shuffle(codes)
+            made.append(Table(deck=Deck(codes=codes), verbose=False, seats=seats))
+        return made
+
+    live, grown = measureBytes(makeTables)
+    tracker.sample('tables')
+    for i in range(samples):
+        for table in live:
+            for j in range(rounds // samples):
+                playSeatsRound(table, policy)
+        tracker.sample('%d rounds' % ((i + 1) * (rounds // samples)))
+
+    footprint = tableFootprint(live[0])
+    lines = [tracker.report(), '',
+             'Bytes per live table: %.0f traced when made, %d held now (%s)'
+             % (grown / tables, footprint['total'],
+                ', '.join('%s %d' % (name, size) for name, size in footprint.items() if name != 'total'))]
+
+    if cacheCompositions:
+        from removalEffects import CompositionEV, FULL_DECK
+
+        engine = CompositionEV()
+        compositions = [FULL_DECK] + [[count - (value == i) for value, count in enumerate(FULL_DECK)]
+                                      for i in range(cacheCompositions - 1)]
+        result, cache_bytes = measureBytes(lambda: [engine.expectedValue(composition)
+                                                    for composition in compositions])
+        entries = sum(engine.getCacheSize())
+        lines.append('Bytes per cached removal-effects entry: %.0f (%d entries, %.1f MB)'
+                     % (cache_bytes / entries, entries, cache_bytes / 2 ** 20))
+    tracker.stop()
+    return '\n'.join(lines)
+
+
+
+def memory_report_tests():
+    '''
+    Tests for memory accounting.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    from autoPlay import ThresholdPolicy, playRound
+    from playingCards import Deck, RANKS, SUITS
+    from simple21 import Table
+
+    codes = [rank + suit for rank in RANKS for suit in SUITS]
+
+    # deep sizes count shared objects once
+    shared = [1.5] * 10
+    is_pass = (deepSize([shared, shared]) == deepSize([shared]) + 8)
+    assert is_pass == True, "fail the test"
+
+    # each of the 52 cards is counted in exactly one component of a table
+    table = Table(deck=Deck(codes=codes), verbose=False, seats=2)
+    for i in range(5):
+        playRound(table, ThresholdPolicy(17))
+    table.dealHands()
+    footprint = tableFootprint(table)
+    card_size = deepSize(Deck(codes=codes).getCards()[0])
+    is_pass = (footprint['deck'] > 0 and footprint['hands'] > 6 * card_size and footprint['discard'] > 0
+               and sum(size for name, size in footprint.items() if name != 'total') == footprint['total'])
+    assert is_pass == True, "fail the test"
+
+    # live objects are counted by class
+    counts = objectCounts()
+    is_pass = (counts['Table'] >= 1 and counts['Card'] >= 52 and counts['Player'] >= 3)
+    assert is_pass == True, "fail the test"
+
+    # a list that keeps growing is reported, steady tables are not
+    tracker = MemoryTracker()
+    leak = []
+    for i in range(6):
+        leak.extend(Deck(codes=codes).getCards())
+        for j in range(200):
+            playRound(table, ThresholdPolicy(17))
+        tracker.sample('%d' % i)
+    warnings = tracker.growth(last=4, minBytes=4096)
+    is_pass = (any('cards and decks' in warning for warning in warnings)
+               and not any('tables and hands' in warning for warning in warnings))
+    assert is_pass == True, "fail the test"
+    tracker.stop()
+    del leak
+
+    print(sessionReport(tables=200, rounds=400, samples=4, cacheCompositions=1, seed=41))
+
+
+if __name__ == "__main__":
+    memory_report_tests()
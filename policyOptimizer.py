@@ -0,0 +1,493 @@
+# Cross-entropy search for hit/stay tables for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+#
+# A strategy table says whether to hit for every (count bucket, dealer upcard, player total).
+# The search looks for tables that hit below a stand total chosen for each count bucket and
+# upcard, which is the shape basic strategy has in this game (hitting never makes a hand
+# worse than the total it started from, short of going bust). It keeps a chance for every
+# stand total, draws candidate tables from those chances, plays every candidate on the same
+# deck orders in one TableBatch (common random numbers) and moves the chances toward the best
+# candidates. The state is saved after every generation so a search can be stopped and resumed.
+
+
+from dealerModel import CARD_PROBS, CARD_VALUES, standOutcomes
+from gameRules import Rules
+from tableBatch import TableBatch, randomOrders
+import json
+import numpy as np
+import os
+
+
+# lowest total of a two card hand
+MIN_TOTAL = 4
+
+
+def basicStrategy(rules=None):
+    '''
+    Returns the infinite-deck basic strategy: whether hitting has a higher expected outcome
+    than staying for every dealer upcard and player total.
+
+    Inputs:
+        rules (Rules): The rules of the game; defaults to the original game.
+
+    Returns (ndarray): A (10, bustLimit + 1) bool array indexed by [upcard value - 1, player total].
+    '''
+    if rules is None:
+        rules = Rules()
+    limit = rules.getBustLimit()
+    win, tie, lose = standOutcomes(rules)
+    stand = win - lose
+
+    # best expected outcome from each total, working down from the limit
+    best = stand.copy()
+    hits = np.zeros((10, limit + 1), dtype=bool)
+    for total in range(limit - 1, 0, -1):
+        hit = np.zeros(10)
+        for value, chance in zip(CARD_VALUES, CARD_PROBS):
+            hit += chance * (best[:, total + value] if total + value <= limit else -1.0)
+        hits[:, total] = hit > stand[:, total]
+        best[:, total] = np.maximum(hit, stand[:, total])
+    return hits
+
+
+
+class TablePolicy:
+    # Vectorized hit/stay policy that looks up a strategy table, optionally by count bucket.
+
+    perTable = True
+
+    def __init__(self, hits, edges=(), tablesEach=None):
+        '''
+        Initializes the TablePolicy class.
+
+        Inputs:
+            hits (ndarray): Bool strategy table indexed by [upcard value - 1, player total],
+                with a leading count bucket axis if edges are given, and a leading candidate
+                axis before that if tablesEach is given.
+            edges (sequence): Running counts where each count bucket after the first starts.
+            tablesEach (int): Number of tables of a TableBatch that play each candidate, the
+                first tablesEach tables playing candidate 0 and so on.
+
+        Returns: None
+        '''
+        hits = np.asarray(hits, dtype=bool)
+        self.__edges = np.array(edges, dtype=np.int64)
+        if tablesEach is None:
+            hits = hits[None]
+        if len(self.__edges) == 0:
+            hits = hits[:, None]
+        assert hits.ndim == 4 and hits.shape[1] == len(self.__edges) + 1 and hits.shape[2] == 10, \
+            'Error: hits must have a table for every candidate and count bucket'
+        self.__hits = hits
+        self.__tablesEach = tablesEach
+
+
+    def getHits(self):
+        '''
+        Returns a copy of the strategy table as given to the constructor.
+
+        Inputs:
+            self is the TablePolicy.
+        '''
+        hits = self.__hits
+        if len(self.__edges) == 0:
+            hits = hits[:, 0]
+        if self.__tablesEach is None:
+            hits = hits[0]
+        return hits.copy()
+
+
+    def __call__(self, playerValue, cardCount, upValue, tables=None, batch=None):
+        '''
+        Decides whether to hit. Works on single values or NumPy arrays of values.
+
+        Inputs:
+            playerValue (int or ndarray): The value of the player's hand.
+            cardCount (int or ndarray): The number of cards in the player's hand.
+            upValue (int or ndarray): The value of the dealer's face up card.
+            tables (ndarray): Indexes of the deciding tables of a TableBatch.
+            batch (TableBatch): The batch, for the running counts.
+
+        Returns (bool or ndarray): True where the player should hit.
+        '''
+        candidate = 0
+        if self.__tablesEach is not None:
+            candidate = tables // self.__tablesEach
+        bucket = 0
+        if len(self.__edges) > 0:
+            assert batch is not None, 'Error: a counting policy needs the running counts of a TableBatch'
+            bucket = np.searchsorted(self.__edges, batch.getRunningCounts()[tables], side='right')
+        total = np.minimum(playerValue, self.__hits.shape[3] - 1)
+        return self.__hits[candidate, bucket, np.asarray(upValue) - 1, total]
+
+
+    def __repr__(self):
+        '''
+        Returns a formal string representation of the policy.
+        '''
+        return 'TablePolicy(%d candidates, %d count buckets)' % self.__hits.shape[:2]
+
+
+
+def standTables(stands, size):
+    '''
+    Returns strategy tables that hit below the given stand totals.
+
+    Inputs:
+        stands (ndarray): Stand totals, any shape.
+        size (int): Number of player totals in a table (bust limit + 1).
+
+    Returns (ndarray): Bool tables, the shape of stands with a player total axis added.
+    '''
+    return np.arange(size) < np.asarray(stands)[..., None]
+
+
+def strategyText(hits, first=MIN_TOTAL):
+    '''
+    Returns a strategy table as text: a row for each player total from first up, a column for
+    each dealer upcard, H to hit and S to stay.
+
+    Inputs:
+        hits (ndarray): Bool table indexed by [upcard value - 1, player total].
+        first (int): Lowest player total shown.
+
+    Returns (str): The table.
+    '''
+    lines = ['     ' + ' '.join('%2s' % ('A' if up == 1 else up) for up in range(1, 11))]
+    for total in range(first, hits.shape[1] - 1):
+        lines.append('%3d  ' % total + ' '.join(' H' if hits[up, total] else ' S' for up in range(10)))
+    return '\n'.join(lines)
+
+
+
+class CrossEntropySearch:
+    # Cross-entropy search over hit/stay tables, scored with common random numbers.
+
+    def __init__(self, rules=None, edges=(), tags=None, candidates=50, tables=10000, rounds=1,
+                 elite=0.2, smoothing=0.3, seed=None, checkpoint=None):
+        '''
+        Initializes the CrossEntropySearch class. Starts from random chances of each stand
+        total, or from the checkpoint file if it exists.
+
+        Inputs:
+            rules (Rules): The rules of the game; defaults to the original game.
+            edges (sequence): Running counts where each count bucket after the first starts;
+                one bucket if empty.
+            tags (dict): Count tags for each rank 'A' to 'K'; needed if edges are given.
+            candidates (int): Strategy tables tried in each generation.
+            tables (int): Deck orders each candidate is played on in each generation.
+            rounds (int): Rounds played from each deck order, so later rounds have a count
+                and less of the deck left. At least 2 if edges are given, since the first
+                round from a fresh deck order always has a running count of 0.
+            elite (float): Share of the candidates that the chances move toward.
+            smoothing (float): How far the chances move toward the elite in one generation.
+            seed (int): Seed for the chances, candidates and deck orders.
+            checkpoint (str): File the search is saved to after every generation.
+
+        Returns: None
+        '''
+        if rules is None:
+            rules = Rules()
+        assert len(edges) == 0 or tags is not None, 'Error: count buckets need count tags'
+        assert len(edges) == 0 or rounds > 1, 'Error: count buckets need 2+ rounds from each deck order'
+        assert candidates >= 2 and 0 < elite < 1, 'Error: need 2+ candidates and an elite share between 0 and 1'
+        self.__rules = rules
+        self.__edges = tuple(int(edge) for edge in edges)
+        self.__tags = tags
+        self.__candidates = candidates
+        self.__tables = tables
+        self.__rounds = rounds
+        self.__elites = max(1, int(round(elite * candidates)))
+        self.__smoothing = smoothing
+        self.__checkpoint = checkpoint
+
+        # stand totals below 4 play the same as 4, the lowest two card total
+        shape = (len(self.__edges) + 1, 10, rules.getBustLimit() + 1)
+        self.__rng = np.random.default_rng(seed)
+        self.__chances = self.__rng.random(shape)
+        self.__chances[..., :MIN_TOTAL] = 0.0
+        self.__chances /= self.__chances.sum(axis=2, keepdims=True)
+        self.__generation = 0
+        self.__scores = []
+        if checkpoint is not None and os.path.exists(checkpoint):
+            self.__load(checkpoint)
+
+
+    def __load(self, filename):
+        '''
+        Restores the search from a checkpoint file.
+
+        Inputs:
+            self is the CrossEntropySearch.
+            filename (str): The checkpoint file.
+
+        Returns: None
+        '''
+        with np.load(filename) as saved:
+            assert tuple(saved['edges']) == self.__edges, 'Error: checkpoint has different count buckets'
+            assert saved['chances'].shape == self.__chances.shape, 'Error: checkpoint has a different table shape'
+            self.__chances = saved['chances']
+            self.__generation = int(saved['generation'])
+            self.__scores = list(saved['scores'])
+            self.__rng.bit_generator.state = json.loads(str(saved['rng']))
+
+
+    def save(self, filename):
+        '''
+        Saves the search to a file, replacing the file only once it is fully written.
+
+        Inputs:
+            self is the CrossEntropySearch.
+            filename (str): The checkpoint file.
+
+        Returns: None
+        '''
+        temporary = filename + '.tmp'
+        with open(temporary, 'wb') as file:
+            np.savez(file, chances=self.__chances, generation=self.__generation, edges=np.array(self.__edges),
+                     scores=np.array(self.__scores), rng=json.dumps(self.__rng.bit_generator.state))
+        os.replace(temporary, filename)
+
+
+    def getGeneration(self):
+        '''
+        Returns the number of generations run.
+
+        Inputs:
+            self is the CrossEntropySearch.
+        '''
+        return self.__generation
+
+
+    def getScores(self):
+        '''
+        Returns the best candidate's mean outcome in each generation.
+
+        Inputs:
+            self is the CrossEntropySearch.
+        '''
+        return list(self.__scores)
+
+
+    def getChances(self):
+        '''
+        Returns a copy of the chance of each stand total, indexed by
+        [count bucket, upcard value - 1, stand total].
+
+        Inputs:
+            self is the CrossEntropySearch.
+        '''
+        return self.__chances.copy()
+
+
+    def getPolicy(self):
+        '''
+        Returns the most likely strategy table as a TablePolicy.
+
+        Inputs:
+            self is the CrossEntropySearch.
+        '''
+        hits = standTables(self.__chances.argmax(axis=2), self.__chances.shape[2])
+        if len(self.__edges) == 0:
+            return TablePolicy(hits[0])
+        return TablePolicy(hits, self.__edges)
+
+
+    def playTables(self, hits, orders, seed):
+        '''
+        Plays several strategy tables on the same deck orders in one TableBatch.
+
+        Inputs:
+            self is the CrossEntropySearch.
+            hits (ndarray): Bool tables indexed by [candidate, count bucket, upcard value - 1, player total].
+            orders (ndarray): A (tables, 52) array of deck orders shared by every table.
+            seed (int): Seed of the repopulation shuffles.
+
+        Returns (ndarray): A (candidates, tables) array of mean outcomes per round.
+        '''
+        count = len(hits)
+        tables = len(orders)
+        batch = TableBatch(np.tile(orders, (count, 1)), self.__rules, seed)
+        if self.__tags is not None:
+            batch.setCountTags(self.__tags)
+        policy = TablePolicy(hits if self.__edges else hits[:, 0], self.__edges, tables)
+        totals = np.zeros((count, tables))
+        for i in range(self.__rounds):
+            totals += batch.playRound(policy).reshape(count, tables)
+        return totals / self.__rounds
+
+
+    def step(self):
+        '''
+        Runs one generation: draws stand totals from the chances, scores the candidate tables
+        on shared deck orders and moves the chances toward the elite candidates.
+
+        Inputs:
+            self is the CrossEntropySearch.
+
+        Returns (float): Mean outcome of the best candidate.
+        '''
+        rng = self.__rng
+        size = self.__chances.shape[2]
+        cumulative = np.cumsum(self.__chances, axis=2)
+        draws = rng.random((self.__candidates, ) + cumulative.shape[:2] + (1, ))
+        stands = np.minimum((cumulative < draws * cumulative[..., -1:]).sum(axis=3), size - 1)
+        scores = self.playTables(standTables(stands, size), randomOrders(self.__tables, rng),
+                                 int(rng.integers(2 ** 63))).mean(axis=1)
+
+        elite = np.argsort(scores)[-self.__elites:]
+        frequencies = (stands[elite][..., None] == np.arange(size)).mean(axis=0)
+        self.__chances = self.__smoothing * frequencies + (1 - self.__smoothing) * self.__chances
+        self.__generation += 1
+        self.__scores.append(float(scores[elite[-1]]))
+        if self.__checkpoint is not None:
+            self.save(self.__checkpoint)
+        return self.__scores[-1]
+
+
+    def polish(self, tables=1000000, chunk=50000, z=2.5, passes=3):
+        '''
+        Fine-tunes the most likely table, whose last few cells can be too close to call for a
+        generation's candidates: every stand total is tried one step higher and lower on the
+        same deck orders, and a move is kept when it improves on the table by more than z
+        paired standard errors. The chances are then set to the polished table.
+
+        Inputs:
+            self is the CrossEntropySearch.
+            tables (int): Deck orders each move is scored on.
+            chunk (int): Deck orders played at once, to bound memory.
+            z (float): Standard errors a move must improve by.
+            passes (int): Most rounds of moves.
+
+        Returns (int): The number of moves kept.
+        '''
+        rng = self.__rng
+        size = self.__chances.shape[2]
+        stands = self.__chances.argmax(axis=2)
+        kept = 0
+        for i in range(passes):
+            moves = [(bucket, up, step) for bucket in range(stands.shape[0]) for up in range(10)
+                     for step in (-1, 1) if MIN_TOTAL <= stands[bucket, up] + step < size]
+            candidates = np.repeat(stands[None], len(moves) + 1, axis=0)
+            for j, (bucket, up, step) in enumerate(moves):
+                candidates[j + 1, bucket, up] += step
+
+            # paired differences from the current table, summed over the chunks
+            hits = standTables(candidates, size)
+            sums = np.zeros(len(moves))
+            squares = np.zeros(len(moves))
+            for first in range(0, tables, chunk):
+                outcomes = self.playTables(hits, randomOrders(min(chunk, tables - first), rng),
+                                           int(rng.integers(2 ** 63)))
+                differences = outcomes[1:] - outcomes[0]
+                sums += differences.sum(axis=1)
+                squares += (differences ** 2).sum(axis=1)
+            means = sums / tables
+            errors = np.sqrt(np.maximum(squares / tables - means ** 2, 0.0) / tables)
+
+            # keep the best significant move for each cell
+            improved = False
+            for bucket, up in {(bucket, up) for bucket, up, step in moves}:
+                options = [j for j, move in enumerate(moves) if move[:2] == (bucket, up)]
+                best = max(options, key=lambda j: means[j])
+                if means[best] > z * errors[best]:
+                    stands[bucket, up] += moves[best][2]
+                    kept += 1
+                    improved = True
+            if not improved:
+                break
+
+        self.__chances = (np.arange(size) == stands[..., None]).astype(float)
+        if self.__checkpoint is not None:
+            self.save(self.__checkpoint)
+        return kept
+
+
+    def run(self, generations, timeLimit=None):
+        '''
+        Runs generations until the given total is reached or time runs out.
+
+        Inputs:
+            self is the CrossEntropySearch.
+            generations (int): Total number of generations to reach, counting earlier runs.
+            timeLimit (float): Seconds to run for at most; no limit if not given.
+
+        Returns (int): The number of generations run.
+        '''
+        import time
+
+        start = time.perf_counter()
+        while self.__generation < generations:
+            if timeLimit is not None and time.perf_counter() - start > timeLimit:
+                break
+            self.step()
+        return self.__generation
+
+
+
+def policy_optimizer_tests():
+    '''
+    Tests for the policy optimizer.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import tempfile
+    import time
+    from autoPlay import ThresholdPolicy
+
+    rules = Rules()
+    basic = basicStrategy(rules)
+    print('Basic strategy:')
+    print(strategyText(basic))
+
+    # a table that hits below 17 plays exactly like the threshold policy
+    stand17 = np.zeros((10, 22), dtype=bool)
+    stand17[:, :17] = True
+    orders = randomOrders(2000, np.random.default_rng(40))
+    expected = TableBatch(orders, rules, 1).playRound(ThresholdPolicy(17))
+    is_pass = (TableBatch(orders, rules, 1).playRound(TablePolicy(stand17)) == expected).all()
+    assert is_pass == True, "fail the test"
+
+    # how often each cell is visited with basic strategy, to weight the comparison
+    visits = np.zeros((10, 22))
+
+    def visiting(playerValue, cardCount, upValue):
+        np.add.at(visits, (upValue - 1, playerValue), 1)
+        return basic[upValue - 1, playerValue]
+
+    TableBatch(randomOrders(200000, np.random.default_rng(41)), rules, 2).playRound(visiting)
+
+    # a resumed search continues exactly where the saved one stopped
+    with tempfile.TemporaryDirectory() as folder:
+        filename = folder + '/search.npz'
+        search = CrossEntropySearch(rules, candidates=10, tables=200, seed=5, checkpoint=filename)
+        search.run(3)
+        resumed = CrossEntropySearch(rules, candidates=10, tables=200, seed=99, checkpoint=filename)
+        search.run(5)
+        resumed.run(5)
+        is_pass = (resumed.getGeneration() == 5 and np.array_equal(resumed.getChances(), search.getChances()))
+        assert is_pass == True, "fail the test"
+
+    # from random chances to basic strategy; cells still different are ones where the two
+    # choices are too close to tell apart with this many rounds
+    search = CrossEntropySearch(rules, seed=40)
+    start = time.perf_counter()
+    search.run(60)
+    kept = search.polish(tables=500000)
+    elapsed = time.perf_counter() - start
+    found = search.getPolicy().getHits()
+    agreement = (visits * (found == basic)).sum() / visits.sum()
+    print('Found after %d generations and %d polishing moves in %.0f s, agreeing with basic strategy'
+          ' on %.2f%% of decisions:' % (search.getGeneration(), kept, elapsed, agreement * 100))
+    print(strategyText(found))
+    stand_gap = found[:, MIN_TOTAL:].sum(axis=1) - basic[:, MIN_TOTAL:].sum(axis=1)
+    is_pass = (agreement > 0.95 and (np.abs(stand_gap) <= 1).all())
+    assert is_pass == True, "fail the test"
+
+
+if __name__ == "__main__":
+    policy_optimizer_tests()
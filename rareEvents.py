@@ -0,0 +1,317 @@
+# Importance sampling of rare rounds for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+#
+# Every round is dealt from a freshly shuffled deck, as in a tournament without --persistent.
+# Instead of dealing each card uniformly from the cards left, a card of value v is dealt with
+# chance proportional to (cards of value v left) * weights[v], with separate weights for the
+# player's and the dealer's cards. Each round then carries its likelihood ratio, the chance of
+# its cards under a fair shuffle over their chance under the weighted dealing, so the weighted
+# mean of any event is an unbiased estimate of its chance under a fair shuffle.
+
+
+from collections import namedtuple
+from gameRules import Rules
+import numpy as np
+
+
+FULL_DECK = (4, 4, 4, 4, 4, 4, 4, 4, 4, 16)
+
+RoundArrays = namedtuple('RoundArrays', 'playerValue playerCards dealerValue dealerCards outcome')
+Estimate = namedtuple('Estimate', 'probability standardError effectiveSamples hits rounds plainRounds')
+
+# named events, as functions of the rounds and the rules, and the (player, dealer) tilts that
+# make them common; player21six is reaching the bust limit, 21 in the original game
+EVENTS = {
+    'dealer5': lambda rounds, rules: rounds.dealerCards >= 5,
+    'player21six': lambda rounds, rules: (rounds.playerCards >= 6) & (rounds.playerValue == rules.getBustLimit()),
+}
+EVENT_TILTS = {'dealer5': (0.0, 0.25), 'player21six': (0.35, 0.0)}
+
+
+def tiltWeights(tilt):
+    '''
+    Returns dealing weights that favour low cards: a card of value v is weighted
+    exp(-tilt * (v - 1)). A tilt of 0 deals fairly and a negative tilt favours high cards.
+
+    Inputs:
+        tilt (float): How strongly to favour low cards.
+
+    Returns (ndarray): Weights of values 1 to 10.
+    '''
+    return np.exp(-tilt * np.arange(10))
+
+
+
+class ImportanceSampler:
+    # Plays rounds from fresh decks with weighted dealing, keeping each round's likelihood ratio.
+
+    def __init__(self, policy, rules=None, playerWeights=None, dealerWeights=None):
+        '''
+        Initializes the ImportanceSampler class.
+
+        Inputs:
+            policy (callable): Vectorized hit/stay policy.
+            rules (Rules): The rules of the game; defaults to the original game.
+            playerWeights (ndarray): Dealing weights of values 1 to 10 for the player's cards;
+                fair dealing if not given.
+            dealerWeights (ndarray): Dealing weights of values 1 to 10 for the dealer's cards;
+                fair dealing if not given.
+
+        Returns: None
+        '''
+        if rules is None:
+            rules = Rules()
+        self.__policy = policy
+        self.__rules = rules
+        self.__playerWeights = self.__checkWeights(playerWeights)
+        self.__dealerWeights = self.__checkWeights(dealerWeights)
+
+
+    def __checkWeights(self, weights):
+        '''
+        Returns the weights as a float array, or all ones if not given.
+
+        Inputs:
+            self is the ImportanceSampler.
+            weights (sequence): Weights of values 1 to 10.
+        '''
+        if weights is None:
+            return np.ones(10)
+        weights = np.asarray(weights, dtype=float)
+        assert weights.shape == (10, ) and (weights > 0).all(), 'Error: weights must be 10 positive numbers'
+        return weights
+
+
+    def __draw(self, counts, ratios, rows, weights, rng):
+        '''
+        Deals one card to each round in rows with weighted dealing, taking it out of the round's
+        cards and multiplying the round's likelihood ratio by fair chance / weighted chance.
+
+        Inputs:
+            self is the ImportanceSampler.
+            counts (ndarray): A (rounds, 10) array of cards left of each value; changed.
+            ratios (ndarray): Likelihood ratio of each round; changed.
+            rows (ndarray): Indexes of the rounds to deal to.
+            weights (ndarray): Dealing weights of values 1 to 10.
+            rng (Generator): NumPy random generator.
+
+        Returns (ndarray): The values (1 to 10) dealt.
+        '''
+        left = counts[rows]
+        weighted = left * weights
+        cumulative = np.cumsum(weighted, axis=1)
+        total = cumulative[:, -1]
+        picks = (cumulative < rng.random(len(rows))[:, None] * total[:, None]).sum(axis=1)
+
+        # fair chance is left[v] / cards left, weighted chance is left[v] * weights[v] / total
+        ratios[rows] *= total / (left.sum(axis=1) * weights[picks])
+        counts[rows, picks] -= 1
+        return picks + 1
+
+
+    def playRounds(self, rounds, rng=None):
+        '''
+        Plays rounds from fresh decks the same way autoPlay.playRound plays a Table.
+
+        Inputs:
+            self is the ImportanceSampler.
+            rounds (int): Number of rounds.
+            rng (Generator): NumPy random generator; a new one is made if not given.
+
+        Returns (tuple): (RoundArrays of the rounds, likelihood ratio of each round).
+        '''
+        if rng is None:
+            rng = np.random.default_rng()
+        rules = self.__rules
+        limit = rules.getBustLimit()
+        threshold = rules.getStandThreshold()
+        player_weights = self.__playerWeights
+        dealer_weights = self.__dealerWeights
+
+        counts = np.tile(np.array(FULL_DECK, dtype=np.int64), (rounds, 1))
+        ratios = np.ones(rounds)
+        everyone = np.arange(rounds)
+        player_value = self.__draw(counts, ratios, everyone, player_weights, rng)
+        up_value = self.__draw(counts, ratios, everyone, dealer_weights, rng)
+        player_value += self.__draw(counts, ratios, everyone, player_weights, rng)
+        dealer_value = up_value + self.__draw(counts, ratios, everyone, dealer_weights, rng)
+        player_cards = np.full(rounds, 2)
+        dealer_cards = np.full(rounds, 2)
+
+        # player turn, as in TableBatch.playRound
+        hit_count = np.zeros(rounds, dtype=np.int64)
+        deciding = everyone[player_value <= limit]
+        while len(deciding) > 0:
+            hit = np.asarray(self.__policy(player_value[deciding], player_cards[deciding], up_value[deciding]),
+                             dtype=bool)
+            deciding = deciding[hit]
+            if len(deciding) == 0:
+                break
+            player_value[deciding] += self.__draw(counts, ratios, deciding, player_weights, rng)
+            player_cards[deciding] += 1
+            hit_count[deciding] += 1
+            deciding = deciding[player_value[deciding] <= limit]
+
+        player_bust = player_value > limit
+        player_natural = (hit_count > 0) & (player_value == limit)
+
+        # dealer turn where the round is not already decided
+        dealing = np.flatnonzero(~player_bust & ~player_natural)
+        dealing = dealing[dealer_value[dealing] < threshold]
+        while len(dealing) > 0:
+            dealer_value[dealing] += self.__draw(counts, ratios, dealing, dealer_weights, rng)
+            dealer_cards[dealing] += 1
+            dealing = dealing[dealer_value[dealing] < threshold]
+
+        outcomes = np.sign(player_value - dealer_value)
+        if rules.getTiePolicy() == 'dealer':
+            outcomes[outcomes == 0] = -1
+        elif rules.getTiePolicy() == 'player':
+            outcomes[outcomes == 0] = 1
+        outcomes[dealer_value > limit] = 1
+        outcomes[player_natural] = 1
+        outcomes[player_bust] = -1
+        return RoundArrays(player_value, player_cards, dealer_value, dealer_cards, outcomes), ratios
+
+
+    def estimate(self, event, rounds, rng=None, chunk=100000):
+        '''
+        Estimates the chance of an event in a round under a fair shuffle.
+
+        Inputs:
+            self is the ImportanceSampler.
+            event (str or callable): Name in EVENTS, checked under the sampler's rules, or a
+                function of RoundArrays returning a bool array.
+            rounds (int): Number of rounds to play.
+            rng (Generator): NumPy random generator; a new one is made if not given.
+            chunk (int): Most rounds played at once, to bound memory.
+
+        Returns (Estimate): The chance, its standard error, the effective sample size of the
+            weighted hits (Kish), the rounds in which the event happened, the rounds played
+            and how many fair rounds would give the same standard error.
+        '''
+        if isinstance(event, str):
+            named = EVENTS[event]
+            event = lambda arrays: named(arrays, self.__rules)
+        if rng is None:
+            rng = np.random.default_rng()
+
+        # sums of the weighted indicator and its square, kept over the chunks
+        total = 0.0
+        squares = 0.0
+        hits = 0
+        done = 0
+        while done < rounds:
+            size = min(chunk, rounds - done)
+            arrays, ratios = self.playRounds(size, rng)
+            scores = np.where(event(arrays), ratios, 0.0)
+            total += scores.sum()
+            squares += (scores ** 2).sum()
+            hits += int(np.count_nonzero(scores))
+            done += size
+
+        probability = total / rounds
+        variance = max(squares / rounds - probability ** 2, 0.0)
+        error = np.sqrt(variance / rounds)
+        samples = total ** 2 / squares if squares > 0 else 0.0
+        plain = probability * (1 - probability) / error ** 2 if error > 0 else float('inf')
+        return Estimate(probability, error, samples, hits, rounds, plain)
+
+
+
+def rare_events_tests():
+    '''
+    Tests for importance sampling.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import functools
+    import time
+    from autoPlay import ThresholdPolicy
+    from tableBatch import TableBatch, randomOrders
+
+    policy = ThresholdPolicy(17)
+    rng = np.random.default_rng(39)
+
+    # with fair dealing every likelihood ratio is 1 and the rounds match a TableBatch
+    arrays, ratios = ImportanceSampler(policy).playRounds(200000, rng)
+    is_pass = ((ratios == 1).all() and (arrays.playerCards >= 2).all())
+    assert is_pass == True, "fail the test"
+    batch = TableBatch(randomOrders(200000, rng))
+    fair = np.mean(arrays.outcome)
+    batch_mean = np.mean(batch.playRound(policy))
+    is_pass = (abs(fair - batch_mean) < 0.012)
+    assert is_pass == True, "fail the test"
+
+    # likelihood ratios have mean 1 under any weights, and tilting keeps common estimates unbiased
+    sampler = ImportanceSampler(policy, playerWeights=tiltWeights(0.2), dealerWeights=tiltWeights(-0.1))
+    arrays, ratios = sampler.playRounds(200000, rng)
+    is_pass = (abs(ratios.mean() - 1) < 0.02 and abs(np.mean(ratios * arrays.outcome) - batch_mean) < 0.03)
+    assert is_pass == True, "fail the test"
+
+    # the exact chance the dealer ends with five or more cards when the player never hits
+    @functools.lru_cache(maxsize=None)
+    def dealerCards(counts, total, cards):
+        if total >= 17:
+            return float(cards >= 5)
+        left = sum(counts)
+        chance = 0.0
+        for value in range(10):
+            if counts[value]:
+                after = counts[:value] + (counts[value] - 1, ) + counts[value + 1:]
+                chance += counts[value] / left * dealerCards(after, total + value + 1, cards + 1)
+        return chance
+
+    exact = 0.0
+    counts = list(FULL_DECK)
+    for first in range(10):
+        for second in range(10):
+            for up in range(10):
+                for hole in range(10):
+                    chance = 1.0
+                    for value in (first, up, second, hole):
+                        chance *= counts[value] / sum(counts)
+                        counts[value] -= 1
+                    if chance > 0:
+                        exact += chance * dealerCards(tuple(counts), up + hole + 2, 2)
+                    for value in (first, up, second, hole):
+                        counts[value] += 1
+
+    sampler = ImportanceSampler(ThresholdPolicy(0), dealerWeights=tiltWeights(EVENT_TILTS['dealer5'][1]))
+    estimate = sampler.estimate('dealer5', 200000, rng)
+    is_pass = (abs(estimate.probability - exact) < 4 * estimate.standardError)
+    assert is_pass == True, "fail the test"
+    is_pass = (estimate.plainRounds > 2 * estimate.rounds)
+    assert is_pass == True, "fail the test"
+
+    # reaching 21 means reaching the bust limit under other rules
+    rules = Rules(22, 'push', 25)
+    arrays, ratios = ImportanceSampler(ThresholdPolicy(22), rules).playRounds(100000, np.random.default_rng(5))
+    estimate = ImportanceSampler(ThresholdPolicy(22), rules).estimate('player21six', 100000, np.random.default_rng(5))
+    expected = np.mean((arrays.playerCards >= 6) & (arrays.playerValue == 25))
+    is_pass = (expected > 0 and abs(estimate.probability - expected) < 1e-12)
+    assert is_pass == True, "fail the test"
+
+    # rare events under the usual play, fair against tilted dealing with the same number of rounds
+    for name, (player_tilt, dealer_tilt) in EVENT_TILTS.items():
+        fair = ImportanceSampler(policy).estimate(name, 200000, rng)
+        start = time.perf_counter()
+        tilted = ImportanceSampler(policy, playerWeights=tiltWeights(player_tilt),
+                                   dealerWeights=tiltWeights(dealer_tilt)).estimate(name, 200000, rng)
+        elapsed = time.perf_counter() - start
+        is_pass = (abs(fair.probability - tilted.probability) < 4 * np.hypot(fair.standardError, tilted.standardError)
+                   and tilted.standardError < fair.standardError)
+        assert is_pass == True, "fail the test"
+        print('%s: fair %.3e +- %.1e (%d hits), tilted %.3e +- %.1e (%d hits, ESS %.0f) in %.2f s,'
+              ' worth %.1e fair rounds (%.0fx)'
+              % (name, fair.probability, fair.standardError, fair.hits, tilted.probability, tilted.standardError,
+                 tilted.hits, tilted.effectiveSamples, elapsed, tilted.plainRounds,
+                 tilted.plainRounds / tilted.rounds))
+
+
+if __name__ == "__main__":
+    rare_events_tests()
@@ -0,0 +1,371 @@
+# Composition-dependent expected value and effects of removal for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+#
+# A composition is how many cards of each value 1-10 are left to deal (index 0 is the Ace,
+# index 9 counts T, J, Q and K together). The expected value is for one round dealt from the
+# composition with the player hitting or staying as well as possible after seeing their cards
+# and the dealer's upcard, and every card drawn is taken out of the composition (no repopulation).
+#
+# Sub-results are cached by the exact cards left, so compositions that differ by a card or two
+# share most of their work: the round after removing a 5 reaches many of the same states as
+# the round from the full deck in which a 5 was drawn.
+
+
+from gameRules import Rules, OUTCOME_VALUES
+from playingCards import RANKS
+import numpy as np
+
+
+FULL_DECK = (4, 4, 4, 4, 4, 4, 4, 4, 4, 16)
+
+# each card value gets a digit of this base in the cache keys
+KEY_BASE = 256
+
+
+class CompositionEV:
+    # Exact expected value of a round for any composition, with cached sub-results.
+
+    def __init__(self, rules=None):
+        '''
+        Initializes the CompositionEV class.
+
+        Inputs:
+            rules (Rules): The rules of the game; defaults to the original game.
+
+        Returns: None
+        '''
+        if rules is None:
+            rules = Rules()
+        self.__rules = rules
+        self.__threshold = rules.getStandThreshold()
+        self.__limit = rules.getBustLimit()
+        self.__tie = OUTCOME_VALUES[rules.compare(0, 0)]
+        self.__digits = [KEY_BASE ** value for value in range(10)]
+        self.__dealerCache = {}
+        self.__playerCache = {}
+
+
+    def getRules(self):
+        '''
+        Returns the Rules used.
+
+        Inputs:
+            self is the CompositionEV.
+        '''
+        return self.__rules
+
+
+    def getCacheSize(self):
+        '''
+        Returns the number of cached dealer and player states.
+
+        Inputs:
+            self is the CompositionEV.
+
+        Returns (tuple): (dealer states, player states).
+        '''
+        return len(self.__dealerCache), len(self.__playerCache)
+
+
+    def clearCache(self):
+        '''
+        Empties the caches.
+
+        Inputs:
+            self is the CompositionEV.
+
+        Returns: None
+        '''
+        self.__dealerCache = {}
+        self.__playerCache = {}
+
+
+    def __dealer(self, counts, key, total, left):
+        '''
+        Returns the distribution of the dealer's final hand when the dealer draws from total.
+        The first draw is always taken, so this also covers turning up the hole card.
+
+        Inputs:
+            self is the CompositionEV.
+            counts (list): Cards left of each value; changed while working but put back.
+            key (int): Cache key of counts.
+            total (int): The dealer's hand total before drawing.
+            left (int): Number of cards left.
+
+        Returns (tuple): Probability of finishing on each total from the stand threshold to
+            the bust limit, then of going bust.
+        '''
+        state = key * 64 + total
+        distribution = self.__dealerCache.get(state)
+        if distribution is not None:
+            return distribution
+
+        threshold = self.__threshold
+        limit = self.__limit
+        finals = [0.0] * (limit - threshold + 2)
+        for value in range(10):
+            count = counts[value]
+            if not count:
+                continue
+            chance = count / left
+            new_total = total + value + 1
+            if new_total > limit:
+                finals[-1] += chance
+            elif new_total >= threshold:
+                finals[new_total - threshold] += chance
+            else:
+                counts[value] = count - 1
+                after = self.__dealer(counts, key - self.__digits[value], new_total, left - 1)
+                counts[value] = count
+                for i in range(len(finals)):
+                    finals[i] += chance * after[i]
+
+        distribution = tuple(finals)
+        self.__dealerCache[state] = distribution
+        return distribution
+
+
+    def __stand(self, counts, key, total, upValue, left):
+        '''
+        Returns the expected outcome of staying on total; the dealer then turns up the hole
+        card and plays from the cards left.
+
+        Inputs:
+            self is the CompositionEV.
+            counts (list): Cards left of each value.
+            key (int): Cache key of counts.
+            total (int): The player's hand total.
+            upValue (int): Value of the dealer's upcard.
+            left (int): Number of cards left.
+
+        Returns (float): The expected outcome.
+        '''
+        finals = self.__dealer(counts, key, upValue, left)
+        expected = finals[-1]
+        for i in range(len(finals) - 1):
+            dealer_total = self.__threshold + i
+            if total > dealer_total:
+                expected += finals[i]
+            elif total < dealer_total:
+                expected -= finals[i]
+            else:
+                expected += self.__tie * finals[i]
+        return expected
+
+
+    def __player(self, counts, key, total, upValue, left):
+        '''
+        Returns the expected outcome of the best play from a player hand that has not gone
+        bust or hit to the bust limit.
+
+        Inputs:
+            self is the CompositionEV.
+            counts (list): Cards left of each value; changed while working but put back.
+            key (int): Cache key of counts.
+            total (int): The player's hand total.
+            upValue (int): Value of the dealer's upcard.
+            left (int): Number of cards left.
+
+        Returns (float): The expected outcome.
+        '''
+        state = (key * 64 + total) * 16 + upValue
+        expected = self.__playerCache.get(state)
+        if expected is not None:
+            return expected
+
+        # hitting to exactly the limit wins at once, going over loses at once
+        limit = self.__limit
+        hit = 0.0
+        for value in range(10):
+            count = counts[value]
+            if not count:
+                continue
+            chance = count / left
+            new_total = total + value + 1
+            if new_total > limit:
+                hit -= chance
+            elif new_total == limit:
+                hit += chance
+            else:
+                counts[value] = count - 1
+                hit += chance * self.__player(counts, key - self.__digits[value], new_total, upValue, left - 1)
+                counts[value] = count
+
+        expected = max(self.__stand(counts, key, total, upValue, left), hit)
+        self.__playerCache[state] = expected
+        return expected
+
+
+    def expectedValue(self, composition=FULL_DECK):
+        '''
+        Returns the player's expected outcome per round (1 win, 0 tie, -1 loss) for a round
+        dealt from the composition with the best hit/stay play.
+
+        Inputs:
+            self is the CompositionEV.
+            composition (sequence): Cards left of each value 1-10.
+
+        Returns (float): The expected outcome.
+        '''
+        counts = [int(count) for count in composition]
+        assert len(counts) == 10 and min(counts) >= 0, 'Error: composition must give 10 counts'
+        assert max(counts) < KEY_BASE, 'Error: too many cards of one value'
+        left = sum(counts)
+        assert left >= 4, 'Error: composition must hold at least four cards'
+        key = sum(count * digit for count, digit in zip(counts, self.__digits))
+        limit = self.__limit
+
+        # player's two cards and the dealer's upcard, in the order they are dealt
+        expected = 0.0
+        for first in range(10):
+            first_chance = counts[first] / left
+            if not first_chance:
+                continue
+            counts[first] -= 1
+            for up in range(10):
+                up_chance = counts[up] / (left - 1)
+                if not up_chance:
+                    continue
+                counts[up] -= 1
+                for second in range(10):
+                    chance = first_chance * up_chance * counts[second] / (left - 2)
+                    if not chance:
+                        continue
+                    counts[second] -= 1
+                    total = first + second + 2
+                    if total > limit:
+                        outcome = -1
+                    else:
+                        outcome = self.__player(counts, key - self.__digits[first] - self.__digits[up]
+                                                - self.__digits[second], total, up + 1, left - 3)
+                    expected += chance * outcome
+                    counts[second] += 1
+                counts[up] += 1
+            counts[first] += 1
+        return expected
+
+
+    def removalEffects(self, composition=FULL_DECK):
+        '''
+        Returns the effect of removal of each card value: how much the player's expected
+        value changes when one card of that value is taken out of the composition.
+
+        Inputs:
+            self is the CompositionEV.
+            composition (sequence): Cards left of each value 1-10.
+
+        Returns (ndarray): Ten changes in expected value, for values 1 to 10.
+        '''
+        base = self.expectedValue(composition)
+        effects = np.zeros(10)
+        for value in range(10):
+            if composition[value] == 0:
+                continue
+            removed = list(composition)
+            removed[value] -= 1
+            effects[value] = self.expectedValue(removed) - base
+        return effects
+
+
+
+def countTags(effects, level=1):
+    '''
+    Returns count tags for Deck.setCountTags from effects of removal. Cards whose removal
+    helps the player count up when dealt, so a high running count means a better deck.
+
+    Inputs:
+        effects (ndarray): Effects of removal of values 1 to 10.
+        level (int): Largest tag; 1 gives a single level count.
+
+    Returns (dict): Integer tag for each rank 'A' to 'K'.
+    '''
+    effects = np.asarray(effects, dtype=float)
+    scaled = np.rint(effects / np.abs(effects).max() * level).astype(int)
+    return {rank: int(scaled[min(i, 9)]) for i, rank in enumerate(RANKS)}
+
+
+def countQuality(effects, tags):
+    '''
+    Returns the betting correlation of a count: the correlation between the effects of
+    removal and the tags, weighting each value by how many cards it has in a full deck.
+
+    Inputs:
+        effects (ndarray): Effects of removal of values 1 to 10.
+        tags (dict): Tag for each rank.
+
+    Returns (float): The correlation, 1 for a perfect count.
+    '''
+    weights = np.array(FULL_DECK, dtype=float)
+    values = np.array([tags[rank] for rank in RANKS[:10]], dtype=float)
+    effects = np.asarray(effects, dtype=float)
+    effect_mean = np.average(effects, weights=weights)
+    value_mean = np.average(values, weights=weights)
+    covariance = np.average((effects - effect_mean) * (values - value_mean), weights=weights)
+    return covariance / np.sqrt(np.average((effects - effect_mean) ** 2, weights=weights)
+                                * np.average((values - value_mean) ** 2, weights=weights))
+
+
+
+def removal_effects_tests():
+    '''
+    Tests for the effects of removal.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import random
+    import time
+    from autoPlay import playRound, ThresholdPolicy
+    from playingCards import Deck, SUITS
+    from simple21 import Table
+
+    # a deck of only tens: the player stays on 20 and the dealer always has 20
+    engine = CompositionEV()
+    is_pass = (engine.expectedValue([0] * 9 + [8]) == 0.0)
+    assert is_pass == True, "fail the test"
+
+    # effects of removal for the full deck
+    start = time.perf_counter()
+    base = engine.expectedValue()
+    single = time.perf_counter() - start
+    start = time.perf_counter()
+    effects = engine.removalEffects()
+    elapsed = time.perf_counter() - start
+    print('EV %.5f in %.2f s; all ten effects of removal in %.2f s with %d + %d cached states'
+          % (base, single, elapsed, *engine.getCacheSize()))
+    print('Effects of removal (%%): %s' % ' '.join('%+.3f' % (effect * 100) for effect in effects))
+
+    # with caching, the ten neighbours cost much less than ten fresh solves
+    fresh = CompositionEV()
+    start = time.perf_counter()
+    fresh.expectedValue([4, 4, 4, 4, 3, 4, 4, 4, 4, 16])
+    is_pass = (elapsed < 10 * (time.perf_counter() - start))
+    assert is_pass == True, "fail the test"
+
+    # best play does at least as well as standing on 15 from a fresh deck every round
+    codes = [rank + suit for rank in RANKS for suit in SUITS]
+    random.seed(36)
+    total = 0
+    for i in range(20000):
+        random.shuffle(codes)
+        total += playRound(Table(deck=Deck(codes=codes), verbose=False), ThresholdPolicy(15))
+    is_pass = (total / 20000 < base + 0.02)
+    assert is_pass == True, "fail the test"
+
+    # the effects become tags for the running count on a Deck
+    tags = countTags(effects)
+    is_pass = (tags['5'] == 1 and tags['K'] == tags['T'] == -1)
+    assert is_pass == True, "fail the test"
+    print('Tags %s, betting correlation %.3f' % (tags, countQuality(effects, tags)))
+    deck = Deck(codes=codes)
+    deck.setCountTags(tags)
+    dealt = [deck.deal() for i in range(10)]
+    is_pass = (deck.getRunningCount() == sum(tags[card.getRank()] for card in dealt))
+    assert is_pass == True, "fail the test"
+
+
+if __name__ == "__main__":
+    removal_effects_tests()
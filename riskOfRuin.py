@@ -0,0 +1,263 @@
+# Exact session outcomes and risk of ruin for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+#
+# With one unit bet a round, a session is a random walk that steps +1, 0 or -1 with the
+# round's win, tie and lose chances, which come from the infinite-deck dealer model. The net
+# result after N rounds is the N-fold convolution of that step, found with one FFT (raise the
+# transform of the step to the Nth power and transform back). The chance of going broke at
+# any point in the session is path dependent, but for a walk with unit steps it follows from
+# the final distribution by reflecting the path at the first time it reaches -bankroll, so no
+# round-by-round recursion is needed.
+
+
+from collections import namedtuple
+from dealerModel import CARD_PROBS, CARD_VALUES, dealerFinalDistribution, standOutcomes
+from gameRules import Rules
+import numpy as np
+
+
+RoundChances = namedtuple('RoundChances', 'win tie lose')
+
+
+def roundChances(policy, rules=None):
+    '''
+    Finds the chance of winning, tying and losing a round with the given policy on an infinite
+    deck, in the same order of checks as assignment2: going bust loses, hitting to the bust
+    limit wins straight away, otherwise the dealer plays and the totals are compared.
+
+    Inputs:
+        policy (callable): Called with (playerValue, cardCount, upValue); returns True to hit.
+        rules (Rules): The rules of the game; defaults to the original game.
+
+    Returns (RoundChances): The (win, tie, lose) chances of a round.
+    '''
+    if rules is None:
+        rules = Rules()
+    limit = rules.getBustLimit()
+    win_stand, tie_stand, lose_stand = standOutcomes(rules)
+
+    # a two card hand on the limit is not a natural, so it is compared with the dealer
+    distribution = dealerFinalDistribution(rules)
+    below = np.cumsum(distribution[:, :limit + 1], axis=1)[:, limit - 1]
+    dealt = (distribution[:, -1] + below, distribution[:, limit], np.zeros(10))
+    if rules.getTiePolicy() != 'push':
+        dealt = (dealt[0] + dealt[1] * (rules.getTiePolicy() == 'player'), np.zeros(10),
+                 dealt[1] * (rules.getTiePolicy() == 'dealer'))
+
+    # hitting only raises the total, so each hand is finished before any hand it can become;
+    # a hand of total t has at most t cards
+    two_cards = np.convolve(np.concatenate(([0.0], CARD_PROBS)), np.concatenate(([0.0], CARD_PROBS)))
+    win = tie = lose = 0.0
+    for up in range(10):
+        hands = np.zeros((limit + 1, limit + 2))
+        hands[:min(len(two_cards), limit + 1), 2] = two_cards[:limit + 1]
+        up_lose = two_cards[limit + 1:].sum()
+        up_win = up_tie = 0.0
+        for total in range(2, limit + 1):
+            for cards in np.flatnonzero(hands[total]):
+                chance = hands[total, cards]
+                if cards > 2 and rules.isNatural(total):
+                    up_win += chance
+                elif policy(total, int(cards), up + 1):
+                    for value, value_chance in zip(CARD_VALUES, CARD_PROBS):
+                        if rules.isBust(total + value):
+                            up_lose += chance * value_chance
+                        else:
+                            hands[total + value, cards + 1] += chance * value_chance
+                elif cards == 2 and total == limit:
+                    up_win += chance * dealt[0][up]
+                    up_tie += chance * dealt[1][up]
+                    up_lose += chance * dealt[2][up]
+                else:
+                    up_win += chance * win_stand[up, total]
+                    up_tie += chance * tie_stand[up, total]
+                    up_lose += chance * lose_stand[up, total]
+        win += CARD_PROBS[up] * up_win
+        tie += CARD_PROBS[up] * up_tie
+        lose += CARD_PROBS[up] * up_lose
+    return RoundChances(float(win), float(tie), float(lose))
+
+
+def sessionDistribution(chances, rounds):
+    '''
+    Finds the distribution of the net result of a session of unit bets by FFT convolution.
+
+    Inputs:
+        chances (RoundChances): The (win, tie, lose) chances of a round.
+        rounds (int): Number of rounds in the session.
+
+    Returns (ndarray): An array of length 2 * rounds + 1 where entry i is the chance of
+        finishing the session i - rounds units up.
+    '''
+    assert isinstance(rounds, int) and rounds >= 0, 'Error: rounds must be a non-negative int'
+    assert abs(sum(chances) - 1) < 1e-9, 'Error: the round chances must add up to 1'
+
+    # the transform of one step, on a circle long enough that the sum never wraps around
+    size = 1 << (2 * rounds).bit_length()
+    angles = 2 * np.pi * np.arange(size // 2 + 1) / size
+    step = chances.tie + chances.win * np.exp(-1j * angles) + chances.lose * np.exp(1j * angles)
+    circle = np.fft.irfft(step ** rounds, size)
+
+    # losses wrapped around to the end of the circle
+    distribution = np.concatenate((circle[size - rounds:], circle[:rounds + 1])) if rounds else circle[:1]
+    distribution = np.clip(distribution, 0.0, None)
+    return distribution / distribution.sum()
+
+
+def riskOfRuin(chances, bankroll, rounds, distribution=None):
+    '''
+    Finds the chance of losing the whole bankroll at some point in a session of unit bets.
+    Reflecting a path after it first reaches -bankroll turns wins into losses, which changes
+    its chance by a power of win / lose, so with k = final - (-bankroll) the paths that are
+    ruined and finish above -bankroll add up to sum over k of (win / lose) ** k times the
+    chance of finishing at -bankroll - k. When wins are more likely than losses the same sum
+    is (lose / win) ** bankroll times the chance of finishing above bankroll, which keeps
+    every weight at most 1.
+
+    Inputs:
+        chances (RoundChances): The (win, tie, lose) chances of a round.
+        bankroll (int or ndarray): Starting bankroll in units.
+        rounds (int): Number of rounds in the session.
+        distribution (ndarray): The result of sessionDistribution, if already found.
+
+    Returns (float or ndarray): The chance of ruin for each bankroll.
+    '''
+    if distribution is None:
+        distribution = sessionDistribution(chances, rounds)
+    bankrolls = np.asarray(bankroll)
+    assert np.all(bankrolls >= 0), 'Error: bankroll must not be negative'
+    below = np.concatenate(([0.0], np.cumsum(distribution)))
+
+    # chance of finishing at or below -b, for every b from 0 to rounds + 1
+    finish = below[np.clip(rounds - np.arange(rounds + 2) + 1, 0, None)]
+    if chances.win == 0 or chances.lose == 0:
+        reflected = np.zeros(rounds + 2)
+    elif chances.win <= chances.lose:
+        # reflected[b] = sum over k >= 1 of (win / lose) ** k * P(final = -b - k)
+        ratio = chances.win / chances.lose
+        reflected = np.zeros(rounds + 2)
+        for b in range(rounds - 1, -1, -1):
+            reflected[b] = ratio * (distribution[rounds - b - 1] + reflected[b + 1])
+    else:
+        # reflected[b] = (lose / win) ** b * P(final > b)
+        above = 1.0 - below[np.clip(rounds + np.arange(rounds + 2) + 1, None, 2 * rounds + 1)]
+        reflected = (chances.lose / chances.win) ** np.arange(rounds + 2) * above
+    ruin = np.where(bankrolls == 0, 1.0, finish[np.clip(bankrolls, 0, rounds + 1)]
+                    + reflected[np.clip(bankrolls, 0, rounds + 1)])
+    return float(ruin) if ruin.ndim == 0 else ruin
+
+
+def ruinReport(chances, rounds, bankrolls, percentiles=(5, 25, 50, 75, 95)):
+    '''
+    Returns a report of a session's net result and its risk of ruin for several bankrolls.
+
+    Inputs:
+        chances (RoundChances): The (win, tie, lose) chances of a round.
+        rounds (int): Number of rounds in the session.
+        bankrolls (list): Starting bankrolls in units.
+        percentiles (tuple): Percentiles of the net result to show.
+
+    Returns (str): The report.
+    '''
+    distribution = sessionDistribution(chances, rounds)
+    net = np.arange(-rounds, rounds + 1)
+    mean = float(distribution @ net)
+    spread = float(np.sqrt(distribution @ (net - mean) ** 2))
+    below = np.cumsum(distribution)
+    lines = ['Round: win %.4f, tie %.4f, lose %.4f (edge %+.4f a round)'
+             % (chances.win, chances.tie, chances.lose, chances.win - chances.lose),
+             'Net after %d rounds: mean %+.2f, standard deviation %.2f' % (rounds, mean, spread),
+             'Percentiles: ' + ', '.join('p%d %+d' % (percentile, net[np.searchsorted(below, percentile / 100)])
+                                         for percentile in percentiles)]
+    ruin = riskOfRuin(chances, np.array(bankrolls), rounds, distribution)
+    lines.append('%10s %12s' % ('bankroll', 'ruin'))
+    lines.extend('%10d %12.6f' % (bankroll, chance) for bankroll, chance in zip(bankrolls, ruin))
+    return '\n'.join(lines)
+
+
+
+def risk_of_ruin_tests():
+    '''
+    Tests for exact session outcomes and risk of ruin.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import random
+    import time
+    from autoPlay import ThresholdPolicy, playRounds
+    from playingCards import Deck, RANKS, SUITS
+    from simple21 import Table
+
+    policy = ThresholdPolicy(17)
+    chances = roundChances(policy)
+    is_pass = (abs(sum(chances) - 1) < 1e-12 and chances.lose > chances.win)
+    assert is_pass == True, "fail the test"
+
+    # never hitting stands on the two card total against every upcard
+    never = roundChances(ThresholdPolicy(0))
+    totals = np.convolve(CARD_PROBS, CARD_PROBS)
+    win, tie, lose = standOutcomes(Rules())
+    is_pass = abs(never.win - CARD_PROBS @ win[:, 2:21] @ totals[:19]) < 1e-12
+    assert is_pass == True, "fail the test"
+
+    # the FFT matches a direct convolution, and ruin matches a walk with an absorbing barrier
+    rounds = 60
+    direct = np.array([1.0])
+    for i in range(rounds):
+        direct = np.convolve(direct, [chances.lose, chances.tie, chances.win])
+    is_pass = np.allclose(sessionDistribution(chances, rounds), direct, atol=1e-12)
+    assert is_pass == True, "fail the test"
+    for walk in (chances, RoundChances(chances.lose, chances.tie, chances.win), RoundChances(0.3, 0.4, 0.3)):
+        expected = []
+        for bankroll in range(rounds + 3):
+            alive = np.zeros(2 * rounds + 3)
+            alive[rounds + 1] = 1.0
+            ruined = 1.0 if bankroll == 0 else 0.0
+            for i in range(rounds if bankroll else 0):
+                alive = walk.tie * alive + walk.win * np.roll(alive, 1) + walk.lose * np.roll(alive, -1)
+                ruined += alive[rounds + 1 - bankroll]
+                alive[:rounds + 2 - bankroll] = 0.0
+            expected.append(ruined)
+        is_pass = np.allclose(riskOfRuin(walk, np.arange(rounds + 3), rounds), expected, atol=1e-12)
+        assert is_pass == True, "fail the test"
+
+    # ten thousand round sessions take milliseconds
+    start = time.perf_counter()
+    ruin = riskOfRuin(chances, np.arange(0, 1001, 50), 10000)
+    elapsed = time.perf_counter() - start
+    is_pass = (elapsed < 0.1 and np.all(np.diff(ruin) < 1e-12) and ruin[-1] > 0)
+    assert is_pass == True, "fail the test"
+    print('Risk of ruin for 21 bankrolls over 10000 rounds in %.1f ms' % (elapsed * 1000))
+
+    # sessions played at tables, which deal from one finite deck, agree with the model
+    random.seed(43)
+    codes = [rank + suit for rank in RANKS for suit in SUITS]
+    sessions, rounds, bankroll = 2000, 100, 10
+    finals = []
+    ruined = 0
+    for i in range(sessions):
+        random.shuffle(codes)
+        outcomes = playRounds(Table(deck=Deck(codes=codes), verbose=False), policy, rounds)
+        path = np.cumsum(outcomes)
+        finals.append(path[-1])
+        ruined += path.min() <= -bankroll
+    played = np.bincount(np.array(finals) + rounds, minlength=2 * rounds + 1) / sessions
+    distribution = sessionDistribution(chances, rounds)
+    net = np.arange(-rounds, rounds + 1)
+    exact_ruin = riskOfRuin(chances, bankroll, rounds, distribution)
+    error = np.sqrt(exact_ruin * (1 - exact_ruin) / sessions)
+    is_pass = (abs(played @ net - distribution @ net) < 4 * np.sqrt(distribution @ net ** 2) / np.sqrt(sessions)
+               and abs(ruined / sessions - exact_ruin) < 4 * error
+               and np.abs(np.cumsum(played) - np.cumsum(distribution)).max() < 0.05)
+    assert is_pass == True, "fail the test"
+    print(ruinReport(chances, rounds, [5, 10, 20]))
+    print('Ruin with a bankroll of %d: %.4f exact, %.4f from %d sessions at tables'
+          % (bankroll, exact_ruin, ruined / sessions, sessions))
+
+
+if __name__ == "__main__":
+    risk_of_ruin_tests()
@@ -0,0 +1,490 @@
+# Round events and event bus for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+
+
+from collections import namedtuple
+import queue
+import sys
+import threading
+import time
+import traceback
+
+
+# events published by a Table; cards are given as codes such as 'KS' and seats count from 0;
+# deckLeft is how many cards were in the deck just before the hands were dealt
+HandsDealt = namedtuple('HandsDealt', 'round playerCards dealerUpcard seat deckLeft', defaults=(0, None))
+CardDealt = namedtuple('CardDealt', 'round who card value seat', defaults=(0, ))
+DealerRevealed = namedtuple('DealerRevealed', 'round holeCard value')
+DeckRepopulated = namedtuple('DeckRepopulated', 'round cards')
+RoundFinished = namedtuple('RoundFinished', 'round winner playerValue dealerValue playerCards dealerCards seat',
+                           defaults=(0, ))
+
+OVERFLOW_POLICIES = ('drop', 'block', 'sample')
+_STOP = object()
+
+
+
+class _Batch(list):
+    # Events published together and handed to the delivery thread as one queue item; each
+    # entry is an (event type, fields) pair, or (None, event) for an event already built.
+    pass
+
+
+def _build(kind, fields):
+    '''
+    Builds an event given to EventBus.publishLater, turning its Cards into codes.
+
+    Inputs:
+        kind (type): The event type.
+        fields (tuple): The event's fields, where a Card stands for its code and a list of
+            Cards for a list of codes.
+
+    Returns: The event.
+    '''
+    values = []
+    for field in fields:
+        if type(field) is list:
+            field = [card.getCode() for card in field]
+        elif hasattr(field, 'getCode'):
+            field = field.getCode()
+        values.append(field)
+    return kind(*values)
+
+
+class EventBus:
+    # Passes events from the game to subscribers that run on a background thread.
+
+    def __init__(self, capacity=4096, overflow='drop', sampleEvery=10, batchSize=256):
+        '''
+        Initializes the EventBus class and starts its delivery thread.
+
+        Inputs:
+            capacity (int): Most queue items (events, or batches of them) that can wait for delivery.
+            overflow (str): What publish does when the queue is full: 'drop' the event,
+                'block' until there is room, or 'sample' - once the queue is half full, keep
+                only one event in every sampleEvery and drop the rest.
+            sampleEvery (int): How many events make up one kept sample under 'sample'.
+            batchSize (int): Events kept by publish and queued together. Queueing one event
+                takes a few microseconds of locking in the game loop and wakes the delivery
+                thread, which then competes with the game for the GIL, so events are batched
+                by default; give 1 for subscribers that must see each event as it happens.
+                Events still waiting are queued by flush and close.
+
+        Returns: None
+        '''
+        assert isinstance(capacity, int) and capacity > 0, 'Error: capacity must be a positive int'
+        assert overflow in OVERFLOW_POLICIES, 'Error: overflow must be one of %s' % (OVERFLOW_POLICIES, )
+        assert isinstance(sampleEvery, int) and sampleEvery > 0, 'Error: sampleEvery must be a positive int'
+        assert isinstance(batchSize, int) and batchSize > 0, 'Error: batchSize must be a positive int'
+
+        self.__queue = queue.Queue(capacity)
+        self.__capacity = capacity
+        self.__overflow = overflow
+        self.__sampleEvery = sampleEvery
+        self.__batchSize = batchSize
+        self.__pending = _Batch()
+        self.__subscribers = []
+        # event types some subscriber needs; None once a subscriber needs every type
+        self.__wanted = frozenset()
+        self.__published = 0
+        self.__dropped = 0
+        self.__errors = 0
+        self.__firstError = None
+        self.__thread = threading.Thread(target=self.__deliver, name='EventBus', daemon=True)
+        self.__thread.start()
+
+
+    def subscribe(self, handler, kinds=None):
+        '''
+        Adds a subscriber. Handlers are called one event at a time on the delivery thread.
+        Even a deferred event costs the game loop a little, so a Table skips the types no
+        subscriber needs; handlers are still given every type that is published.
+
+        Inputs:
+            self is the EventBus.
+            handler (callable): Called with each event.
+            kinds (tuple): Event types the handler needs, e.g. (HandsDealt, RoundFinished);
+                the handler's own kinds attribute if it has one, otherwise every type.
+
+        Returns: None
+        '''
+        # replace the list so the delivery thread never sees it change mid-loop
+        self.__subscribers = self.__subscribers + [handler]
+        if kinds is None:
+            kinds = getattr(handler, 'kinds', None)
+        if kinds is None or self.__wanted is None:
+            self.__wanted = None
+        else:
+            self.__wanted = self.__wanted | frozenset(kinds)
+
+
+    def wants(self, kind):
+        '''
+        Returns True if some subscriber needs events of the type.
+
+        Inputs:
+            self is the EventBus.
+            kind (type): The event type, e.g. CardDealt.
+        '''
+        return self.__wanted is None or kind in self.__wanted
+
+
+    def publish(self, event):
+        '''
+        Hands an event to the delivery thread without waiting for subscribers.
+
+        Inputs:
+            self is the EventBus.
+            event: The event to deliver.
+
+        Returns (bool): True if the event was queued or kept for the next batch, False if it
+            was dropped.
+        '''
+        self.__published += 1
+        if self.__batchSize > 1:
+            self.__pending.append((None, event))
+            if len(self.__pending) >= self.__batchSize:
+                return self.flush()
+            return True
+        return self.__put(event)
+
+
+    def publishLater(self, kind, fields):
+        '''
+        Publishes an event that is built on the delivery thread instead of in the game loop,
+        so the game only pays for a tuple of what it already has. Building the event and
+        turning its cards into codes is most of the cost of publishing one, and events that
+        are dropped are never built at all.
+
+        Inputs:
+            self is the EventBus.
+            kind (type): The event type, e.g. CardDealt.
+            fields (tuple): The event's fields in order, where a Card stands for its code and a
+                list of Cards for a list of codes; the lists must not be changed afterwards.
+
+        Returns (bool): True if the event was queued or kept for the next batch, False if it
+            was dropped.
+        '''
+        self.__published += 1
+        if self.__batchSize > 1:
+            self.__pending.append((kind, fields))
+            if len(self.__pending) >= self.__batchSize:
+                return self.flush()
+            return True
+        return self.__put(_Batch([(kind, fields)]))
+
+
+    def flush(self):
+        '''
+        Queues the events kept for the next batch.
+
+        Inputs:
+            self is the EventBus.
+
+        Returns (bool): True if they were queued, False if they were dropped.
+        '''
+        if not self.__pending:
+            return True
+        batch, self.__pending = self.__pending, _Batch()
+        if self.__put(batch):
+            return True
+        self.__dropped += len(batch) - 1
+        return False
+
+
+    def __put(self, event):
+        '''
+        Puts an event or a batch of events on the queue, following the overflow policy.
+
+        Inputs:
+            self is the EventBus.
+            event: The event or _Batch.
+
+        Returns (bool): True if it was queued, False if it was dropped.
+        '''
+        if self.__overflow == 'block':
+            self.__queue.put(event)
+            return True
+
+        # under 'sample', thin the events out once the queue is half full
+        if (self.__overflow == 'sample' and self.__queue.qsize() * 2 >= self.__capacity
+                and self.__published % self.__sampleEvery != 0):
+            self.__dropped += 1
+            return False
+        try:
+            self.__queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.__dropped += 1
+            return False
+
+
+    def __deliver(self):
+        '''
+        Delivers queued events to every subscriber until the bus is closed.
+
+        Inputs:
+            self is the EventBus.
+
+        Returns: None
+        '''
+        while True:
+            item = self.__queue.get()
+            if item is _STOP:
+                return
+            if type(item) is _Batch:
+                events = [fields if kind is None else _build(kind, fields) for kind, fields in item]
+            else:
+                events = (item, )
+            for event in events:
+                for handler in self.__subscribers:
+                    try:
+                        handler(event)
+                    except Exception as err:
+                        # keep counting the rest, but show the first so failures are not silent
+                        self.__errors += 1
+                        if self.__firstError is None:
+                            self.__firstError = err
+                            print('EventBus: subscriber %r raised an exception; later ones are only counted'
+                                  % (handler, ), file=sys.stderr)
+                            traceback.print_exc()
+
+
+    def close(self, timeout=None):
+        '''
+        Queues any events kept for the next batch, delivers the events already queued, then
+        stops the delivery thread.
+
+        Inputs:
+            self is the EventBus.
+            timeout (float): Longest time in seconds to wait, both for room in a full queue
+                to ask the thread to stop and for delivery to finish; no limit if not given.
+
+        Returns (bool): True if the delivery thread has stopped, False if it was still busy
+            when the timeout ran out.
+        '''
+        batch, self.__pending = self.__pending, _Batch()
+        if timeout is None:
+            if batch:
+                self.__queue.put(batch)
+            self.__queue.put(_STOP)
+            self.__thread.join()
+            return True
+
+        deadline = time.monotonic() + timeout
+        try:
+            if batch:
+                self.__queue.put(batch, timeout=max(timeout, 0))
+                batch = None
+            self.__queue.put(_STOP, timeout=max(deadline - time.monotonic(), 0))
+        except queue.Full:
+            if batch:
+                self.__dropped += len(batch)
+            return False
+        self.__thread.join(max(deadline - time.monotonic(), 0))
+        return not self.__thread.is_alive()
+
+
+    def getPublished(self):
+        '''
+        Returns the number of events published.
+
+        Inputs:
+            self is the EventBus.
+        '''
+        return self.__published
+
+
+    def getDropped(self):
+        '''
+        Returns the number of events dropped because the queue was full or being sampled.
+
+        Inputs:
+            self is the EventBus.
+        '''
+        return self.__dropped
+
+
+    def getErrors(self):
+        '''
+        Returns the number of times a subscriber raised an exception.
+
+        Inputs:
+            self is the EventBus.
+        '''
+        return self.__errors
+
+
+    def getFirstError(self):
+        '''
+        Returns the first exception a subscriber raised, or None if none has.
+
+        Inputs:
+            self is the EventBus.
+        '''
+        return self.__firstError
+
+
+
+class AsyncSubscriber:
+    # Subscriber that runs a coroutine for each event as a task on an asyncio event loop.
+
+    def __init__(self, loop, coroutine):
+        '''
+        Initializes the AsyncSubscriber class.
+
+        Inputs:
+            loop (AbstractEventLoop): The running event loop to schedule the coroutines on.
+            coroutine (callable): Coroutine function called with each event.
+
+        Returns: None
+        '''
+        self.__loop = loop
+        self.__coroutine = coroutine
+
+
+    def __call__(self, event):
+        '''
+        Schedules the coroutine for the event without waiting for it.
+
+        Inputs:
+            event: The event to handle.
+
+        Returns: None
+        '''
+        import asyncio
+
+        asyncio.run_coroutine_threadsafe(self.__coroutine(event), self.__loop)
+
+
+
+def event_bus_tests():
+    '''
+    Tests for the event bus.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import asyncio
+    import random
+    import time
+    from autoPlay import ThresholdPolicy, playRounds
+    from playingCards import Deck, RANKS, SUITS
+    from simple21 import Table
+
+    codes = [rank + suit for rank in RANKS for suit in SUITS]
+
+    # every event reaches every subscriber when nothing overflows
+    bus = EventBus(capacity=100000)
+    received = []
+    bus.subscribe(received.append)
+    table = Table(deck=Deck(codes=codes), verbose=False, events=bus)
+    random.seed(7)
+    outcomes = playRounds(table, ThresholdPolicy(17), 200)
+    bus.close()
+    finished = [event for event in received if type(event).__name__ == 'RoundFinished']
+    is_pass = (len(received) == bus.getPublished() and len(finished) == 200)
+    assert is_pass == True, "fail the test"
+    is_pass = ([{'player': 1, 'tie': 0, 'dealer': -1}[event.winner] for event in finished] == outcomes)
+    assert is_pass == True, "fail the test"
+
+    # events built on the delivery thread hold card codes, batched or not
+    bus = EventBus(batchSize=1)
+    unbatched = []
+    bus.subscribe(unbatched.append)
+    table = Table(deck=Deck(codes=codes), verbose=False, events=bus)
+    random.seed(7)
+    playRounds(table, ThresholdPolicy(17), 200)
+    bus.close()
+    is_pass = (unbatched == received and received[0].playerCards == ['AC', 'AH'] and received[0].dealerUpcard == 'AD')
+    assert is_pass == True, "fail the test"
+
+    # batched events all arrive, and only the types some subscriber wants are built
+    # (Table publishes roundEvents' classes, not those of this module when run as a script)
+    import roundEvents
+    bus = EventBus(batchSize=64)
+    received = []
+    bus.subscribe(received.append, kinds=(roundEvents.RoundFinished,))
+    table = Table(deck=Deck(codes=codes), verbose=False, events=bus)
+    outcomes = playRounds(table, ThresholdPolicy(17), 200)
+    bus.close()
+    is_pass = (bus.getPublished() == 200
+               and [type(event).__name__ for event in received] == ['RoundFinished'] * 200)
+    assert is_pass == True, "fail the test"
+    is_pass = ([{'player': 1, 'tie': 0, 'dealer': -1}[event.winner] for event in received] == outcomes)
+    assert is_pass == True, "fail the test"
+
+    # slow subscribers do not slow the game down; whole batches of their events are dropped
+    # instead, and the events in them are never built
+    timings = []
+    for sinks in (0, 1, 10):
+        bus = EventBus(capacity=4, overflow='drop')
+        for i in range(sinks):
+            bus.subscribe(lambda event: time.sleep(0.0001))
+        table = Table(deck=Deck(codes=codes), verbose=False, events=bus)
+        start = time.perf_counter()
+        playRounds(table, ThresholdPolicy(17), 2000)
+        timings.append((time.perf_counter() - start) / 2000 * 1e6)
+        bus.close()
+    print('Microseconds per round with 0, 1 and 10 slow sinks: %.1f, %.1f, %.1f' % tuple(timings))
+
+    # sampling keeps some events once the queue fills
+    bus = EventBus(capacity=64, overflow='sample', sampleEvery=5, batchSize=1)
+    bus.subscribe(lambda event: time.sleep(0.001))
+    for i in range(1000):
+        bus.publish(i)
+    is_pass = (0 < bus.getDropped() < 1000)
+    assert is_pass == True, "fail the test"
+    bus.close(0)
+
+    # closing behind a slow subscriber with a full queue gives up at the timeout
+    bus = EventBus(capacity=4, overflow='block', batchSize=1)
+    bus.subscribe(lambda event: time.sleep(0.05))
+    for i in range(5):
+        bus.publish(i)
+    start = time.perf_counter()
+    stopped = bus.close(0.01)
+    is_pass = (stopped == False and time.perf_counter() - start < 0.04)
+    assert is_pass == True, "fail the test"
+    is_pass = (bus.close() == True)
+    assert is_pass == True, "fail the test"
+
+    # subscriber exceptions are counted and the first one is kept
+    import contextlib
+    import io
+
+    bus = EventBus()
+    bus.subscribe(lambda event: 1 / event)
+    with contextlib.redirect_stderr(io.StringIO()) as shown:
+        for i in (0, 0, 1):
+            bus.publish(i)
+        bus.close()
+    is_pass = (bus.getErrors() == 2 and isinstance(bus.getFirstError(), ZeroDivisionError)
+               and 'ZeroDivisionError' in shown.getvalue())
+    assert is_pass == True, "fail the test"
+
+    # asyncio subscribers run as tasks on their own loop
+    async def collect():
+        loop = asyncio.get_running_loop()
+        seen = []
+
+        async def handle(event):
+            seen.append(event)
+
+        bus = EventBus()
+        bus.subscribe(AsyncSubscriber(loop, handle))
+        for i in range(10):
+            bus.publish(i)
+        await loop.run_in_executor(None, bus.close)
+        await asyncio.sleep(0.01)
+        return seen
+
+    is_pass = (asyncio.run(collect()) == list(range(10)))
+    assert is_pass == True, "fail the test"
+
+
+if __name__ == "__main__":
+    event_bus_tests()
@@ -0,0 +1,374 @@
+# Adaptive round budgets for sweeps over many configurations for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+#
+# A configuration is a rule variant, a hit/stay policy and a penetration. Rounds are given out
+# in slices: every configuration first gets a few slices, then each free worker is given a
+# slice of the configuration whose confidence interval is widest compared with its distance
+# from the decision boundary. A configuration stops once its interval is narrow enough or no
+# longer contains the boundary. The result of a slice depends only on the seed, the
+# configuration and the slice's index, so the slices can be played in any process.
+
+
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import itertools
+import math
+import random
+
+
+# penetration is the share of a fresh 52 card deck dealt before it is replaced; 1.0 keeps
+# playing one deck, repopulated from the discard pile, as a Table does
+Config = namedtuple('Config', 'rules policy penetration')
+ConfigResult = namedtuple('ConfigResult', 'config mean halfWidth rounds slices status')
+Progress = namedtuple('Progress', 'index mean halfWidth rounds status')
+
+
+def sweepConfigs(rulesList, policies, penetrations=(1.0, )):
+    '''
+    Returns every combination of rules, policy and penetration.
+
+    Inputs:
+        rulesList (list): Rules instances.
+        policies (list): Policy names, e.g. 'stand17'.
+        penetrations (tuple): Shares of the deck dealt before a new deck, from 0 to 1.
+
+    Returns (list): A Config for each combination.
+    '''
+    for penetration in penetrations:
+        assert 0 < penetration <= 1, 'Error: penetration must be above 0 and at most 1'
+    return [Config(tuple(rules.key()), policy, penetration)
+            for rules, policy, penetration in itertools.product(rulesList, policies, penetrations)]
+
+
+def playSlice(config, seed, index, rounds):
+    '''
+    Plays one slice of rounds for a configuration at a Table.
+
+    Inputs:
+        config (Config): The configuration.
+        seed (int): Seed of the sweep.
+        index (int): Index of the slice; each slice has its own decks and shuffles.
+        rounds (int): Number of rounds in the slice.
+
+    Returns (tuple): (rounds, sum of the outcomes, sum of the squared outcomes).
+    '''
+    from autoPlay import parsePolicy, playRound
+    from gameRules import Rules
+    from playingCards import Deck, RANKS, SUITS
+    from simple21 import Table
+
+    policy = parsePolicy(config.policy)
+    rules = Rules(*config.rules)
+    codes = [rank + suit for rank in RANKS for suit in SUITS]
+    # a deck runs out of room for a round below this many cards
+    smallest = 52 - int(config.penetration * 52) if config.penetration < 1 else 0
+
+    # the Deck shuffles with the random module, so it is seeded for every slice
+    state = random.getstate()
+    random.seed('%d/%s/%d' % (seed, config, index))
+    table = None
+    total = squares = 0
+    for i in range(rounds):
+        if table is None or table.getDeck().size() < smallest:
+            random.shuffle(codes)
+            table = Table(rules, Deck(codes=codes), verbose=False)
+        outcome = playRound(table, policy)
+        total += outcome
+        squares += outcome * outcome
+    random.setstate(state)
+    return rounds, total, squares
+
+
+
+class AdaptiveScheduler:
+    # Gives round budgets in slices to the configurations that are furthest from a decision.
+
+    def __init__(self, configs, precision=0.01, boundary=None, sliceRounds=2000, minSlices=4,
+                 maxRounds=1000000, z=1.96, seed=0, workers=1):
+        '''
+        Initializes the AdaptiveScheduler class.
+
+        Inputs:
+            configs (list): Config for each configuration.
+            precision (float): A configuration is finished once the half width of its interval
+                for the expected outcome per round is at most this.
+            boundary (float): Expected outcome that decides between two answers; a configuration
+                whose interval leaves out the boundary is also finished. None to only use precision.
+            sliceRounds (int): Rounds in each slice.
+            minSlices (int): Slices every configuration gets before its interval is trusted.
+            maxRounds (int): Most rounds for one configuration.
+            z (float): Normal quantile for the intervals (1.96 for 95%).
+            seed (int): Seed of the sweep.
+            workers (int): Number of processes to play slices in; 1 plays them in this process.
+
+        Returns: None
+        '''
+        assert len(configs) > 0, 'Error: there must be at least one configuration'
+        assert isinstance(minSlices, int) and minSlices >= 2, 'Error: minSlices must be an int of at least 2'
+        assert isinstance(sliceRounds, int) and sliceRounds > 0, 'Error: sliceRounds must be a positive int'
+        self.__configs = list(configs)
+        self.__precision = precision
+        self.__boundary = boundary
+        self.__sliceRounds = sliceRounds
+        self.__minSlices = minSlices
+        self.__maxSlices = max(minSlices, maxRounds // sliceRounds)
+        self.__z = z
+        self.__seed = seed
+        self.__workers = workers
+
+        # (slices, rounds, sum, sum of squares) of each configuration, and slices handed out but not yet back
+        self.__sums = [[0, 0, 0, 0] for config in self.__configs]
+        self.__pending = [0] * len(self.__configs)
+
+
+    def __interval(self, index, extra=0):
+        '''
+        Returns the mean and half width of a configuration's interval. The half width is
+        shrunk as if extra more slices with the same spread had come back.
+
+        Inputs:
+            self is the AdaptiveScheduler.
+            index (int): Index of the configuration.
+            extra (int): Slices still being played.
+
+        Returns (tuple): (mean, half width); the half width is infinite below minSlices slices.
+        '''
+        slices, rounds, total, squares = self.__sums[index]
+        if rounds == 0:
+            return 0.0, math.inf
+        mean = total / rounds
+        if slices < self.__minSlices:
+            return mean, math.inf
+        variance = (squares / rounds - mean ** 2) * rounds / (rounds - 1)
+        return mean, self.__z * math.sqrt(variance / (rounds + extra * self.__sliceRounds))
+
+
+    def __status(self, index):
+        '''
+        Returns 'precise', 'decided', 'capped' or 'running' for a configuration.
+
+        Inputs:
+            self is the AdaptiveScheduler.
+            index (int): Index of the configuration.
+        '''
+        mean, half_width = self.__interval(index)
+        if half_width <= self.__precision:
+            return 'precise'
+        if self.__boundary is not None and abs(mean - self.__boundary) > half_width:
+            return 'decided'
+        if self.__sums[index][0] + self.__pending[index] >= self.__maxSlices:
+            return 'capped'
+        return 'running'
+
+
+    def __nextConfig(self):
+        '''
+        Chooses the configuration to give the next slice to: any configuration still short of
+        minSlices, otherwise the running one with the widest interval for its distance from
+        the boundary, counting slices still being played as if they had come back.
+
+        Inputs:
+            self is the AdaptiveScheduler.
+
+        Returns (int): Index of the configuration, or None if every one is finished.
+        '''
+        best = None
+        best_priority = -1.0
+        for index in range(len(self.__configs)):
+            if self.__status(index) != 'running':
+                continue
+            handed_out = self.__sums[index][0] + self.__pending[index]
+            if handed_out < self.__minSlices:
+                return index
+            mean, half_width = self.__interval(index, self.__pending[index])
+            if self.__boundary is not None:
+                priority = half_width / (abs(mean - self.__boundary) + self.__precision)
+            else:
+                priority = half_width
+            if priority > best_priority:
+                best, best_priority = index, priority
+        return best
+
+
+    def __progress(self, index):
+        '''
+        Returns the Progress of a configuration.
+
+        Inputs:
+            self is the AdaptiveScheduler.
+            index (int): Index of the configuration.
+        '''
+        mean, half_width = self.__interval(index)
+        return Progress(index, mean, half_width, self.__sums[index][1], self.__status(index))
+
+
+    def __add(self, index, played):
+        '''
+        Adds a slice that has come back to its configuration.
+
+        Inputs:
+            self is the AdaptiveScheduler.
+            index (int): Index of the configuration.
+            played (tuple): The result of playSlice.
+
+        Returns: None
+        '''
+        sums = self.__sums[index]
+        sums[0] += 1
+        for i, value in enumerate(played):
+            sums[i + 1] += value
+        self.__pending[index] -= 1
+
+
+    def run(self):
+        '''
+        Plays slices until every configuration is finished, yielding the new state of a
+        configuration each time one of its slices comes back.
+
+        Inputs:
+            self is the AdaptiveScheduler.
+
+        Returns (generator): Progress for each slice played.
+        '''
+        started = [sums[0] + pending for sums, pending in zip(self.__sums, self.__pending)]
+
+        def hand(index):
+            # the slice index comes from how many slices the configuration has been given
+            self.__pending[index] += 1
+            started[index] += 1
+            return (self.__configs[index], self.__seed, started[index] - 1, self.__sliceRounds)
+
+        if self.__workers <= 1:
+            index = self.__nextConfig()
+            while index is not None:
+                self.__add(index, playSlice(*hand(index)))
+                yield self.__progress(index)
+                index = self.__nextConfig()
+            return
+
+        with ProcessPoolExecutor(self.__workers) as pool:
+            running = {}
+            while True:
+                # keep every worker busy with the most useful slices
+                while len(running) < self.__workers:
+                    index = self.__nextConfig()
+                    if index is None:
+                        break
+                    running[pool.submit(playSlice, *hand(index))] = index
+                if not running:
+                    return
+                done, waiting = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    self.__add(index, future.result())
+                    yield self.__progress(index)
+
+
+    def getResults(self):
+        '''
+        Returns a ConfigResult for every configuration.
+
+        Inputs:
+            self is the AdaptiveScheduler.
+        '''
+        results = []
+        for index, config in enumerate(self.__configs):
+            mean, half_width = self.__interval(index)
+            results.append(ConfigResult(config, mean, half_width, self.__sums[index][1], self.__sums[index][0],
+                                        self.__status(index)))
+        return results
+
+
+    def getRoundsPlayed(self):
+        '''
+        Returns the number of rounds played over all configurations.
+
+        Inputs:
+            self is the AdaptiveScheduler.
+        '''
+        return sum(sums[1] for sums in self.__sums)
+
+
+
+def sweepReport(results, boundary=None):
+    '''
+    Returns a table of the results of a sweep.
+
+    Inputs:
+        results (list): ConfigResults from AdaptiveScheduler.getResults.
+        boundary (float): The decision boundary of the sweep, if any.
+
+    Returns (str): The report.
+    '''
+    lines = ['%-18s %-10s %5s %9s %9s %9s  %s' % ('rules', 'policy', 'pen', 'EV', '+/-', 'rounds', 'status')]
+    for result in results:
+        rules = '%d/%s/%d' % result.config.rules
+        line = '%-18s %-10s %5.2f %+9.4f %9.4f %9d  %s' % (rules, result.config.policy, result.config.penetration,
+                                                           result.mean, result.halfWidth, result.rounds, result.status)
+        if boundary is not None and result.status == 'decided':
+            line += ' (%s %+.3f)' % ('above' if result.mean > boundary else 'below', boundary)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+
+def scheduler_tests():
+    '''
+    Tests for the adaptive scheduler.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import time
+    from gameRules import Rules
+
+    # slices depend only on the seed, the configuration and the index
+    config = Config((17, 'push', 21), 'stand15', 0.75)
+    is_pass = (playSlice(config, 1, 3, 500) == playSlice(config, 1, 3, 500) != playSlice(config, 1, 4, 500))
+    assert is_pass == True, "fail the test"
+
+    # a configuration is finished once its interval is narrow or leaves out the boundary
+    configs = sweepConfigs([Rules(threshold, 'push') for threshold in (13, 15, 17, 19)],
+                           ['stand12', 'stand15', 'stand17'], (0.5, 1.0))
+    boundary = -0.07
+    scheduler = AdaptiveScheduler(configs, precision=0.02, boundary=boundary, sliceRounds=1000, maxRounds=40000,
+                                  seed=45)
+    start = time.perf_counter()
+    streamed = list(scheduler.run())
+    adaptive_time = time.perf_counter() - start
+    results = scheduler.getResults()
+    is_pass = (len(streamed) * 1000 == scheduler.getRoundsPlayed()
+               and all(result.status != 'running' for result in results)
+               and all(result.halfWidth <= 0.02 or abs(result.mean - boundary) > result.halfWidth
+                       or result.rounds >= 40000 for result in results))
+    assert is_pass == True, "fail the test"
+    print(sweepReport(results, boundary))
+
+    # a fixed budget gives every configuration as many rounds as the one that needed the most
+    fixed_rounds = max(result.rounds for result in results)
+    start = time.perf_counter()
+    for config in configs:
+        playSlice(config, 45, 0, fixed_rounds)
+    fixed_time = time.perf_counter() - start
+    print('Adaptive: %d rounds in %.1f s; fixed budget: %d rounds in %.1f s (%.0f%% of the time)'
+          % (scheduler.getRoundsPlayed(), adaptive_time, fixed_rounds * len(configs), fixed_time,
+             100 * adaptive_time / fixed_time))
+    is_pass = (scheduler.getRoundsPlayed() < 0.6 * fixed_rounds * len(configs))
+    assert is_pass == True, "fail the test"
+
+    # a worker pool reaches the same decisions
+    pooled = AdaptiveScheduler(configs[:6], precision=0.02, boundary=boundary, sliceRounds=1000, maxRounds=40000,
+                               seed=45, workers=2)
+    for progress in pooled.run():
+        pass
+    is_pass = all(result.status == 'capped' or other.status == 'capped'
+                  or (result.mean > boundary) == (other.mean > boundary)
+                  for result, other in zip(pooled.getResults(), results[:6]))
+    assert is_pass == True, "fail the test"
+
+
+if __name__ == "__main__":
+    scheduler_tests()
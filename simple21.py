@@ -4,7 +4,9 @@
 # Collaborators: None
 
 
-from playingCards import Card, Deck
+from playingCards import Card, Deck, EmptyDeckException
+from gameRules import Rules
+from roundEvents import HandsDealt, CardDealt, DealerRevealed, DeckRepopulated, RoundFinished
 
 class Player:
     # class for Player in simplified 21 Card game
@@ -61,6 +63,26 @@ class Player:
         return removed_cards
     
     
+    def getHand(self):
+        '''
+        Returns a list of the cards in the player’s hand, in the order they were added.
+        
+        Inputs:
+            self is the Player whose hand is being returned.
+        '''
+        return list(self.__hand)
+    
+    
+    def getCardCount(self):
+        '''
+        Returns the number of cards in the player’s hand.
+        
+        Inputs:
+            self is the Player whose cards are being counted.
+        '''
+        return self.__cards
+    
+    
     def getHandValue(self):
         '''
         Returns the current value (an integer) of the player’s hand.
@@ -114,23 +136,129 @@ class Player:
     
     
     
+# most players that can sit at one table; seven hands still leave cards for the dealer
+MAX_SEATS = 7
+
+
 class Table():
     # class for Table in simplified 21 card game
     
-    def __init__(self):
+    def __init__(self, rules=None, deck=None, verbose=True, events=None, seats=1):
         '''
         Initializes the table class.
         
         Inputs:
             self is the Table to initialize.
+            rules (Rules): The dealer rule and tie handling to use; defaults to the original game.
+            deck (Deck): The deck to deal from; if not given, the user is asked for a deck file.
+            verbose (bool): True to display the dealer's turn and results; False to play silently.
+            events (EventBus): Event bus to publish round events to; nothing is published if not given.
+            seats (int): Number of players (1 to 7), all playing against the one dealer; high
+                bust limits allow fewer (see Rules.getMaxSeats).
             
         Returns: None
         '''
         # create attributes
-        self.__player = Player()
+        if rules is None:
+            rules = Rules()
+        assert isinstance(rules, Rules), 'rules must be Rules instance'
+        assert isinstance(seats, int) and 1 <= seats <= MAX_SEATS, 'seats must be an int from 1 to %d' % MAX_SEATS
+        assert seats <= rules.getMaxSeats(), \
+            'seats must be at most %d with a bust limit of %d' % (rules.getMaxSeats(), rules.getBustLimit())
+        self.__rules = rules
+        self.__seats = [Player() for i in range(seats)]
+        self.__player = self.__seats[0]
         self.__dealer = Player()
-        self.__deck = Deck()
+        if deck is None:
+            deck = Deck()
+        assert isinstance(deck, Deck), 'deck must be Deck instance'
+        self.__deck = deck
         self.__discard = []
+        self.__verbose = verbose
+        self.__events = events
+        self.__round = 0
+    
+    
+    def getRules(self):
+        '''
+        Returns the Rules used by the table.
+        
+        Inputs:
+            self is the Table.
+        '''
+        return self.__rules
+    
+    
+    def getPlayer(self, seat=0):
+        '''
+        Returns the Player at a seat of the table.
+        
+        Inputs:
+            self is the Table.
+            seat (int): The seat, counting from 0 in the order cards are dealt.
+        '''
+        return self.__seats[seat]
+    
+    
+    def getSeats(self):
+        '''
+        Returns the number of players at the table.
+        
+        Inputs:
+            self is the Table.
+        '''
+        return len(self.__seats)
+    
+    
+    def getDealer(self):
+        '''
+        Returns the dealer (a Player) at the table.
+        
+        Inputs:
+            self is the Table.
+        '''
+        return self.__dealer
+    
+    
+    def getDeck(self):
+        '''
+        Returns the Deck the table deals from.
+        
+        Inputs:
+            self is the Table.
+        '''
+        return self.__deck
+    
+    
+    def getDiscard(self):
+        '''
+        Returns a list of the cards in the discard pile.
+        
+        Inputs:
+            self is the Table.
+        '''
+        return list(self.__discard)
+    
+    
+    def __deal(self):
+        '''
+        Deals the front card of the deck. If the deck has run out of cards, the deck is
+        repopulated using the cards from the discard pile first.
+        
+        Inputs:
+            self is the Table.
+            
+        Returns: The front Card face up.
+        '''
+        try:
+            return self.__deck.deal()
+        except EmptyDeckException:
+            assert len(self.__discard) > 0, 'Error: no cards left to deal; every card is in a hand'
+            if self.__events is not None and self.__events.wants(DeckRepopulated):
+                self.__events.publishLater(DeckRepopulated, (self.__round, len(self.__discard)))
+            self.__deck.repopulate(self.__discard, self.__verbose)
+            self.__discard = []
+            return self.__deck.deal()
     
     
     def dealHands(self):
@@ -138,47 +266,55 @@ class Table():
         Deals the first four cards from the front of the deck to the player and dealer.
         The first and third cards are dealt face up to the player. 
         The second and fourth cards are dealt to the dealer face up and face down respectively.
+        With more than one seat, each round of cards goes to every seat in turn before the
+        dealer, as at a casino table.
+        If the deck runs out of cards, the deck is repopulated using the cards from the discard pile.
         
         Inputs:
             self is the Table to deal cards to
             
         Returns: None
         '''
-        player_order = [self.__player, self.__dealer, self.__player]
+        player_order = self.__seats + [self.__dealer] + self.__seats
+        deck_left = self.__deck.size()
         
         # add face up cards to player/dealer hands
         for player in player_order:
-            player.addToHand(self.__deck.deal())
+            player.addToHand(self.__deal())
         
         # add face down card to dealer hand
-        card = self.__deck.deal()
+        card = self.__deal()
         card.turnOver()
         self.__dealer.addToHand(card)
         
+        # publish the start of the round
+        self.__round += 1
+        if self.__events is not None and self.__events.wants(HandsDealt):
+            upcard = self.__dealer.getHand()[0]
+            for seat, player in enumerate(self.__seats):
+                self.__events.publishLater(HandsDealt, (self.__round, player.getHand(), upcard, seat, deck_left))
+        
     
-    def playerHit(self):
+    def playerHit(self, seat=0):
         '''
         Deals a card from the front of the deck to the player, face up.
         If the deck runs out of cards, the deck is repopulated using the cards from the discard pile.
         
         Inputs:
             self is the Table
+            seat (int): The seat of the player to deal to.
             
         Returns (bool): whether the player has gone bust with the new card (True) or not (False).
         '''
-        card_added = False
-        
-        # try to add card or repopulate if deck empty
-        while not card_added:
-            try:
-                card = self.__deck.deal()
-                self.__player.addToHand(card)
-                card_added = True
-            except:
-                self.__deck.repopulate(self.__discard)
+        # add card, repopulating if deck empty
+        player = self.__seats[seat]
+        card = self.__deal()
+        player.addToHand(card)
+        if self.__events is not None and self.__events.wants(CardDealt):
+            self.__events.publishLater(CardDealt, (self.__round, 'player', card, player.getHandValue(), seat))
             
         # return if player has gone bust
-        if self.__player.getHandValue() > 21:
+        if self.__rules.isBust(player.getHandValue()):
             return True
         else:
             return False
@@ -187,7 +323,8 @@ class Table():
     def dealerHit(self):
         '''
         Turns the dealer’s second card over and displays the value of the current hand.
-        Continues to deal face up cards to dealer as long as the value of the dealer’s hand is 16 or less.
+        Continues to deal face up cards to dealer as long as the rules say the dealer must hit
+        (a hand value of 16 or less in the original game).
         If the deck runs out of cards, the deck is repopulated using the cards from the discard pile.
         
         Inputs:
@@ -197,65 +334,96 @@ class Table():
         '''
         # display dealer's cards
         self.__dealer.revealAllCards()
-        print(self)
-        
-        while self.__dealer.getHandValue() <= 16:
+        if self.__events is not None and self.__events.wants(DealerRevealed):
+            self.__events.publishLater(DealerRevealed, (self.__round, self.__dealer.getHand()[1],
+                                                        self.__dealer.getHandValue()))
+        if self.__verbose:
+            print(self)
+        
+        # with a prefix index on the deck, find where the dealer stops without checking each card,
+        # then show the cards found one at a time as the card-by-card turn would
+        draws = None
+        if self.__deck.hasPrefixIndex() and self.__rules.dealerMustHit(self.__dealer.getHandValue()):
+            draws = self.__deck.drawsToReach(self.__rules.getStandThreshold() - self.__dealer.getHandValue())
+        if draws is not None:
+            for card in self.__deck.dealMany(draws):
+                self.__dealer.addToHand(card)
+                if self.__events is not None and self.__events.wants(CardDealt):
+                    self.__events.publishLater(CardDealt, (self.__round, 'dealer', card,
+                                                           self.__dealer.getHandValue()))
+                if self.__verbose:
+                    print('Dealer must take card...')
+                    print(self)
+        
+        while self.__rules.dealerMustHit(self.__dealer.getHandValue()):
             
-            # try to add cards from deck
-            try:
-                self.__dealer.addToHand(self.__deck.deal())
+            # add cards from deck, repopulating if deck empty
+            card = self.__deal()
+            self.__dealer.addToHand(card)
+            if self.__events is not None and self.__events.wants(CardDealt):
+                self.__events.publishLater(CardDealt, (self.__round, 'dealer', card, self.__dealer.getHandValue()))
+            if self.__verbose:
                 print('Dealer must take card...')
                 print(self)
-            
-            # repopulate deck if empty
-            except:
-                self.__deck.repopulate(self.__discard)
         
         # check if dealer went bust    
-        if self.__dealer.getHandValue() > 21:
-            print("Dealer went bust.", end=' ')
+        if self.__rules.isBust(self.__dealer.getHandValue()):
+            if self.__verbose:
+                print("Dealer went bust.", end=' ')
             return True
-        elif self.__dealer.getHandValue() == 21:
-            print("Dealer has a natural 21!", end=' ')
+        elif self.__rules.isNatural(self.__dealer.getHandValue()):
+            if self.__verbose:
+                print("Dealer has a natural 21!", end=' ')
             return False
         else:
             return False
 
     
-    def playerNatural(self):
+    def playerNatural(self, seat=0):
         '''
-        Returns True if the value of the player’s hand is exactly 21, False otherwise.
+        Returns True if the value of the player’s hand is exactly 21 (the bust limit), False otherwise.
         
         Inputs:
             self is the Table.
+            seat (int): The seat of the player to check.
         '''
         # check if player hand is 21
-        if self.__player.getHandValue() == 21:
+        if self.__rules.isNatural(self.__seats[seat].getHandValue()):
             return True
         else:
             return False
     
     
-    def whoWon(self):
+    def whoWon(self, seat=0):
         '''
         Compares the player’s and dealer’s hands to determine who wins and displays message.
+        Ties are handled using the tie policy of the rules.
         
         Inputs:
             self is the Table
+            seat (int): The seat of the player to compare.
             
-        Returns: None
+        Returns (str): 'player', 'dealer' or 'tie'.
         '''
-        # find how close to 21 both are
-        player_difference = 21 - self.__player.getHandValue()
-        dealer_difference = 21 - self.__dealer.getHandValue()
-        
-        # check who is closer
-        if player_difference > dealer_difference:
-            print('Dealer wins', end=' ')
-        elif player_difference == dealer_difference:
-            print('Tie! No one wins', end=' ')
+        # a bust hand loses, which a low bust limit allows for the dealt cards; otherwise
+        # check who is closer to 21
+        player_value = self.__seats[seat].getHandValue()
+        dealer_value = self.__dealer.getHandValue()
+        if self.__rules.isBust(player_value):
+            winner = 'dealer'
+        elif self.__rules.isBust(dealer_value):
+            winner = 'player'
         else:
-            print('Player wins', end=' ')
+            winner = self.__rules.compare(player_value, dealer_value)
+        if self.__verbose:
+            if winner == 'dealer':
+                print('Dealer wins', end=' ')
+            elif winner == 'tie':
+                print('Tie! No one wins', end=' ')
+            else:
+                print('Player wins', end=' ')
+        
+        return winner
     
     
     def clearTable(self):
@@ -267,22 +435,68 @@ class Table():
             
         Returns: None
         '''
+        # publish how the round ended
+        if self.__events is not None and self.__events.wants(RoundFinished):
+            dealer_cards = self.__dealer.getHand()
+            for seat, winner in enumerate(self.roundWinners()):
+                player = self.__seats[seat]
+                self.__events.publishLater(RoundFinished, (self.__round, winner,
+                                                           player.getHandValue(), self.__dealer.getHandValue(),
+                                                           player.getHand(), dealer_cards, seat))
+        
         # remove from hand and add to discard
-        self.__discard.extend(self.__player.clearHand())
+        for player in self.__seats:
+            self.__discard.extend(player.clearHand())
         self.__discard.extend(self.__dealer.clearHand())
+    
+    
+    def roundWinners(self):
+        '''
+        Finds who won the round at every seat from the hands on the table, the same way
+        assignment2 decides: a player bust loses, a player who hit to exactly 21 wins, a dealer
+        bust loses, and otherwise the hand closer to 21 wins. The dealer's hand is looked at
+        once for all seats.
+        
+        Inputs:
+            self is the Table
+            
+        Returns (list): 'player', 'dealer' or 'tie' for each seat.
+        '''
+        rules = self.__rules
+        dealer_value = self.__dealer.getHandValue()
+        dealer_bust = rules.isBust(dealer_value)
+        winners = []
+        for player in self.__seats:
+            player_value = player.getHandValue()
+            if rules.isBust(player_value):
+                winners.append('dealer')
+            elif player.getCardCount() > 2 and rules.isNatural(player_value):
+                winners.append('player')
+            elif dealer_bust:
+                winners.append('player')
+            else:
+                winners.append(rules.compare(player_value, dealer_value))
+        return winners
         
         
     def __str__(self):
         '''
         Returns the string representation of the Table instance. 
         The string contains information about the player’s hand and the dealer’s hand.
+        With more than one seat, each seat's hand is shown on its own line.
         
         Inputs:
             self is the Table
             
         Returns: None
         '''
-        string = "Player's %s\nDealer's %s" % (str(self.__player), str(self.__dealer))
+        if len(self.__seats) == 1:
+            string = "Player's %s\nDealer's %s" % (str(self.__player), str(self.__dealer))
+        else:
+            string = ''
+            for seat, player in enumerate(self.__seats):
+                string += "Seat %d's %s\n" % (seat + 1, str(player))
+            string += "Dealer's %s" % str(self.__dealer)
         return string
         
         
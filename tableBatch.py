@@ -0,0 +1,536 @@
+# Batch of tables played in lockstep for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+
+
+from gameRules import Rules
+from playingCards import cardIndex, RANKS
+import numpy as np
+
+
+# value of each card index 0-51 (Ace is always 1, T/J/Q/K are 10)
+CARD_VALUE_TABLE = np.array([min(RANKS.index(rank) + 1, 10) for rank in RANKS for suit in range(4)], dtype=np.int16)
+
+
+def mixBits(values):
+    '''
+    Scrambles 64-bit integers with the splitmix64 finalizer, giving well spread random-looking keys.
+
+    Inputs:
+        values (ndarray): Array of uint64 values.
+
+    Returns (ndarray): Array of scrambled uint64 values.
+    '''
+    values = values + np.uint64(0x9E3779B97F4A7C15)
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def ordersFromDecks(decks):
+    '''
+    Returns the card orders of Deck instances as an array of card indexes.
+
+    Inputs:
+        decks (list): List of full Deck instances.
+
+    Returns (ndarray): A (len(decks), 52) array, front of each deck first.
+    '''
+    return np.array([[cardIndex(code) for code in deck.getCodes()] for deck in decks], dtype=np.int8)
+
+
+def randomOrders(count, rng=None):
+    '''
+    Returns random deck orders.
+
+    Inputs:
+        count (int): Number of deck orders.
+        rng (Generator): NumPy random generator; a new one is made if not given.
+
+    Returns (ndarray): A (count, 52) array of card indexes.
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    return np.argsort(rng.random((count, 52)), axis=1).astype(np.int8)
+
+
+
+class TableBatch:
+    # Many tables stored as NumPy arrays and played in lockstep, one round per step.
+
+    def __init__(self, orders, rules=None, seed=None):
+        '''
+        Initializes the TableBatch class.
+
+        Inputs:
+            orders (ndarray): A (count, 52) array of card indexes, one deck order per table,
+                front of the deck first.
+            rules (Rules): The rules used by every table; defaults to the original game.
+            seed (int): Seed for the shuffles used when a table's deck is repopulated. The k-th
+                shuffle of table i depends only on (seed, i, k), so batches built with the same
+                seed shuffle the same way no matter how play differs between them.
+
+        Returns: None
+        '''
+        orders = np.array(orders, dtype=np.int8)
+        assert orders.ndim == 2 and orders.shape[1] == 52, 'Error: orders must have 52 cards per table'
+        assert (np.sort(orders, axis=1) == np.arange(52)).all(), 'Error: each order must hold every card once'
+        if rules is None:
+            rules = Rules()
+
+        # the deck of table i is orders[i, pos:pos + deckSize] wrapping around; the cards dealt
+        # since the last clear are the hands and everything else is the discard pile
+        count = orders.shape[0]
+        self.__rules = rules
+        if seed is None:
+            seed = int(np.random.default_rng().integers(2 ** 63))
+        self.__seed = np.uint64(seed)
+        self.__orders = orders
+        self.__base = np.arange(count, dtype=np.int64) * 52
+        self.__pos = np.zeros(count, dtype=np.int64)
+        self.__deckSize = np.full(count, 52, dtype=np.int64)
+        self.__playerValue = np.zeros(count, dtype=np.int16)
+        self.__playerCards = np.zeros(count, dtype=np.int16)
+        self.__dealerValue = np.zeros(count, dtype=np.int16)
+        self.__dealerCards = np.zeros(count, dtype=np.int16)
+        self.__upValue = np.zeros(count, dtype=np.int16)
+        self.__repopulations = np.zeros(count, dtype=np.int64)
+        self.__loads = 0
+        self.__countTable = None
+        self.__runningCount = np.zeros(count, dtype=np.int64)
+        self.__holeCount = np.zeros(count, dtype=np.int64)
+
+
+    def loadOrders(self, orders):
+        '''
+        Replaces the deck of every table with a new full deck order. The tables must be clear.
+        Running counts and repopulation counts start over, as for a new TableBatch.
+
+        Inputs:
+            self is the TableBatch.
+            orders (ndarray): A (count, 52) array of card indexes, front of the deck first.
+
+        Returns: None
+        '''
+        orders = np.array(orders, dtype=np.int8)
+        assert orders.shape == self.__orders.shape, 'Error: orders must have one 52 card deck per table'
+        assert not self.__playerCards.any(), 'Error: tables must be cleared before loading decks'
+        self.__orders = orders
+        self.__pos[:] = 0
+        self.__deckSize[:] = 52
+        self.__runningCount[:] = 0
+        self.__holeCount[:] = 0
+        self.__repopulations[:] = 0
+        # a new load gets its own repopulation shuffles, although the counters start over
+        self.__loads += 1
+
+
+    def size(self):
+        '''
+        Returns the number of tables in the batch.
+
+        Inputs:
+            self is the TableBatch.
+        '''
+        return self.__orders.shape[0]
+
+
+    def getRules(self):
+        '''
+        Returns the Rules used by every table.
+
+        Inputs:
+            self is the TableBatch.
+        '''
+        return self.__rules
+
+
+    def getPlayerValues(self):
+        '''
+        Returns a copy of the player hand values of every table.
+
+        Inputs:
+            self is the TableBatch.
+        '''
+        return self.__playerValue.copy()
+
+
+    def getDealerValues(self):
+        '''
+        Returns a copy of the dealer hand values of every table.
+
+        Inputs:
+            self is the TableBatch.
+        '''
+        return self.__dealerValue.copy()
+
+
+    def getDeckPositions(self):
+        '''
+        Returns a copy of the position of the front of each table's deck in its order array.
+
+        Inputs:
+            self is the TableBatch.
+        '''
+        return self.__pos.copy()
+
+
+    def getSeed(self):
+        '''
+        Returns the seed of the repopulation shuffles.
+
+        Inputs:
+            self is the TableBatch.
+        '''
+        return int(self.__seed)
+
+
+    def getRepopulations(self):
+        '''
+        Returns a copy of the number of times each table's deck has been repopulated.
+
+        Inputs:
+            self is the TableBatch.
+        '''
+        return self.__repopulations.copy()
+
+
+    def getDeckSizes(self):
+        '''
+        Returns a copy of the number of cards left in each table's deck.
+
+        Inputs:
+            self is the TableBatch.
+        '''
+        return self.__deckSize.copy()
+
+
+    def setCountTags(self, tags=None):
+        '''
+        Starts keeping a running count at every table, like Deck.setCountTags: the sum of the
+        tags of the cards dealt since the table's deck was last repopulated. The dealer's hole
+        card is only counted once the table is cleared, since the player cannot see it before
+        then. Counts start at 0.
+
+        Inputs:
+            self is the TableBatch.
+            tags (dict): Tag (a number) for each rank 'A' to 'K'; None to stop counting.
+
+        Returns: None
+        '''
+        assert tags is None or sorted(tags) == sorted(RANKS), 'Error: tags must give a number for every rank'
+        if tags is None:
+            self.__countTable = None
+        else:
+            self.__countTable = np.array([tags[rank] for rank in RANKS for suit in range(4)], dtype=np.int64)
+        self.__runningCount[:] = 0
+        self.__holeCount[:] = 0
+
+
+    def getRunningCounts(self):
+        '''
+        Returns a copy of the running count of every table (all 0 if no count tags are set).
+
+        Inputs:
+            self is the TableBatch.
+        '''
+        return self.__runningCount.copy()
+
+
+    def __repopulate(self, rows):
+        '''
+        Shuffles the discard pile of each table in rows back into its empty deck, like Table does.
+
+        Inputs:
+            self is the TableBatch.
+            rows (ndarray): Indexes of the tables to repopulate.
+
+        Returns: None
+        '''
+        # the discard pile is every card that is not in a hand, starting at the front of the deck
+        in_hands = (self.__playerCards[rows] + self.__dealerCards[rows]).astype(np.int64)
+        assert (in_hands < 52).all(), 'Error: no cards left to deal; every card is in a hand'
+        slots = self.__base[rows, None] + (self.__pos[rows, None] + np.arange(52)) % 52
+        cards = self.__orders.ravel()[slots]
+
+        # shuffle the discard part of each row by sorting keys made from (seed, table, shuffle number, slot)
+        shuffle_id = ((np.uint64(self.__loads) << np.uint64(44)) | (rows.astype(np.uint64) << np.uint64(20))
+                      | self.__repopulations[rows].astype(np.uint64))
+        stream = mixBits(self.__seed ^ mixBits(shuffle_id))
+        keys = mixBits(stream[:, None] + np.arange(52, dtype=np.uint64))
+        keys[np.arange(52) >= 52 - in_hands[:, None]] = np.iinfo(np.uint64).max
+        cards = np.take_along_axis(cards, np.argsort(keys, axis=1), axis=1)
+        self.__orders.ravel()[slots] = cards
+        self.__deckSize[rows] = 52 - in_hands
+        self.__repopulations[rows] += 1
+        self.__runningCount[rows] = 0
+        self.__holeCount[rows] = 0
+
+
+    def __draw(self, rows=None, hole=False):
+        '''
+        Deals the front card of the deck of each table in rows, repopulating empty decks first.
+
+        Inputs:
+            self is the TableBatch.
+            rows (ndarray): Indexes of the tables to deal from; every table if not given.
+            hole (bool): True for the dealer's hole card, which is counted when the table is cleared.
+
+        Returns (ndarray): The values of the cards dealt.
+        '''
+        if rows is None:
+            empty = np.flatnonzero(self.__deckSize == 0)
+            if len(empty) > 0:
+                self.__repopulate(empty)
+            cards = self.__orders.ravel()[self.__base + self.__pos]
+            self.__pos += 1
+            self.__pos[self.__pos == 52] = 0
+            self.__deckSize -= 1
+            if self.__countTable is not None and hole:
+                self.__holeCount[:] = self.__countTable[cards]
+            elif self.__countTable is not None:
+                self.__runningCount += self.__countTable[cards]
+            return CARD_VALUE_TABLE[cards]
+
+        empty = rows[self.__deckSize[rows] == 0]
+        if len(empty) > 0:
+            self.__repopulate(empty)
+        pos = self.__pos[rows]
+        cards = self.__orders.ravel()[self.__base[rows] + pos]
+        self.__pos[rows] = (pos + 1) % 52
+        self.__deckSize[rows] -= 1
+        if self.__countTable is not None:
+            self.__runningCount[rows] += self.__countTable[cards]
+        return CARD_VALUE_TABLE[cards]
+
+
+    def dealHands(self):
+        '''
+        Deals the player, dealer, player, dealer cards at every table.
+
+        Inputs:
+            self is the TableBatch.
+
+        Returns: None
+        '''
+        # count each card as it is dealt, so a repopulation part way through the deal leaves
+        # the cards already dealt out of the shuffle
+        self.__playerValue[:] = self.__draw()
+        self.__playerCards[:] = 1
+        self.__upValue[:] = self.__draw()
+        self.__dealerCards[:] = 1
+        self.__playerValue += self.__draw()
+        self.__playerCards[:] = 2
+        self.__dealerValue[:] = self.__upValue + self.__draw(hole=True)
+        self.__dealerCards[:] = 2
+
+
+    def playRound(self, policy):
+        '''
+        Plays one round at every table the same way autoPlay.playRound plays a Table, and
+        clears the tables at the end.
+
+        Inputs:
+            self is the TableBatch.
+            policy (callable): Called with arrays (playerValue, cardCount, upValue); returns a
+                bool array that is True where the player hits. A policy with a true perTable
+                attribute is also given the indexes of the tables deciding and the batch, so it
+                can look up each table's own strategy or running count.
+
+        Returns (ndarray): Outcome of each table: 1 if the player won, 0 for a tie, -1 if the dealer won.
+        '''
+        rules = self.__rules
+        limit = rules.getBustLimit()
+        self.dealHands()
+
+        # player turn: hit the tables whose policy says so until all stay or go bust
+        hit_count = np.zeros(self.size(), dtype=np.int16)
+        per_table = getattr(policy, 'perTable', False)
+        # a dealt hand over a low bust limit is already bust and takes no cards
+        deciding = np.flatnonzero(self.__playerValue <= limit)
+        while len(deciding) > 0:
+            if per_table:
+                hit = policy(self.__playerValue[deciding], self.__playerCards[deciding],
+                             self.__upValue[deciding], deciding, self)
+            else:
+                hit = policy(self.__playerValue[deciding], self.__playerCards[deciding], self.__upValue[deciding])
+            hit = np.asarray(hit, dtype=bool)
+            deciding = deciding[hit]
+            if len(deciding) == 0:
+                break
+            self.__playerValue[deciding] += self.__draw(deciding)
+            self.__playerCards[deciding] += 1
+            hit_count[deciding] += 1
+            deciding = deciding[self.__playerValue[deciding] <= limit]
+
+        player_bust = self.__playerValue > limit
+        player_natural = (hit_count > 0) & (self.__playerValue == limit)
+
+        # dealer turn for every table where the round is not already decided
+        dealing = np.flatnonzero(~player_bust & ~player_natural)
+        dealing = dealing[self.__dealerValue[dealing] < rules.getStandThreshold()]
+        while len(dealing) > 0:
+            self.__dealerValue[dealing] += self.__draw(dealing)
+            self.__dealerCards[dealing] += 1
+            dealing = dealing[self.__dealerValue[dealing] < rules.getStandThreshold()]
+
+        # who won: bust and natural first, then closest to the limit
+        dealer_bust = self.__dealerValue > limit
+        outcomes = np.sign(self.__playerValue - self.__dealerValue).astype(np.int8)
+        if rules.getTiePolicy() == 'dealer':
+            outcomes[outcomes == 0] = -1
+        elif rules.getTiePolicy() == 'player':
+            outcomes[outcomes == 0] = 1
+        outcomes[dealer_bust] = 1
+        outcomes[player_natural] = 1
+        outcomes[player_bust] = -1
+
+        self.clearTable()
+        return outcomes
+
+
+    def clearTable(self):
+        '''
+        Moves the cards in every hand to the discard pile.
+
+        Inputs:
+            self is the TableBatch.
+
+        Returns: None
+        '''
+        self.__playerCards[:] = 0
+        self.__dealerCards[:] = 0
+        self.__runningCount += self.__holeCount
+        self.__holeCount[:] = 0
+
+
+
+def table_batch_tests():
+    '''
+    Tests for the TableBatch class.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import contextlib
+    import io
+    import time
+    from autoPlay import ThresholdPolicy, playRound
+    from playingCards import Deck, cardCode
+    from simple21 import Table
+
+    rng = np.random.default_rng(175)
+    orders = randomOrders(200, rng)
+    policy = ThresholdPolicy(15)
+    rounds = 5
+
+    # same deck orders give the same outcomes as Table. Five rounds never use up a deck; after a
+    # repopulation the batch shuffles differently from random.shuffle, so longer runs are checked
+    # for card conservation below instead
+    batch = TableBatch(orders)
+    batch_outcomes = np.array([batch.playRound(policy) for i in range(rounds)]).T
+    assert (batch.getRepopulations() == 0).all(), "fail the test"
+    for row in range(len(orders)):
+        table = Table(deck=Deck(codes=[cardCode(index) for index in orders[row]]))
+        with contextlib.redirect_stdout(io.StringIO()):
+            table_outcomes = [playRound(table, policy) for i in range(rounds)]
+        is_pass = (table_outcomes == list(batch_outcomes[row]))
+        assert is_pass == True, "fail the test"
+
+    # tie policies are applied in the batch
+    for tie_policy in ('dealer', 'player'):
+        rules = Rules(tiePolicy=tie_policy)
+        batch = TableBatch(orders, rules)
+        outcomes = batch.playRound(policy)
+        for row in range(len(orders)):
+            table = Table(rules, Deck(codes=[cardCode(index) for index in orders[row]]))
+            with contextlib.redirect_stdout(io.StringIO()):
+                is_pass = (playRound(table, policy) == outcomes[row])
+            assert is_pass == True, "fail the test"
+
+    # low and odd bust limits, where the dealt hand itself can be over the limit
+    for rules in (Rules(10, 'player', 15), Rules(17, 'push', 20), Rules(20, 'dealer', 27)):
+        batch = TableBatch(orders, rules)
+        batch_outcomes = np.array([batch.playRound(policy) for i in range(rounds)]).T
+        assert (batch.getRepopulations() == 0).all(), "fail the test"
+        for row in range(len(orders)):
+            table = Table(rules, Deck(codes=[cardCode(index) for index in orders[row]]), verbose=False)
+            is_pass = ([playRound(table, policy) for i in range(rounds)] == list(batch_outcomes[row]))
+            assert is_pass == True, "fail the test"
+
+    # long runs repopulate every deck, and no card is dealt twice before it reaches the discard
+    # pile; the cards each round dealt are read from the deck orders before and after it
+    batch = TableBatch(orders[:20], seed=1)
+    since_refill = [set() for row in range(20)]
+    for i in range(100):
+        before = batch._TableBatch__orders.copy()
+        pos, deck_size, refills = batch.getDeckPositions(), batch.getDeckSizes(), batch.getRepopulations()
+        batch.playRound(policy)
+        after = batch._TableBatch__orders
+        dealt_to = (batch.getDeckPositions() - pos) % 52
+        for row in range(20):
+            if batch.getRepopulations()[row] == refills[row]:
+                dealt = [before[row, (pos[row] + k) % 52] for k in range(dealt_to[row])]
+                is_pass = (dealt_to[row] <= deck_size[row])
+            else:
+                # the old deck runs out, then the shuffled discard pile is dealt from the same place
+                empty = (pos[row] + deck_size[row]) % 52
+                dealt = ([before[row, (pos[row] + k) % 52] for k in range(deck_size[row])]
+                         + [after[row, (empty + k) % 52] for k in range((dealt_to[row] - deck_size[row]) % 52)])
+                since_refill[row] = set()
+                is_pass = True
+            values = CARD_VALUE_TABLE[dealt].sum()
+            is_pass = (is_pass and len(set(dealt)) == len(dealt) and not since_refill[row] & set(dealt)
+                       and values == batch.getPlayerValues()[row] + batch.getDealerValues()[row]
+                       and sorted(after[row]) == list(range(52)))
+            assert is_pass == True, "fail the test"
+            since_refill[row] |= set(dealt)
+    assert (batch.getRepopulations() > 1).all(), "fail the test"
+
+    # the running count is the tags of every card dealt once the tables are cleared
+    tags = {rank: 1 if rank in 'A23456' else -1 if rank in 'TJQK' else 0 for rank in RANKS}
+    tag_table = np.array([tags[rank] for rank in RANKS for suit in range(4)])
+    batch = TableBatch(orders[:50], seed=3)
+    batch.setCountTags(tags)
+    for i in range(3):
+        batch.playRound(policy)
+    dealt = batch.getDeckPositions()
+    is_pass = ([tag_table[orders[row, :dealt[row]]].sum() for row in range(50)] == list(batch.getRunningCounts()))
+    assert is_pass == True, "fail the test"
+
+    # loading new decks starts the counts over, as for a new batch
+    for i in range(20):
+        batch.playRound(policy)
+    assert (batch.getRepopulations() > 0).all(), "fail the test"
+    batch.loadOrders(orders[50:100])
+    is_pass = (not batch.getRunningCounts().any() and not batch.getRepopulations().any())
+    assert is_pass == True, "fail the test"
+    for i in range(3):
+        batch.playRound(policy)
+    dealt = batch.getDeckPositions()
+    is_pass = ([tag_table[orders[50 + row, :dealt[row]]].sum() for row in range(50)]
+               == list(batch.getRunningCounts()))
+    assert is_pass == True, "fail the test"
+
+    # throughput compared with one Table per game
+    table = Table(deck=Deck(codes=[cardCode(index) for index in orders[0]]))
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(2000):
+            if table.getDeck().size() < 20:
+                table = Table(deck=Deck(codes=[cardCode(index) for index in orders[i % 200]]))
+            playRound(table, policy)
+    table_rate = 2000 / (time.perf_counter() - start)
+
+    batch = TableBatch(randomOrders(100000, rng), seed=2)
+    start = time.perf_counter()
+    for i in range(10):
+        batch.playRound(policy)
+    batch_rate = 10 * batch.size() / (time.perf_counter() - start)
+    print('Table: %.0f rounds/s, TableBatch: %.0f rounds/s (%.0fx)' % (table_rate, batch_rate, batch_rate / table_rate))
+
+
+if __name__ == "__main__":
+    table_batch_tests()
@@ -0,0 +1,172 @@
+# Policy tournament with common random numbers for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+
+
+from concurrent.futures import ProcessPoolExecutor
+from gameRules import Rules
+from tableBatch import TableBatch, randomOrders
+import numpy as np
+
+
+# card index of the card with the opposite rank (A<->K, 2<->Q, ..., 7<->7) and the same suit
+COMPLEMENT = np.array([(12 - index // 4) * 4 + index % 4 for index in range(52)], dtype=np.int8)
+
+
+def deckOrders(rng, tables, antithetic=False):
+    '''
+    Returns the next deck orders shared by every policy in a tournament. They are rebuilt from
+    the seed in each worker, so the orders never have to be copied between processes.
+
+    Inputs:
+        rng (Generator): NumPy random generator made from the tournament seed.
+        tables (int): Number of tables.
+        antithetic (bool): True to make the second half of the tables the rank complements
+            of the first half, so each table has an antithetic partner.
+
+    Returns (ndarray): A (tables, 52) array of card indexes.
+    '''
+    if not antithetic:
+        return randomOrders(tables, rng)
+    assert tables % 2 == 0, 'Error: antithetic pairing needs an even number of tables'
+    orders = randomOrders(tables // 2, rng)
+    return np.concatenate([orders, COMPLEMENT[orders]])
+
+
+def playPolicy(policy, seed, tables, rounds, rules=None, antithetic=False, persistent=False):
+    '''
+    Plays one policy for a number of rounds at every table of the tournament.
+
+    Inputs:
+        policy (callable): Vectorized hit/stay policy.
+        seed (int): Seed for the deck orders and repopulation shuffles.
+        tables (int): Number of tables.
+        rounds (int): Number of rounds at each table.
+        rules (Rules): The rules of the game; defaults to the original game.
+        antithetic (bool): True to pair each table with its rank complement.
+        persistent (bool): True to keep playing each table's deck with repopulation; False to
+            deal every round from a new deck order.
+
+    Returns (ndarray): Mean outcome of each independent unit: a table, or an antithetic pair of tables.
+    '''
+    rng = np.random.default_rng(seed)
+    batch = TableBatch(deckOrders(rng, tables, antithetic), rules, seed)
+    totals = np.zeros(tables)
+    for i in range(rounds):
+        if i > 0 and not persistent:
+            batch.loadOrders(deckOrders(rng, tables, antithetic))
+        totals += batch.playRound(policy)
+    totals /= rounds
+
+    if antithetic:
+        totals = (totals[:tables // 2] + totals[tables // 2:]) / 2
+    return totals
+
+
+def runTournament(policies, tables=10000, rounds=100, seed=0, rules=None, antithetic=False,
+                  persistent=False, workers=1):
+    '''
+    Plays every policy against the same deck orders and the same repopulation shuffles
+    (common random numbers), so differences between policies can be measured with far
+    fewer rounds than with independent shuffles. Dealing every round from a new shared deck
+    order keeps the policies lined up card for card; persistent decks drift apart once the
+    policies have used different numbers of cards, which pairs less well.
+
+    Inputs:
+        policies (list): Vectorized hit/stay policies; they must be picklable if workers > 1.
+        tables (int): Number of tables each policy plays at.
+        rounds (int): Number of rounds at each table.
+        seed (int): Seed shared by every policy.
+        rules (Rules): The rules of the game; defaults to the original game.
+        antithetic (bool): True to pair each table with its rank complement.
+        persistent (bool): True to keep playing each table's deck with repopulation.
+        workers (int): Number of processes to play policies in parallel.
+
+    Returns (ndarray): A (len(policies), units) array of mean outcomes, one column per unit.
+    '''
+    if rules is None:
+        rules = Rules()
+    jobs = [(policy, seed, tables, rounds, rules, antithetic, persistent) for policy in policies]
+
+    if workers <= 1:
+        results = [playPolicy(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(playPolicy, *zip(*jobs)))
+    return np.array(results)
+
+
+def pairedReport(names, results, z=1.96):
+    '''
+    Returns a report of each policy's expected outcome per round and its paired difference
+    from the first policy, with confidence intervals. The variance reduction column is how
+    many times fewer rounds the paired comparison needs than independent runs would.
+
+    Inputs:
+        names (list): Names of the policies, in the same order as results.
+        results (ndarray): Output of runTournament.
+        z (float): Normal quantile for the confidence intervals (1.96 for 95%).
+
+    Returns (str): The report.
+    '''
+    units = results.shape[1]
+    means = results.mean(axis=1)
+    errors = results.std(axis=1, ddof=1) / np.sqrt(units)
+    lines = ['%-12s %9s %9s   %9s %9s %9s' % ('policy', 'EV', '+/-', 'diff', '+/-', 'var red')]
+
+    for i, name in enumerate(names):
+        line = '%-12s %9.5f %9.5f' % (name, means[i], z * errors[i])
+        if i > 0:
+            # paired difference against the first policy
+            difference = results[i] - results[0]
+            paired_error = difference.std(ddof=1) / np.sqrt(units)
+            independent_error = np.sqrt(errors[i] ** 2 + errors[0] ** 2)
+            reduction = (independent_error / paired_error) ** 2 if paired_error > 0 else np.inf
+            line += '   %+9.5f %9.5f %8.1fx' % (difference.mean(), z * paired_error, reduction)
+        lines.append(line)
+
+    return '\n'.join(lines)
+
+
+
+def tournament_tests():
+    '''
+    Tests for the tournament.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import time
+    from autoPlay import ThresholdPolicy
+
+    # complement swaps low and high ranks and keeps every card once
+    orders = deckOrders(np.random.default_rng(1), 10, antithetic=True)
+    is_pass = (np.sort(orders, axis=1) == np.arange(52)).all()
+    assert is_pass == True, "fail the test"
+    is_pass = (COMPLEMENT[COMPLEMENT] == np.arange(52)).all()
+    assert is_pass == True, "fail the test"
+
+    # the same policy twice gives identical results
+    policies = [ThresholdPolicy(15), ThresholdPolicy(15)]
+    for persistent in (False, True):
+        results = runTournament(policies, tables=500, rounds=20, seed=3, persistent=persistent)
+        is_pass = (results[0] == results[1]).all()
+        assert is_pass == True, "fail the test"
+
+    # parallel and serial runs agree
+    names = ['stand%d' % total for total in (13, 14, 15, 16, 17)]
+    policies = [ThresholdPolicy(total) for total in (13, 14, 15, 16, 17)]
+    start = time.perf_counter()
+    serial = runTournament(policies, tables=4000, rounds=50, seed=5, antithetic=True)
+    elapsed = time.perf_counter() - start
+    parallel = runTournament(policies, tables=4000, rounds=50, seed=5, antithetic=True, workers=2)
+    is_pass = (serial == parallel).all()
+    assert is_pass == True, "fail the test"
+    print(pairedReport(names, serial))
+    print('%d policies x %d rounds in %.2f s' % (len(policies), 4000 * 50, elapsed))
+
+
+if __name__ == "__main__":
+    tournament_tests()
@@ -0,0 +1,406 @@
+# Streaming transcript parser and summary for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+#
+# A transcript is the text assignment2 prints, as in shuffledDeck_sampleOutput.txt. Files are
+# read as bytes one line at a time, so memory use does not grow with the size of the file,
+# and every round starts at a "Dealing cards" line, so a file can be split into chunks at
+# those lines and the chunks parsed in parallel.
+
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+
+RoundRecord = namedtuple('RoundRecord', 'round winner playerCards dealerCards playerValue dealerValue '
+                                        'playerBust dealerBust natural repopulated')
+
+ROUND_START = b'Dealing cards to player and dealer...'
+PLAYER_HAND = b"Player's hand:"
+DEALER_HAND = b"Dealer's hand:"
+REPOPULATING = b'Repopulating deck'
+PROMPT = b'>> '
+HIDDEN = 'xx'
+UPCARD_VALUES = {'A': 1, 'T': 10, 'J': 10, 'Q': 10, 'K': 10}
+CHUNK_SIZE = 64 * 2 ** 20
+
+
+def parseHand(line):
+    '''
+    Returns the cards and value shown on a hand line such as
+    "Player's hand:[ KS ][ QS ], value = 20".
+
+    Inputs:
+        line (bytes): The hand line, without the line ending.
+
+    Returns:
+        cards (tuple): Card codes, with 'xx' for a face down card.
+        value (int): Value of the hand, or None if it was not shown.
+    '''
+    start = line.index(b':') + 1
+    comma = line.find(b',', start)
+    cards = line[start:comma] if comma >= 0 else line[start:]
+    codes = tuple(cards[i + 2:i + 4].decode() for i in range(0, len(cards) - 5, 6))
+    if comma < 0:
+        return codes, None
+    return codes, int(line[line.index(b'=', comma) + 1:])
+
+
+def parseEnding(line, playerLine, dealerLine, repopulated):
+    '''
+    Returns the record of a round from the line announcing who won and the last hands shown.
+
+    Inputs:
+        line (bytes): The line announcing the winner, such as "Dealer wins round 3!".
+        playerLine (bytes): The last player hand line of the round.
+        dealerLine (bytes): The last dealer hand line of the round.
+        repopulated (bool): True if the deck was repopulated during the round.
+
+    Returns (RoundRecord): The round.
+    '''
+    if b'Player wins' in line:
+        winner = 'player'
+    elif b'Dealer wins' in line:
+        winner = 'dealer'
+    else:
+        winner = 'tie'
+    digits = line[line.rindex(b'round ') + 6:].split(b' ')[0].rstrip(b'!')
+    player_cards, player_value = parseHand(playerLine)
+    dealer_cards, dealer_value = parseHand(dealerLine)
+    return RoundRecord(int(digits), winner, player_cards, dealer_cards, player_value, dealer_value,
+                       b'Player went bust' in line, b'Dealer went bust' in line, b'NATURAL' in line,
+                       repopulated)
+
+
+def readRounds(file, end=None):
+    '''
+    Reads rounds from a transcript opened in binary mode, from where the file is now up to
+    byte offset end. Rounds that are cut off before their winner is announced are skipped.
+
+    Inputs:
+        file (file): The transcript, opened with 'rb'.
+        end (int): Byte offset to stop at; the end of the file if not given.
+
+    Returns (generator): RoundRecord for each round, in order.
+    '''
+    position = file.tell()
+    player_line = dealer_line = None
+    repopulated = False
+
+    for line in file:
+        line_start = position
+        position += len(line)
+        line = line.rstrip()
+
+        # input that was not echoed leaves the next output on the prompt line
+        if PROMPT in line:
+            line = line[line.rindex(PROMPT) + 3:]
+
+        if line.startswith(PLAYER_HAND):
+            player_line = line
+        elif line.startswith(DEALER_HAND):
+            dealer_line = line
+        elif line.startswith(ROUND_START):
+            if end is not None and line_start >= end:
+                return
+            player_line = dealer_line = None
+            repopulated = False
+        elif line.startswith(REPOPULATING):
+            repopulated = True
+        elif line.endswith(b'!') and b'round ' in line and player_line is not None:
+            yield parseEnding(line, player_line, dealer_line, repopulated)
+            player_line = None
+
+
+def chunkOffsets(filename, size=CHUNK_SIZE):
+    '''
+    Splits a transcript into chunks of about size bytes that each start at the beginning of
+    a round (or of the file).
+
+    Inputs:
+        filename (str): Name of the transcript.
+        size (int): Rough number of bytes in each chunk.
+
+    Returns (list): (start, end) byte offsets of each chunk.
+    '''
+    total = os.path.getsize(filename)
+    starts = [0]
+    with open(filename, 'rb') as file:
+        for guess in range(size, total, size):
+            if guess <= starts[-1]:
+                continue
+
+            # skip the rest of the line, then move on to the next round
+            file.seek(guess)
+            position = guess + len(file.readline())
+            for line in file:
+                if line.startswith(ROUND_START):
+                    starts.append(position)
+                    break
+                position += len(line)
+    return list(zip(starts, starts[1:] + [total]))
+
+
+
+class TranscriptSummary:
+    # Running totals of rounds; the memory used does not depend on the number of rounds.
+
+    def __init__(self):
+        '''
+        Initializes the TranscriptSummary class.
+
+        Returns: None
+        '''
+        self.__rounds = 0
+        self.__winners = {'player': 0, 'tie': 0, 'dealer': 0}
+        self.__playerBusts = 0
+        self.__naturals = 0
+        self.__repopulations = 0
+
+        # dealer's final totals for each upcard value, over the rounds the dealer played
+        self.__dealerTotals = {}
+        self.__dealerBusts = {}
+
+
+    def add(self, record):
+        '''
+        Adds a round to the totals.
+
+        Inputs:
+            self is the TranscriptSummary.
+            record (RoundRecord): The round.
+
+        Returns: None
+        '''
+        self.__rounds += 1
+        self.__winners[record.winner] += 1
+        self.__playerBusts += record.playerBust
+        self.__naturals += record.natural
+        self.__repopulations += record.repopulated
+
+        if record.dealerValue is not None:
+            upcard = record.dealerCards[0][0]
+            up_value = UPCARD_VALUES.get(upcard) or int(upcard)
+            totals = self.__dealerTotals.setdefault(up_value, {})
+            totals[record.dealerValue] = totals.get(record.dealerValue, 0) + 1
+            self.__dealerBusts[up_value] = self.__dealerBusts.get(up_value, 0) + record.dealerBust
+
+
+    def merge(self, other):
+        '''
+        Adds the totals of another summary to this one.
+
+        Inputs:
+            self is the TranscriptSummary.
+            other (TranscriptSummary): The summary to add.
+
+        Returns: None
+        '''
+        self.__rounds += other.__rounds
+        for winner in self.__winners:
+            self.__winners[winner] += other.__winners[winner]
+        self.__playerBusts += other.__playerBusts
+        self.__naturals += other.__naturals
+        self.__repopulations += other.__repopulations
+        for up_value, totals in other.__dealerTotals.items():
+            mine = self.__dealerTotals.setdefault(up_value, {})
+            for total, count in totals.items():
+                mine[total] = mine.get(total, 0) + count
+            self.__dealerBusts[up_value] = self.__dealerBusts.get(up_value, 0) + other.__dealerBusts[up_value]
+
+
+    def getRounds(self):
+        '''
+        Returns the number of rounds added.
+
+        Inputs:
+            self is the TranscriptSummary.
+        '''
+        return self.__rounds
+
+
+    def getWinners(self):
+        '''
+        Returns the number of rounds won by the player and dealer and tied.
+
+        Inputs:
+            self is the TranscriptSummary.
+
+        Returns (dict): Rounds for 'player', 'tie' and 'dealer'.
+        '''
+        return dict(self.__winners)
+
+
+    def getDealerTotals(self, upValue):
+        '''
+        Returns how often the dealer finished on each total when showing an upcard.
+
+        Inputs:
+            self is the TranscriptSummary.
+            upValue (int): Value of the dealer's upcard (1 to 10).
+
+        Returns (dict): Number of rounds for each final total.
+        '''
+        return dict(self.__dealerTotals.get(upValue, {}))
+
+
+    def report(self):
+        '''
+        Returns a text report of win, bust and natural rates and the dealer's totals by upcard.
+
+        Inputs:
+            self is the TranscriptSummary.
+
+        Returns (str): The report.
+        '''
+        rounds = max(self.__rounds, 1)
+        lines = ['Rounds: %d' % self.__rounds]
+        for label, count in (('Player wins', self.__winners['player']), ('Ties', self.__winners['tie']),
+                             ('Dealer wins', self.__winners['dealer']), ('Player busts', self.__playerBusts),
+                             ('Naturals', self.__naturals), ('Repopulations', self.__repopulations)):
+            lines.append('%-14s %10d  (%.4f)' % (label + ':', count, count / rounds))
+
+        lines.append('')
+        lines.append('%-6s %10s %8s %8s' % ('upcard', 'played', 'mean', 'bust'))
+        for up_value in sorted(self.__dealerTotals):
+            totals = self.__dealerTotals[up_value]
+            played = sum(totals.values())
+            mean = sum(total * count for total, count in totals.items()) / played
+            lines.append('%-6s %10d %8.2f %8.4f' % ('A' if up_value == 1 else up_value, played, mean,
+                                                   self.__dealerBusts[up_value] / played))
+        return '\n'.join(lines)
+
+
+
+def summarizeChunk(filename, start=0, end=None):
+    '''
+    Returns the summary of the rounds in one chunk of a transcript.
+
+    Inputs:
+        filename (str): Name of the transcript.
+        start (int): Byte offset of the start of the chunk, at the start of a round.
+        end (int): Byte offset of the end of the chunk; the end of the file if not given.
+
+    Returns (TranscriptSummary): The summary.
+    '''
+    summary = TranscriptSummary()
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        for record in readRounds(file, end):
+            summary.add(record)
+    return summary
+
+
+def summarizeFiles(filenames, workers=1, size=CHUNK_SIZE):
+    '''
+    Returns one summary of all the rounds in several transcripts, parsing chunks of the files
+    in parallel.
+
+    Inputs:
+        filenames (list): Names of the transcripts.
+        workers (int): Number of processes.
+        size (int): Rough number of bytes in each chunk.
+
+    Returns (TranscriptSummary): The summary.
+    '''
+    jobs = [(filename, start, end) for filename in filenames for start, end in chunkOffsets(filename, size)]
+    if workers <= 1:
+        parts = [summarizeChunk(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            parts = pool.map(summarizeChunk, *zip(*jobs))
+
+    summary = TranscriptSummary()
+    for part in parts:
+        summary.merge(part)
+    return summary
+
+
+
+def transcript_tests():
+    '''
+    Tests for the transcript parser.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import contextlib
+    import io
+    import random
+    import tempfile
+    import time
+    import assignment2
+    from playingCards import RANKS, SUITS
+
+    # the sample transcript
+    with open('shuffledDeck_sampleOutput.txt', 'rb') as file:
+        records = list(readRounds(file))
+    is_pass = ([record.round for record in records] == list(range(1, 11)))
+    assert is_pass == True, "fail the test"
+    is_pass = (records[0] == RoundRecord(1, 'dealer', ('KS', 'QS'), ('JH', 'AH', 'QH'), 20, 21,
+                                          False, False, False, False))
+    assert is_pass == True, "fail the test"
+    is_pass = (records[1].playerBust and records[1].dealerCards == ('5H', HIDDEN) and records[1].dealerValue is None)
+    assert is_pass == True, "fail the test"
+    is_pass = ([record.winner for record in records[4:7]] == ['player', 'player', 'tie'] and records[4].natural
+               and records[5].dealerBust and records[9].repopulated)
+    assert is_pass == True, "fail the test"
+
+    # a piped game does not echo answers, so output follows the prompts on the same line
+    codes = [rank + suit for rank in RANKS for suit in SUITS]
+    random.seed(34)
+    random.shuffle(codes)
+    rounds = [0]
+
+    def ask(prompt):
+        # hit half the time and stop after 3000 rounds, without echoing the answer
+        print(prompt, end='')
+        if prompt.startswith('Would you like to HIT'):
+            return random.choice('hs')
+        rounds[0] += 1
+        return 'y' if rounds[0] < 3000 else 'n'
+
+    output = io.StringIO()
+    with tempfile.TemporaryDirectory() as folder:
+        deck_file = os.path.join(folder, 'deck.txt')
+        with open(deck_file, 'w') as file:
+            file.write('\n'.join(codes))
+        with contextlib.redirect_stdout(output):
+            assignment2.main(deck_file, ask)
+        text = output.getvalue().encode()
+
+        transcript = os.path.join(folder, 'transcript.txt')
+        with open(transcript, 'wb') as file:
+            file.write(text)
+        with open(transcript, 'rb') as file:
+            records = list(readRounds(file))
+        is_pass = ([record.round for record in records] == list(range(1, 3001)))
+        assert is_pass == True, "fail the test"
+
+        # chunks line up with rounds, so parallel summaries match a single pass
+        whole = summarizeFiles([transcript])
+        parts = summarizeFiles([transcript], workers=2, size=10000)
+        is_pass = (whole.report() == parts.report() and whole.getRounds() == 3000)
+        assert is_pass == True, "fail the test"
+
+        # throughput on a larger file
+        with open(transcript, 'wb') as file:
+            for i in range(40):
+                file.write(text)
+        megabytes = os.path.getsize(transcript) / 2 ** 20
+        for workers in (1, 4):
+            start = time.perf_counter()
+            summary = summarizeFiles([transcript], workers, size=8 * 2 ** 20)
+            elapsed = time.perf_counter() - start
+            print('%d worker(s): %.0f MB in %.2f s (%.0f MB/min)' % (workers, megabytes, elapsed,
+                                                                   megabytes / elapsed * 60))
+        is_pass = (summary.getRounds() == 40 * 3000)
+        assert is_pass == True, "fail the test"
+        print(summary.report())
+
+
+if __name__ == "__main__":
+    transcript_tests()
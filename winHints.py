@@ -0,0 +1,555 @@
+# Win, tie and lose chances for HIT and STAY for simplified 21 card game
+# Author: Amrit Aujla
+# References: lecture slides and labs from CMPUT 175
+# Collaborators: None
+#
+# The chances are exact for the cards the player has not seen: the full deck less the player's
+# hand and the dealer's upcard, so the hole card is one of the unseen cards. HIT means taking a
+# card now and then choosing between hitting and staying with the higher expected outcome.
+#
+# The dealer's turn stops the first time the total reaches the stand threshold, so a turn is
+# fixed by the multiset of cards drawn before the last one and the last card, and every order
+# of that multiset is equally likely. The chance of each (multiset, last card) pair is a
+# product of falling factorials of the card counts left. Its log is a sum of logs of those
+# factors, so the chances of staying for a whole batch of compositions come from one matrix
+# product. Those results are kept by composition, so after a HIT the next prompt finds most of
+# its work already done. If a prompt would go over its time budget, it shows infinite-deck
+# chances worked out once up front.
+
+
+from collections import namedtuple
+from dealerModel import CARD_PROBS, standOutcomes
+from gameRules import Rules
+import gc
+import numpy as np
+import time
+
+
+FULL_COUNTS = (4, 4, 4, 4, 4, 4, 4, 4, 4, 16)
+
+# each card value gets a digit of this base in composition keys
+KEY_BASE = 32
+
+# compositions worked out together in one NumPy step
+BATCH = 16
+
+# chances are (win, tie, lose); exact says which of stay and hit are exact for the unseen cards
+Hint = namedtuple('Hint', 'stay hit exact elapsed')
+
+
+def sequenceFeatures(counts, lengths, depth):
+    '''
+    Marks which factors of the falling factorials each dealer's turn uses, so the log of its
+    chance is a dot product with the logs of those factors for a composition.
+
+    Inputs:
+        counts (ndarray): A (K, 10) array of how many of each value each turn draws.
+        lengths (ndarray): Number of cards each turn draws.
+        depth (int): Most cards any turn draws.
+
+    Returns (ndarray): A (K, 11 * depth) array of 0 and 1; entry [i, value * depth + k] is 1
+        when turn i draws more than k cards of the value, and [i, 10 * depth + k] is 1 when it
+        draws more than k cards in all.
+    '''
+    steps = np.arange(depth)
+    drawn = np.concatenate([counts, lengths[:, None]], axis=1)
+    return (drawn[:, :, None] > steps).reshape(len(counts), -1).astype(float)
+
+
+def dealerSequences(upValue, rules):
+    '''
+    Lists every way the dealer's turn can go from an upcard, as the multiset of cards drawn
+    before the last one (starting with the hole card) and the last card.
+
+    Inputs:
+        upValue (int): Value of the dealer's upcard.
+        rules (Rules): The rules of the game.
+
+    Returns (tuple): (counts, coefficients, lengths, finals) where counts is a (K, 10) array of
+        how many of each value the whole turn draws, coefficients is the number of orders of
+        the cards before the last, lengths is the number of cards drawn and finals is the index
+        of the final total (stand threshold up to the bust limit, then bust).
+    '''
+    threshold = rules.getStandThreshold()
+    limit = rules.getBustLimit()
+    counts, coefficients, lengths, finals = [], [], [], []
+
+    def extend(drawn, smallest, total, size, orders):
+        # drawn holds the cards before the last in increasing value order; any card can come last
+        for last in range(1, 11):
+            if drawn[last - 1] < FULL_COUNTS[last - 1] and total + last >= threshold:
+                whole = list(drawn)
+                whole[last - 1] += 1
+                counts.append(whole)
+                coefficients.append(orders)
+                lengths.append(size + 1)
+                finals.append(min(total + last, limit + 1) - threshold)
+        for value in range(smallest, 11):
+            if drawn[value - 1] < FULL_COUNTS[value - 1] and total + value < threshold:
+                drawn[value - 1] += 1
+                # orders of a multiset: size! / (product of count!)
+                extend(drawn, value, total + value, size + 1, orders * (size + 1) / drawn[value - 1])
+                drawn[value - 1] -= 1
+
+    extend([0] * 10, 1, upValue, 0, 1.0)
+    return np.array(counts), np.array(coefficients), np.array(lengths), np.array(finals)
+
+
+
+class HintEngine:
+    # Works out the chances shown as hints, keeping results between prompts.
+
+    def __init__(self, rules=None, budget=0.005, maxCache=200000):
+        '''
+        Initializes the HintEngine class, listing the dealer's turns and working out the
+        infinite-deck chances used when a prompt runs out of time.
+
+        Inputs:
+            rules (Rules): The rules of the game; defaults to the original game.
+            budget (float): Most seconds to spend on one hint.
+            maxCache (int): Most cached compositions before the caches are emptied.
+
+        Returns: None
+        '''
+        if rules is None:
+            rules = Rules()
+        self.__rules = rules
+        self.__limit = rules.getBustLimit()
+        self.__threshold = rules.getStandThreshold()
+        self.__budget = budget
+        self.__maxCache = maxCache
+        self.__sequences = [dealerSequences(up, rules) for up in range(1, 11)]
+        self.__depth = max(int(sequence[2].max()) for sequence in self.__sequences)
+        # kept transposed and contiguous, which makes the product with a batch much faster
+        self.__features = [np.ascontiguousarray(sequenceFeatures(sequence[0], sequence[2], self.__depth).T)
+                           for sequence in self.__sequences]
+        # logs of 0 to 52 with a large negative standing in for the log of 0
+        self.__logs = np.log(np.maximum(np.arange(53), 1.0))
+        self.__logs[0] = -1e4
+        self.__digits = [KEY_BASE ** value for value in range(10)]
+        self.__endings, self.__outcomes = self.__outcomeTables()
+        self.__orderLogs = [np.log(sequence[1]) for sequence in self.__sequences]
+        self.__stayCache = {}
+        self.__bestCache = {}
+        # seconds per player hand, and for each upcard the seconds a batch takes whatever its
+        # size and per composition in it, to tell what finishes in time
+        self.__stateTime = 5e-6
+        self.__batchTime = []
+        self.__compositionTime = []
+        for up in range(1, 11):
+            single = full = float('inf')
+            for i in range(3):
+                now = time.perf_counter()
+                self.__stayChances(np.array([FULL_COUNTS]), up)
+                single = min(single, time.perf_counter() - now)
+                now = time.perf_counter()
+                self.__stayChances(np.array([FULL_COUNTS] * BATCH), up)
+                full = min(full, time.perf_counter() - now)
+            each = max(full - single, 0.0) / (BATCH - 1)
+            self.__batchTime.append(max(single - each, 0.0))
+            self.__compositionTime.append(each)
+        self.__approximate = self.__infiniteDeck()
+
+
+    def __infiniteDeck(self):
+        '''
+        Works out the infinite-deck (win, tie, lose) chances of staying and of hitting and then
+        playing on as well as possible, for every upcard and player total.
+
+        Inputs:
+            self is the HintEngine.
+
+        Returns (tuple): (stay, hit) arrays of shape (10, bustLimit + 1, 3).
+        '''
+        limit = self.__limit
+        stay = np.stack(standOutcomes(self.__rules), axis=2)
+        best = stay.copy()
+        hit = np.zeros_like(stay)
+        for total in range(limit - 1, 0, -1):
+            for value, chance in enumerate(CARD_PROBS, 1):
+                if total + value > limit:
+                    hit[:, total, 2] += chance
+                elif total + value == limit:
+                    hit[:, total, 0] += chance
+                else:
+                    hit[:, total] += chance * best[:, total + value]
+            hitting = hit[:, total, 0] - hit[:, total, 2] > stay[:, total, 0] - stay[:, total, 2]
+            best[:, total] = np.where(hitting[:, None], hit[:, total], stay[:, total])
+        return stay, hit
+
+
+    def getCacheSize(self):
+        '''
+        Returns the number of cached results.
+
+        Inputs:
+            self is the HintEngine.
+
+        Returns (tuple): (compositions with chances of staying, player hands with chances of hitting).
+        '''
+        return len(self.__stayCache), len(self.__bestCache)
+
+
+    def __outcomeTables(self):
+        '''
+        Finds which final total each of the dealer's turns ends on, and how each final total
+        turns out for every player total, so a batch of turn chances gives the chances of
+        staying in two products. Summing the turns by final total first keeps the second
+        product a few rows long instead of one row per turn.
+
+        Inputs:
+            self is the HintEngine.
+
+        Returns (tuple): (endings, outcomes) where endings is one (K, finals) array of 0 and 1
+            per upcard value and outcomes is a (finals, (bustLimit + 1) * 3) array.
+        '''
+        finals = self.__limit - self.__threshold + 2
+        outcomes = np.zeros((finals, self.__limit + 1, 3))
+        outcomes[-1, :, 0] = 1.0
+        for index in range(finals - 1):
+            for total in range(self.__limit + 1):
+                winner = self.__rules.compare(total, self.__threshold + index)
+                outcomes[index, total, ['player', 'tie', 'dealer'].index(winner)] = 1.0
+        endings = [np.eye(finals)[sequence[3]] for sequence in self.__sequences]
+        return endings, outcomes.reshape(finals, -1)
+
+
+    def __stayChances(self, compositions, upValue):
+        '''
+        Finds the (win, tie, lose) chances of staying on every total for a batch of compositions.
+
+        Inputs:
+            self is the HintEngine.
+            compositions (ndarray): A (B, 10) array of cards left of each value.
+            upValue (int): Value of the dealer's upcard.
+
+        Returns (list): For each composition, a flat tuple of win, tie and lose for each player total.
+        '''
+        # falling factorial factors of each count, then of the number of cards left (divided by)
+        steps = np.arange(self.__depth)
+        factors = self.__logs[np.maximum(compositions[:, :, None] - steps, 0)].reshape(len(compositions), -1)
+        left = -self.__logs[np.maximum(compositions.sum(axis=1)[:, None] - steps, 0)]
+        logs = np.concatenate([factors, left], axis=1)
+        weights = np.exp(logs @ self.__features[upValue - 1] + self.__orderLogs[upValue - 1])
+        chances = (weights @ self.__endings[upValue - 1]) @ self.__outcomes
+        # flat tuples of floats are left alone by the garbage collector, keeping large caches cheap
+        return [tuple(row) for row in chances.tolist()]
+
+
+    def __states(self, counts, total, deadline):
+        '''
+        Lists every hand the player can reach by hitting without going bust or reaching the
+        bust limit, nearest first.
+
+        Inputs:
+            self is the HintEngine.
+            counts (list): Unseen cards of each value.
+            total (int): The player's hand total.
+            deadline (float): perf_counter time to give up at.
+
+        Returns (dict): (cards left of each value, hand total) for each composition key, or None
+            if out of time.
+        '''
+        key = sum(count * digit for count, digit in zip(counts, self.__digits))
+        states = {key: (tuple(counts), total)}
+        level = [key]
+        while level:
+            if time.perf_counter() > deadline:
+                return None
+            following = []
+            for key in level:
+                left, hand = states[key]
+                for value in range(1, 11):
+                    if left[value - 1] and hand + value < self.__limit:
+                        after = key - self.__digits[value - 1]
+                        if after not in states:
+                            reduced = list(left)
+                            reduced[value - 1] -= 1
+                            states[after] = (tuple(reduced), hand + value)
+                            following.append(after)
+            level = following
+        return states
+
+
+    def __fill(self, compositions, upValue, deadline):
+        '''
+        Works out the chances of staying for any of the compositions not yet cached, a batch
+        at a time, stopping before a batch that would not finish by the deadline.
+
+        Inputs:
+            self is the HintEngine.
+            compositions (list): (key, cards left of each value) pairs, most needed first.
+            upValue (int): Value of the dealer's upcard.
+            deadline (float): perf_counter time to finish by.
+
+        Returns (bool): True if every composition is cached.
+        '''
+        missing = [pair for pair in compositions if (pair[0], upValue) not in self.__stayCache]
+        overhead = self.__batchTime[upValue - 1]
+        start = 0
+        while start < len(missing):
+            now = time.perf_counter()
+            each = self.__compositionTime[upValue - 1]
+            # a batch can take twice as long as usual on a busy machine, so only start one that
+            # would finish in time even then
+            size = min(BATCH, int(((deadline - now) / 2 - overhead) / each), len(missing) - start)
+            if size <= 0:
+                return False
+            batch = missing[start:start + size]
+            chances = self.__stayChances(np.array([pair[1] for pair in batch]), upValue)
+            for pair, table in zip(batch, chances):
+                self.__stayCache[(pair[0], upValue)] = table
+            taken = max(time.perf_counter() - now - overhead, 0.0) / size
+            self.__compositionTime[upValue - 1] = (each + taken) / 2
+            start += size
+        return True
+
+
+    def __best(self, counts, key, total, upValue):
+        '''
+        Returns the (win, tie, lose) chances of the better of hitting and staying from a hand,
+        and the chances of hitting. Needs the dealer results of every reachable composition.
+
+        Inputs:
+            self is the HintEngine.
+            counts (list): Unseen cards of each value; changed while working but put back.
+            key (int): Composition key of counts.
+            total (int): The player's hand total.
+            upValue (int): Value of the dealer's upcard.
+
+        Returns (tuple): (best chances, hit chances).
+        '''
+        state = (key, total, upValue)
+        cached = self.__bestCache.get(state)
+        if cached is not None:
+            return cached
+        left = sum(counts)
+        win = tie = lose = 0.0
+        for value in range(1, 11):
+            count = counts[value - 1]
+            if not count:
+                continue
+            chance = count / left
+            if total + value > self.__limit:
+                lose += chance
+            elif total + value == self.__limit:
+                win += chance
+            else:
+                counts[value - 1] = count - 1
+                after = self.__best(counts, key - self.__digits[value - 1], total + value, upValue)[0]
+                counts[value - 1] = count
+                win += chance * after[0]
+                tie += chance * after[1]
+                lose += chance * after[2]
+        hit = (win, tie, lose)
+        stay = self.__stayCache[(key, upValue)][3 * total:3 * total + 3]
+        best = hit if hit[0] - hit[2] > stay[0] - stay[2] else stay
+        self.__bestCache[state] = (best, hit)
+        return best, hit
+
+
+    def hint(self, playerValues, upValue):
+        '''
+        Finds the (win, tie, lose) chances of staying and of hitting for the hand. The chances
+        are exact for the unseen cards when they can be worked out within the time budget,
+        otherwise the infinite-deck chances are given for that choice.
+
+        Inputs:
+            self is the HintEngine.
+            playerValues (list): Values of the cards in the player's hand.
+            upValue (int): Value of the dealer's upcard.
+
+        Returns (Hint): The chances of each choice, whether each is exact and the seconds taken.
+        '''
+        # a full garbage collection walks the caches and can take several milliseconds, which
+        # would go over the budget, so collections wait until the hint has been worked out
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            return self.__hint(playerValues, upValue)
+        finally:
+            if collecting:
+                gc.enable()
+
+
+    def __hint(self, playerValues, upValue):
+        '''
+        Works out a hint for hint, with garbage collection held off.
+
+        Inputs:
+            self is the HintEngine.
+            playerValues (list): Values of the cards in the player's hand.
+            upValue (int): Value of the dealer's upcard.
+
+        Returns (Hint): The chances of each choice, whether each is exact and the seconds taken.
+        '''
+        start = time.perf_counter()
+        # leave a tenth of the budget to put the hint together
+        deadline = start + 0.9 * self.__budget
+        if len(self.__stayCache) + len(self.__bestCache) > self.__maxCache:
+            self.__stayCache = {}
+            self.__bestCache = {}
+        counts = list(FULL_COUNTS)
+        for value in list(playerValues) + [upValue]:
+            counts[value - 1] -= 1
+        total = sum(playerValues)
+        stay_approx, hit_approx = self.__approximate
+        stay = tuple(float(chance) for chance in stay_approx[upValue - 1, min(total, self.__limit)])
+        hit = tuple(float(chance) for chance in hit_approx[upValue - 1, min(total, self.__limit)])
+        stay_exact = hit_exact = False
+
+        # a deck repopulated during the round can show more cards of a value than one deck holds
+        if min(counts) < 0:
+            return Hint(stay, hit, (False, False), time.perf_counter() - start)
+        key = sum(count * digit for count, digit in zip(counts, self.__digits))
+        if self.__fill([(key, counts)], upValue, deadline):
+            stay = self.__stayCache[(key, upValue)][3 * total:3 * total + 3]
+            stay_exact = True
+            states = self.__states(counts, total, deadline)
+            if states is not None and self.__fill([(state, states[state][0]) for state in states], upValue, deadline):
+                # after a HIT most of these hands were worked out for the previous prompt
+                needed = sum((state, hand, upValue) not in self.__bestCache for state, (left, hand) in states.items())
+                now = time.perf_counter()
+                if now + needed * self.__stateTime <= deadline:
+                    hit = self.__best(counts, key, total, upValue)[1]
+                    hit_exact = True
+                    if needed:
+                        self.__stateTime = (self.__stateTime + (time.perf_counter() - now) / needed) / 2
+        return Hint(stay, hit, (stay_exact, hit_exact), time.perf_counter() - start)
+
+
+
+def hintText(hint):
+    '''
+    Returns a line showing a hint, marking chances that are infinite-deck estimates with ~.
+
+    Inputs:
+        hint (Hint): The hint.
+    '''
+    parts = []
+    for name, chances, exact in (('STAY', hint.stay, hint.exact[0]), ('HIT', hint.hit, hint.exact[1])):
+        parts.append('%s%s win %.1f%% tie %.1f%% lose %.1f%%' % (name, '' if exact else ' ~',
+                                                                 *(100 * chance for chance in chances)))
+    return 'Hint: ' + ' | '.join(parts)
+
+
+
+def win_hints_tests():
+    '''
+    Tests for win-probability hints.
+
+    Inputs: N/A
+
+    Returns: None
+    '''
+    import functools
+    import random
+
+    rules = Rules()
+
+    # chances worked out card by card, without replacement
+    @functools.lru_cache(maxsize=None)
+    def dealer(counts, total):
+        if total >= 17:
+            return {min(total, 22): 1.0}
+        finals = {}
+        left = sum(counts)
+        for value in range(1, 11):
+            if counts[value - 1]:
+                reduced = counts[:value - 1] + (counts[value - 1] - 1, ) + counts[value:]
+                for final, chance in dealer(reduced, total + value).items():
+                    finals[final] = finals.get(final, 0.0) + chance * counts[value - 1] / left
+        return finals
+
+    def stayChances(counts, total, up):
+        finals = dealer(counts, up)
+        win = sum(chance for final, chance in finals.items() if final == 22 or final < total)
+        tie = finals.get(total, 0.0)
+        return (win, tie, 1 - win - tie)
+
+    @functools.lru_cache(maxsize=None)
+    def best(counts, total, up):
+        stay = stayChances(counts, total, up)
+        hit = [0.0, 0.0, 0.0]
+        left = sum(counts)
+        for value in range(1, 11):
+            if counts[value - 1]:
+                chance = counts[value - 1] / left
+                if total + value > 21:
+                    hit[2] += chance
+                elif total + value == 21:
+                    hit[0] += chance
+                else:
+                    reduced = counts[:value - 1] + (counts[value - 1] - 1, ) + counts[value:]
+                    after = best(reduced, total + value, up)[0]
+                    for i in range(3):
+                        hit[i] += chance * after[i]
+        return (tuple(hit) if hit[0] - hit[2] > stay[0] - stay[2] else stay), tuple(hit)
+
+    engine = HintEngine(rules, budget=10.0)
+    for hand, up in (([10, 6], 10), ([9, 5], 6), ([10, 2], 1), ([7, 7, 3], 9), ([5, 4, 3, 2], 2)):
+        counts = list(FULL_COUNTS)
+        for value in hand + [up]:
+            counts[value - 1] -= 1
+        hint = engine.hint(hand, up)
+        expected_hit = best(tuple(counts), sum(hand), up)[1]
+        is_pass = (hint.exact == (True, True) and np.allclose(hint.stay, stayChances(tuple(counts), sum(hand), up))
+                   and np.allclose(hint.hit, expected_hit) and abs(sum(hint.hit) - 1) < 1e-9)
+        assert is_pass == True, "fail the test"
+
+    # exact chances are near the infinite-deck ones
+    is_pass = (abs(hint.stay[0] - engine._HintEngine__approximate[0][1, 14, 0]) < 0.05)
+    assert is_pass == True, "fail the test"
+
+    # random prompts stay within 5 ms, and a HIT makes the next prompt cheaper
+    engine = HintEngine(rules)
+    rng = random.Random(47)
+    times = []
+    exact = [0, 0]
+    cold = warm = 0.0
+    for i in range(300):
+        deck = [min(rank, 10) for rank in range(1, 14) for suit in range(4)]
+        rng.shuffle(deck)
+        hand, up = deck[:2], deck[2]
+        while True:
+            hint = engine.hint(hand, up)
+            times.append(hint.elapsed)
+            exact[0] += hint.exact[0]
+            exact[1] += hint.exact[1]
+            if len(hand) == 2:
+                cold += hint.elapsed
+            else:
+                warm += hint.elapsed
+            if sum(hand) >= 17 or len(hand) > 5:
+                break
+            hand = hand + [deck[len(hand) + 1]]
+            if sum(hand) >= 21:
+                break
+    times.sort()
+    print('Hints: median %.2f ms, 99th percentile %.2f ms, slowest %.2f ms; exact STAY %d/%d, exact HIT %d/%d'
+          % (1000 * times[len(times) // 2], 1000 * times[len(times) * 99 // 100], 1000 * times[-1],
+             exact[0], len(times), exact[1], len(times)))
+    is_pass = (times[len(times) * 99 // 100] < 0.005 and exact[0] == len(times) and exact[1] > len(times) // 2)
+    assert is_pass == True, "fail the test"
+
+    # hints shown in player_turn do not change the game
+    import assignment2
+    import contextlib
+    import io
+    from playingCards import Deck, RANKS, SUITS
+    from simple21 import Table
+
+    codes = [rank + suit for rank in RANKS for suit in SUITS]
+    shown = io.StringIO()
+    table = Table(deck=Deck(codes=codes))
+    table.dealHands()
+    answers = iter(['h', 'h', 's'])
+    with contextlib.redirect_stdout(shown):
+        result = assignment2.player_turn(table, lambda prompt: next(answers), HintEngine(rules))
+    is_pass = (result == (False, False) and shown.getvalue().count('Hint: STAY') == 3
+               and table.getPlayer().getHandValue() == 1 + 1 + 2 + 2)
+    assert is_pass == True, "fail the test"
+
+
+if __name__ == "__main__":
+    win_hints_tests()